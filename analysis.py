@@ -0,0 +1,48 @@
+"""
+Single-pass text analysis with memoized stemming.
+
+Produces exactly the output of the NLTK pipeline in search_engine
+(lowercase, strip everything but ASCII letters and digits, word_tokenize,
+drop stop words and tokens of two characters or less, Porter-stem) without
+running it. Once punctuation is gone, word_tokenize only splits on
+whitespace and breaks up a few fixed contractions, so tokens are found
+with one regex and those contractions are split from a table. Each
+distinct token is analyzed once: stop word check, length check and stem
+are memoized together in a bounded LRU cache.
+"""
+
+import re
+from functools import lru_cache
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Splits word_tokenize still makes in text without punctuation
+CONTRACTIONS = {
+    'cannot': ('can', 'not'),
+    'gimme': ('gim', 'me'),
+    'gonna': ('gon', 'na'),
+    'gotta': ('got', 'ta'),
+    'lemme': ('lem', 'me'),
+    'wanna': ('wan', 'na'),
+}
+
+
+class FastAnalyzer:
+    """Regex tokenizer with a memoized stop word filter and stemmer"""
+
+    def __init__(self, stemmer, stop_words, cache_size=200000):
+        self.stemmer = stemmer
+        self.stop_words = frozenset(stop_words)
+        self.analyze_token = lru_cache(maxsize=cache_size)(self._analyze_token)
+
+    def _analyze_token(self, token):
+        """Indexed form of one token: its stem, '' if dropped"""
+        pieces = CONTRACTIONS.get(token, (token,))
+        return ' '.join(self.stemmer.stem(piece) for piece in pieces
+                        if piece not in self.stop_words and len(piece) > 2)
+
+    def __call__(self, text):
+        return ' '.join(filter(None, map(self.analyze_token, TOKEN_PATTERN.findall(text.lower()))))
+
+    def cache_info(self):
+        return self.analyze_token.cache_info()
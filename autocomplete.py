@@ -0,0 +1,97 @@
+"""
+Prefix completion over a sorted array of phrases.
+
+Completions are kept as one sorted list of lowercase keys with a parallel
+list of weights, so every prefix corresponds to a contiguous range found
+with two binary searches. Short prefixes match large ranges, so the best
+completions of every prefix matching more than ``scan_limit`` keys are
+computed once at build time; any other prefix is answered by scanning at
+most ``scan_limit`` entries.
+"""
+
+import heapq
+from bisect import bisect_left
+
+# Sorts after every character, so prefix + MAX_CHAR bounds a prefix range
+MAX_CHAR = chr(0x10FFFF)
+
+
+class CompletionIndex:
+    """Frequency-weighted top-k completion of prefixes"""
+
+    def __init__(self, entries, top_k=10, scan_limit=64):
+        """entries maps display text to weight; keys are matched case-insensitively"""
+        best = {}
+        for text, weight in entries.items():
+            key = ' '.join(text.lower().split())
+            if key and (key not in best or weight > best[key][1]):
+                best[key] = (text, weight)
+        self.keys = sorted(best)
+        self.texts = [best[key][0] for key in self.keys]
+        self.weights = [best[key][1] for key in self.keys]
+        self.top_k = top_k
+        self.scan_limit = scan_limit
+        self.top = {}
+        self._build_top(0, len(self.keys), 0)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _best(self, lo, hi):
+        ranked = heapq.nsmallest(self.top_k, range(lo, hi), key=lambda i: (-self.weights[i], self.keys[i]))
+        return [self.texts[i] for i in ranked]
+
+    def _build_top(self, lo, hi, depth):
+        # keys[lo:hi] are exactly the keys starting with keys[lo][:depth]
+        if hi - lo <= self.scan_limit:
+            return
+        prefix = self.keys[lo][:depth]
+        self.top[prefix] = self._best(lo, hi)
+        i = lo
+        while i < hi and len(self.keys[i]) == depth:
+            i += 1
+        while i < hi:
+            child = prefix + self.keys[i][depth]
+            j = bisect_left(self.keys, child + MAX_CHAR, i, hi)
+            self._build_top(i, j, depth + 1)
+            i = j
+
+    def complete(self, prefix, limit=10):
+        """Return up to limit completions of prefix, highest weight first"""
+        prefix = ' '.join(prefix.lower().split()) + (' ' if prefix[-1:].isspace() else '')
+        top = self.top.get(prefix)
+        if top is not None:
+            return top[:limit]
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + MAX_CHAR, lo)
+        return self._best(lo, hi)[:limit]
+
+
+class QueryCompleter:
+    """Completes the word being typed and whole document titles"""
+
+    def __init__(self, word_weights, titles, top_k=10):
+        self.words = CompletionIndex(word_weights, top_k=top_k)
+        title_counts = {}
+        for title in titles:
+            if title:
+                title_counts[title] = title_counts.get(title, 0) + 1
+        self.titles = CompletionIndex(title_counts, top_k=top_k)
+
+    def complete(self, prefix, limit=10):
+        """Return up to limit completions: query words first, then titles"""
+        words = prefix.lower().split()
+        if not words:
+            return []
+        completions = []
+        if not prefix[-1].isspace():
+            head = ' '.join(words[:-1])
+            completions = [f"{head} {word}" if head else word
+                           for word in self.words.complete(words[-1], limit)]
+        seen = set(completions)
+        for title in self.titles.complete(prefix, limit):
+            if len(completions) >= limit:
+                break
+            if title.lower() not in seen:
+                completions.append(title)
+        return completions[:limit]
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for PySearch
+
+Each subcommand times one part of the engine against an existing
+database and prints a small comparison table.
+"""
+
+import argparse
+import itertools
+import os
+import tempfile
+import time
+
+import requests
+
+from crawler import HEADERS, PARSERS, WebCrawler
+from search_engine import ANALYZERS, RANKINGS, RETRIEVAL_STRATEGIES, SearchEngine, make_analyzer
+
+# HTML files shipped with the repository, used when no pages are given
+SAMPLE_PAGES = ['demo.html', 'index.html', 'docs/index.html', 'templates/search.html']
+
+DEFAULT_QUERIES = [
+    "python",
+    "python programming",
+    "web development",
+    "machine learning",
+    "data science",
+    "flask framework",
+]
+
+def time_call(func, repeat):
+    """Run func repeat times and return the mean time in milliseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def benchmark_retrieval(db_path, queries, max_results=10, repeat=20, ranking='tfidf'):
+    """Compare retrieval strategies on the same queries"""
+    engine = SearchEngine(db_path)
+    if engine.inverted_index is None:
+        print("No index available. Run the crawler first.")
+        return
+
+    print(f"\n{'query':<25}" + ''.join(f"{name:>14}" for name in RETRIEVAL_STRATEGIES))
+    for query in queries:
+        index, query_vector = engine.vectorize_queries([engine.preprocess_text(query)], ranking)
+        timings = [
+            time_call(lambda: engine.retrieve(query_vector, max_results * 2, strategy, index), repeat)
+            for strategy in RETRIEVAL_STRATEGIES
+        ]
+        print(f"{query[:24]:<25}" + ''.join(f"{ms:>12.3f}ms" for ms in timings))
+
+def load_pages(sources):
+    """Read HTML from local files or URLs"""
+    pages = []
+    for source in sources:
+        if source.startswith(('http://', 'https://')):
+            response = requests.get(source, headers=HEADERS, timeout=10)
+            response.raise_for_status()
+            pages.append((source, response.content))
+        else:
+            with open(source, 'rb') as f:
+                pages.append(('file://' + os.path.abspath(source), f.read()))
+    return pages
+
+def benchmark_parsers(sources, repeat=20):
+    """Time WebCrawler.parse_page with each available parser"""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    sources = sources or [os.path.join(base_dir, page) for page in SAMPLE_PAGES]
+    pages = load_pages(sources)
+    total_kb = sum(len(html) for _, html in pages) / 1024
+    print(f"Parsing {len(pages)} pages ({total_kb:.0f} KB)")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"\n{'parser':<14}{'ms/page':>10}{'text chars':>12}{'links':>8}")
+        for parser in PARSERS:
+            crawler = WebCrawler(os.path.join(tmp_dir, 'bench.db'), parser=parser)
+            if crawler.parser != parser:
+                continue
+            parsed = [crawler.parse_page(html, url) for url, html in pages]
+            ms = time_call(lambda: [crawler.parse_page(html, url) for url, html in pages], repeat) / len(pages)
+            text_chars = sum(len(content) for _, content, _, _ in parsed)
+            links = sum(len(page_links) for _, _, _, page_links in parsed)
+            print(f"{parser:<14}{ms:>10.2f}{text_chars:>12}{links:>8}")
+
+def benchmark_storage(num_pages=2000, batch_size=100):
+    """Compare per-page commits with the batched PageWriter"""
+    content = "Sample crawled page content about python programming. " * 100
+    pages = [(f"http://bench.local/{i}", f"Page {i}", content, []) for i in range(num_pages)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        crawler = WebCrawler(os.path.join(tmp_dir, 'single.db'), batch_size=1)
+        start = time.perf_counter()
+        for page in pages:
+            crawler.store_page(*page)
+        single_rate = num_pages / (time.perf_counter() - start)
+
+        crawler = WebCrawler(os.path.join(tmp_dir, 'batched.db'), batch_size=batch_size)
+        start = time.perf_counter()
+        crawler.start_writer()
+        for page in pages:
+            crawler.store_page(*page)
+        crawler.stop_writer()
+        batched_rate = num_pages / (time.perf_counter() - start)
+
+    print(f"\n{'writer':<24}{'rows/sec':>10}")
+    print(f"{'per-page commit':<24}{single_rate:>10.0f}")
+    print(f"{f'batched ({batch_size}/txn)':<24}{batched_rate:>10.0f}")
+
+def benchmark_preprocessing(db_path, worker_counts, repeat=1):
+    """Time document preprocessing for index builds with different worker counts"""
+    engine = SearchEngine(db_path)
+    if not engine.documents:
+        print("No documents available. Run the crawler first.")
+        return
+    
+    total_mb = sum(len(doc) for doc in engine.documents) / 1024 / 1024
+    print(f"Preprocessing {len(engine.documents)} documents ({total_mb:.1f} MB), {os.cpu_count()} cores")
+    print(f"\n{'workers':<10}{'seconds':>10}{'docs/sec':>12}{'speedup':>10}")
+    baseline = None
+    for workers in worker_counts:
+        seconds = time_call(lambda: engine.preprocess_documents(engine.documents, workers), repeat) / 1000
+        baseline = baseline or seconds
+        print(f"{workers:<10}{seconds:>10.2f}{len(engine.documents) / seconds:>12.0f}{baseline / seconds:>9.2f}x")
+
+def benchmark_analyzers(db_path, max_docs=1000):
+    """Check that the analyzers agree and compare their throughput"""
+    engine = SearchEngine(db_path)
+    docs = list(itertools.islice(engine.documents, max_docs))
+    if not docs:
+        print("No documents available. Run the crawler first.")
+        return
+    
+    total_mb = sum(len(doc) for doc in docs) / 1024 / 1024
+    print(f"Analyzing {len(docs)} documents ({total_mb:.1f} MB)")
+    print(f"\n{'analyzer':<10}{'seconds':>10}{'MB/sec':>10}{'speedup':>10}")
+    outputs = {}
+    baseline = None
+    for name in reversed(ANALYZERS):
+        analyze = make_analyzer(name, engine.stemmer, engine.stop_words)
+        start = time.perf_counter()
+        outputs[name] = [analyze(doc) for doc in docs]
+        seconds = time.perf_counter() - start
+        baseline = baseline or seconds
+        print(f"{name:<10}{seconds:>10.2f}{total_mb / seconds:>10.1f}{baseline / seconds:>9.1f}x")
+    
+    mismatches = sum(a != b for a, b in zip(*outputs.values()))
+    print(f"\nDocuments with different output: {mismatches}")
+
+def main():
+    parser = argparse.ArgumentParser(description='PySearch benchmarks')
+    parser.add_argument('--db', default='database.db', help='Database to benchmark against (default: database.db)')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per measurement (default: 20)')
+    subparsers = parser.add_subparsers(dest='command', help='Available benchmarks')
+
+    retrieval_parser = subparsers.add_parser('retrieval', help='Compare retrieval strategies')
+    retrieval_parser.add_argument('queries', nargs='*', help='Queries to run (default: built-in sample)')
+    retrieval_parser.add_argument('--max-results', type=int, default=10,
+                                  help='Results per query (default: 10)')
+    retrieval_parser.add_argument('--ranking', choices=RANKINGS, default='tfidf',
+                                  help='Ranking whose index is searched (default: tfidf)')
+
+    parsers_parser = subparsers.add_parser('parsers', help='Compare HTML parsers used by the crawler')
+    parsers_parser.add_argument('pages', nargs='*', help='HTML files or URLs (default: sample pages in the repo)')
+
+    storage_parser = subparsers.add_parser('storage', help='Compare per-page and batched page writes')
+    storage_parser.add_argument('--pages', type=int, default=2000, help='Pages to write (default: 2000)')
+    storage_parser.add_argument('--batch-size', type=int, default=100, help='Rows per transaction (default: 100)')
+
+    preprocess_parser = subparsers.add_parser('preprocess', help='Compare preprocessing with different worker counts')
+    preprocess_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4],
+                                   help='Worker process counts to try (default: 1 2 4)')
+
+    analyzers_parser = subparsers.add_parser('analyzers', help='Compare the fast and NLTK text analyzers')
+    analyzers_parser.add_argument('--max-docs', type=int, default=1000,
+                                  help='Documents to analyze (default: 1000)')
+
+    args = parser.parse_args()
+
+    if args.command == 'retrieval':
+        benchmark_retrieval(args.db, args.queries or DEFAULT_QUERIES, args.max_results, args.repeat, args.ranking)
+    elif args.command == 'parsers':
+        benchmark_parsers(args.pages, args.repeat)
+    elif args.command == 'storage':
+        benchmark_storage(args.pages, args.batch_size)
+    elif args.command == 'preprocess':
+        # A full pass over the corpus per worker count is slow enough to time once
+        benchmark_preprocessing(args.db, args.workers)
+    elif args.command == 'analyzers':
+        benchmark_analyzers(args.db, args.max_docs)
+    else:
+        parser.print_help()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+BM25F ranking over the title and content fields.
+
+Term frequencies are counted separately in each field, with the analyzer
+and vocabulary of the TF-IDF index, normalized by the field's length
+relative to its average, weighted, summed, and only then saturated:
+
+    tf(d, t)    = sum over fields f of w_f * tf_f(d, t) / (1 - b_f + b_f * len_f(d) / avg_len_f)
+    score(d, q) = sum over t in q of idf(t) * tf(d, t) / (k1 + tf(d, t))
+
+A document's contribution for a term does not depend on the query, so
+these impacts are computed once into a documents x terms matrix and stored
+in an InvertedIndex. A query is then scored by the same posting-list code
+as TF-IDF (MaxScore included), with the counts of its terms as weights and
+no normalization of either side. The impacts are built with the TF-IDF
+index, from the same content term counts, and saved with it together with
+the statistics (``state()``) needed to weight documents added later.
+"""
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+
+K1 = 1.2
+
+# Per-field weight and length normalization strength
+FIELDS = {
+    'title': {'weight': 3.0, 'b': 0.5},
+    'content': {'weight': 1.0, 'b': 0.75},
+}
+
+COUNT_CHUNK_SIZE = 1000
+
+
+class BM25FScorer:
+    """Turns preprocessed titles and contents into BM25F impact rows"""
+
+    def __init__(self, vocabulary, k1=K1, fields=None):
+        self.k1 = k1
+        self.fields = fields or FIELDS
+        # Must split text into terms exactly like the TF-IDF vectorizer
+        self.count_vectorizer = CountVectorizer(vocabulary=vocabulary, lowercase=True,
+                                                stop_words='english', ngram_range=(1, 2))
+        self.num_docs = 0
+        self.avg_lengths = {}
+        self.idf = None
+
+    def count(self, texts):
+        """Term count matrix and lengths in terms, read from texts in chunks"""
+        parts = []
+        lengths = []
+        chunk = []
+        for text in texts:
+            chunk.append(text)
+            lengths.append(len(text.split()))
+            if len(chunk) >= COUNT_CHUNK_SIZE:
+                parts.append(self.count_vectorizer.transform(chunk))
+                chunk = []
+        if chunk or not parts:
+            parts.append(self.count_vectorizer.transform(chunk))
+        return sparse.vstack(parts, format='csr'), np.array(lengths, dtype=np.float64)
+
+    @classmethod
+    def from_state(cls, vocabulary, state, idf):
+        """Scorer with the statistics saved from an earlier fit"""
+        scorer = cls(vocabulary, state['k1'], state['fields'])
+        scorer.num_docs = state['num_docs']
+        scorer.avg_lengths = state['avg_lengths']
+        scorer.idf = idf
+        return scorer
+
+    def state(self):
+        """Statistics of the last fit other than idf, as JSON-compatible values"""
+        return {
+            'k1': self.k1,
+            'fields': self.fields,
+            'num_docs': self.num_docs,
+            'avg_lengths': {field: float(length) for field, length in self.avg_lengths.items()},
+        }
+
+    def fit_transform(self, titles, contents):
+        """Compute collection statistics and return the impact matrix of every document"""
+        return self.fit_counts({'title': self.count(titles), 'content': self.count(contents)})
+
+    def fit_counts(self, counts):
+        """fit_transform from each field's (count matrix, lengths), as returned by count()"""
+        self.num_docs = counts['content'][0].shape[0]
+        self.avg_lengths = {field: max(lengths.mean(), 1.0) if len(lengths) else 1.0
+                            for field, (_, lengths) in counts.items()}
+
+        # A document contains a term if any of its fields does
+        present = (counts['title'][0] + counts['content'][0]).tocsc()
+        doc_freqs = np.diff(present.indptr)
+        self.idf = np.log(1.0 + (self.num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5))
+        return self.impacts(counts)
+
+    def transform(self, title, content):
+        """Impact row of one new document, using the statistics of the last fit"""
+        counts = {'title': self.count([title]), 'content': self.count([content])}
+        return self.impacts(counts)
+
+    def impacts(self, counts):
+        combined = None
+        for field, (matrix, lengths) in counts.items():
+            weight = self.fields[field]['weight']
+            b = self.fields[field]['b']
+            norms = 1.0 - b + b * lengths / self.avg_lengths[field]
+            scaled = sparse.diags(weight / norms) @ matrix
+            combined = scaled if combined is None else combined + scaled
+        combined = sparse.csr_matrix(combined, dtype=np.float64)
+        combined.data = self.idf[combined.indices] * combined.data / (self.k1 + combined.data)
+        return combined
+
+    def query_weights(self, processed_queries):
+        """Sparse queries x terms matrix of query term counts"""
+        return self.count_vectorizer.transform(processed_queries)
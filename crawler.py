@@ -1,20 +1,70 @@
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, FeatureNotFound
 from urllib.parse import urljoin, urlparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import heapq
 import sqlite3
 import time
 import re
+from frontier import Frontier, VisitedSet, normalize_url
+from storage import PageWriter, write_links
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+# Returned by fetch_page when a conditional request finds the page unchanged
+NOT_MODIFIED = object()
+
+# BeautifulSoup tree builders; lxml is the faster one (see `benchmark.py parsers`)
+PARSERS = ('lxml', 'html.parser')
 
 class WebCrawler:
-    def __init__(self, db_path='database.db'):
+    def __init__(self, db_path='database.db', indexer=None, parser='lxml', batch_size=100,
+                 max_memory_urls=1000000, resume=False, checkpoint_interval=5.0):
         self.db_path = db_path
-        self.visited_urls = set()
+        # Optional object with add_document(url, title, content), e.g. a
+        # SearchEngine, that is told about every stored page
+        self.indexer = indexer
+        self.parser = self.select_parser(parser)
+        # During crawl() pages are written in batches of this size by a
+        # background PageWriter; 1 writes every page in its own transaction
+        self.batch_size = batch_size
+        self.writer = None
         self.setup_database()
+        # Every URL ever queued, kept as fingerprints; beyond max_memory_urls
+        # they spill to the database behind a Bloom filter
+        self.visited_urls = VisitedSet(max_memory_urls, spill_path=db_path)
+        # The crawl queue is saved to the database every checkpoint_interval
+        # seconds; resume=True continues the queue left by an earlier crawl,
+        # otherwise the saved queue is cleared when the first crawl starts
+        self.resume = resume
+        self.frontier = Frontier(max(1, max_memory_urls // 10), spill_path=db_path,
+                                 seen=self.visited_urls, resume=resume)
+        self.checkpoint_interval = checkpoint_interval
+        self.last_checkpoint = time.monotonic()
+    
+    @staticmethod
+    def select_parser(parser):
+        """Return the parser to use, falling back to html.parser if it is unavailable"""
+        if parser not in PARSERS:
+            raise ValueError(f"Unknown parser: {parser}")
+        try:
+            BeautifulSoup('', parser)
+            return parser
+        except FeatureNotFound:
+            print(f"Parser {parser} not available, using html.parser")
+            return 'html.parser'
     
     def setup_database(self):
         """Initialize the database schema"""
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
+        # WAL lets the page writer and the frontier write while readers
+        # run; the mode is stored in the file, so set it before either opens
+        cursor.execute('PRAGMA journal_mode=WAL')
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS pages (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -25,64 +75,161 @@ class WebCrawler:
                 crawl_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        # HTTP cache validators, used to skip unchanged pages on refresh()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS page_validators (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT
+            )
+        ''')
+        # Outlinks of stored pages, for PageRank
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS links (
+                source TEXT,
+                target TEXT,
+                PRIMARY KEY (source, target)
+            ) WITHOUT ROWID
+        ''')
         conn.commit()
         conn.close()
     
-    def get_page_content(self, url):
-        """Fetch and parse a web page"""
+    def fetch_page(self, url, session=None, validators=None):
+        """Fetch a web page once and return its title, text, keywords, outlinks and validators
+        
+        `validators` is an (etag, last_modified) pair from an earlier fetch;
+        if given and the server reports the page unchanged, NOT_MODIFIED is
+        returned instead.
+        """
+        headers = dict(HEADERS)
+        etag, last_modified = validators or (None, None)
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, headers=headers, timeout=10)
+            if session is not None:
+                response = session.get(url, headers=headers, timeout=10)
+            else:
+                response = requests.get(url, headers=headers, timeout=10)
+            if response.status_code == 304 and validators:
+                return NOT_MODIFIED
             response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Extract title
-            title = soup.find('title')
-            title_text = title.get_text().strip() if title else ''
-            
-            # Remove script and style elements
-            for script in soup(["script", "style"]):
-                script.decompose()
-            
-            # Extract text content
-            content = soup.get_text()
-            # Clean up whitespace
-            content = re.sub(r'\s+', ' ', content).strip()
-            
-            # Extract keywords from meta tags
-            keywords = []
-            meta_keywords = soup.find('meta', attrs={'name': 'keywords'})
-            if meta_keywords:
-                keywords = [k.strip() for k in meta_keywords.get('content', '').split(',')]
-            
-            return title_text, content, keywords
+            validators = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+            return self.parse_page(response.content, url) + (validators,)
             
         except Exception as e:
             print(f"Error crawling {url}: {e}")
+            return None
+    
+    def get_page_content(self, url):
+        """Fetch and parse a web page"""
+        page = self.fetch_page(url)
+        if page is None:
             return None, None, None
+        title, content, keywords, _, _ = page
+        return title, content, keywords
     
-    def store_page(self, url, title, content, keywords):
-        """Store page data in the database"""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            keywords_str = ', '.join(keywords) if keywords else ''
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO pages (url, title, content, keywords)
-                VALUES (?, ?, ?, ?)
-            ''', (url, title, content, keywords_str))
-            
-            conn.commit()
-            conn.close()
+    def parse_page(self, html, url):
+        """Extract title, text, keywords and outlinks from one HTML document"""
+        soup = BeautifulSoup(html, self.parser)
+        
+        # Extract title
+        title = soup.find('title')
+        title_text = title.get_text().strip() if title else ''
+        
+        links = self.extract_links(soup, url)
+        
+        # Remove script and style elements
+        for script in soup(["script", "style"]):
+            script.decompose()
+        
+        # Extract text content and clean up whitespace
+        content = re.sub(r'\s+', ' ', soup.get_text()).strip()
+        
+        # Extract keywords from meta tags
+        keywords = []
+        meta_keywords = soup.find('meta', attrs={'name': 'keywords'})
+        if meta_keywords:
+            keywords = [k.strip() for k in meta_keywords.get('content', '').split(',')]
+        
+        return title_text, content, keywords, links
+    
+    def store_page(self, url, title, content, keywords, validators=None, links=None):
+        """Store page data, and its outlinks if given, in the database"""
+        keywords_str = ', '.join(keywords) if keywords else ''
+        etag, last_modified = validators or (None, None)
+        if links is not None:
+            links = sorted({normalize_url(link) for link in links} - {url})
+        
+        if self.writer is not None:
+            self.writer.put(url, title, content, keywords_str, etag, last_modified, links)
             print(f"Stored: {url}")
-            
-        except Exception as e:
-            print(f"Error storing {url}: {e}")
+        else:
+            try:
+                conn = sqlite3.connect(self.db_path)
+                cursor = conn.cursor()
+                
+                cursor.execute('''
+                    INSERT OR REPLACE INTO pages (url, title, content, keywords)
+                    VALUES (?, ?, ?, ?)
+                ''', (url, title, content, keywords_str))
+                cursor.execute('''
+                    INSERT OR REPLACE INTO page_validators (url, etag, last_modified)
+                    VALUES (?, ?, ?)
+                ''', (url, etag, last_modified))
+                write_links(conn, [(url, title, content, keywords_str, etag, last_modified, links)])
+                
+                conn.commit()
+                conn.close()
+                print(f"Stored: {url}")
+                
+            except Exception as e:
+                print(f"Error storing {url}: {e}")
+                return
+        
+        if self.indexer is not None:
+            try:
+                self.indexer.add_document(url, title, content)
+            except Exception as e:
+                print(f"Error indexing {url}: {e}")
+    
+    def start_writer(self):
+        """Route store_page through a batching background writer"""
+        if self.batch_size > 1 and self.writer is None:
+            self.writer = PageWriter(self.db_path, batch_size=self.batch_size)
+    
+    def stop_writer(self):
+        """Commit pending pages, stop the writer and report its throughput"""
+        if self.writer is None:
+            return
+        writer, self.writer = self.writer, None
+        writer.close()
+        stats = writer.stats()
+        print(f"Stored {stats['rows']} pages in {stats['batches']} transactions "
+              f"({stats['rows_per_sec']:.0f} rows/sec)")
+    
+    def checkpoint(self, force=False):
+        """Save the crawl queue once checkpoint_interval has passed since the last save"""
+        if not force and not self.checkpoint_due():
+            return
+        # Pages must be committed before their URLs are marked done, so only
+        # URLs finished before the flush are saved as done by this checkpoint
+        finished = self.frontier.take_finished()
+        if self.writer is not None:
+            self.writer.flush()
+        self.frontier.checkpoint(finished)
+        self.last_checkpoint = time.monotonic()
+    
+    def checkpoint_due(self):
+        return time.monotonic() - self.last_checkpoint >= self.checkpoint_interval
+    
+    def start_frontier(self):
+        """Clear the saved crawl state unless this crawler resumes it"""
+        if not self.resume:
+            self.frontier.reset()
+            # Later crawls of this crawler continue its own queue
+            self.resume = True
     
     def extract_links(self, soup, base_url):
         """Extract all links from a page"""
@@ -98,43 +245,294 @@ class WebCrawler:
         return links
     
     def crawl(self, start_urls, max_pages=100, delay=1):
-        """Crawl web pages starting from given URLs"""
-        urls_to_visit = list(start_urls)
+        """Crawl web pages starting from given URLs and any saved queue"""
+        self.start_frontier()
+        frontier = self.frontier
+        for url in start_urls:
+            frontier.push(url)
         pages_crawled = 0
+        self.start_writer()
         
-        while urls_to_visit and pages_crawled < max_pages:
-            url = urls_to_visit.pop(0)
-            
-            if url in self.visited_urls:
-                continue
-            
-            print(f"Crawling: {url}")
-            self.visited_urls.add(url)
-            
-            title, content, keywords = self.get_page_content(url)
-            
-            if content:
-                self.store_page(url, title, content, keywords)
-                pages_crawled += 1
+        try:
+            while pages_crawled < max_pages:
+                url = frontier.pop()
+                if url is None:
+                    break
                 
-                # Extract links for further crawling
-                try:
-                    response = requests.get(url, timeout=10)
-                    soup = BeautifulSoup(response.content, 'html.parser')
-                    links = self.extract_links(soup, url)
+                # Honour a host delay carried over from a resumed crawl
+                host = urlparse(url).netloc
+                time.sleep(frontier.wait_time(host))
+                
+                print(f"Crawling: {url}")
+                page = self.fetch_page(url)
+                frontier.set_host_time(host, time.time() + delay)
+                
+                if page is not None and page[1]:
+                    title, content, keywords, links, validators = page
+                    self.store_page(url, title, content, keywords, validators, links)
+                    pages_crawled += 1
                     
-                    # Add new links to crawl queue
+                    # Add new links to crawl queue; already seen URLs are dropped
                     for link in links:
-                        if link not in self.visited_urls:
-                            urls_to_visit.append(link)
-                            
-                except Exception as e:
-                    print(f"Error extracting links from {url}: {e}")
-            
-            # Be respectful - add delay between requests
-            time.sleep(delay)
+                        frontier.push(link)
+                
+                frontier.done(url)
+                self.checkpoint()
+                
+                # Be respectful - add delay between requests
+                time.sleep(delay)
+        finally:
+            self.checkpoint(force=True)
+            frontier.close()
+            self.stop_writer()
+        
+        print(f"Crawling completed. Crawled {pages_crawled} pages.")
+    
+    def refresh(self, max_pages=None, delay=1):
+        """Re-fetch stored pages, skipping those the server reports unchanged"""
+        conn = sqlite3.connect(self.db_path)
+        query = '''
+            SELECT p.url, v.etag, v.last_modified FROM pages p
+            LEFT JOIN page_validators v ON v.url = p.url ORDER BY p.id
+        '''
+        if max_pages is not None:
+            query += f" LIMIT {int(max_pages)}"
+        pages = conn.execute(query).fetchall()
+        conn.close()
+        
+        changed = unchanged = failed = 0
+        self.start_writer()
+        try:
+            for url, etag, last_modified in pages:
+                print(f"Refreshing: {url}")
+                page = self.fetch_page(url, validators=(etag, last_modified))
+                if page is NOT_MODIFIED:
+                    unchanged += 1
+                elif page is None or not page[1]:
+                    failed += 1
+                else:
+                    title, content, keywords, links, validators = page
+                    self.store_page(url, title, content, keywords, validators, links)
+                    changed += 1
+                time.sleep(delay)
+        finally:
+            self.stop_writer()
+        
+        print(f"Refresh completed. {changed} changed, {unchanged} unchanged, {failed} failed.")
+        return changed, unchanged, failed
+    
+    def crawl_async(self, start_urls, max_pages=100, delay=1, concurrency=8):
+        """Crawl with up to `concurrency` requests in flight across hosts
+        
+        `delay` is enforced per host rather than globally, so many hosts are
+        fetched in parallel while each one still sees at most one request
+        every `delay` seconds.
+        """
+        self.start_writer()
+        try:
+            return asyncio.run(self._crawl_async(start_urls, max_pages, delay, concurrency))
+        finally:
+            self.stop_writer()
+    
+    async def _crawl_async(self, start_urls, max_pages, delay, concurrency):
+        self.start_frontier()
+        frontier = self.frontier
+        session = self.make_session(concurrency)
+        pages_crawled = 0
+        
+        async def worker(scheduler, executor):
+            nonlocal pages_crawled
+            while pages_crawled < max_pages:
+                url = await scheduler.get()
+                if url is None:
+                    return
+                try:
+                    if pages_crawled >= max_pages:
+                        return
+                    
+                    page = await self.fetch_scheduled(url, session, scheduler, executor)
+                    if page is not None and page[1]:
+                        if pages_crawled >= max_pages:
+                            # Not stored, so left unfinished for a resumed crawl to fetch again
+                            continue
+                        pages_crawled += 1
+                        await self.store_fetched(url, page, scheduler, executor)
+                    
+                    await scheduler.done(url)
+                    await self.checkpoint_async(executor)
+                finally:
+                    await scheduler.task_done()
+        
+        try:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                scheduler = HostScheduler(delay, frontier, executor)
+                # URLs saved by a resumed crawl, then the new ones
+                await scheduler.fill()
+                await scheduler.put(start_urls)
+                await asyncio.gather(*(worker(scheduler, executor) for _ in range(concurrency)))
+        finally:
+            session.close()
+            self.checkpoint(force=True)
+            frontier.close()
         
         print(f"Crawling completed. Crawled {pages_crawled} pages.")
+        return pages_crawled
+    
+    @staticmethod
+    def make_session(concurrency):
+        """One pooled session, which keeps connections to each host alive"""
+        session = requests.Session()
+        session.headers.update(HEADERS)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+    
+    async def fetch_scheduled(self, url, session, scheduler, executor):
+        """Fetch a URL handed out by the scheduler off the event loop, then release its host"""
+        print(f"Crawling: {url}")
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, self.fetch_page, url, session)
+        finally:
+            await scheduler.release(url)
+    
+    async def store_fetched(self, url, page, scheduler, executor):
+        """Store a page fetched by crawl_async off the event loop and queue its outlinks"""
+        title, content, keywords, links, validators = page
+        await asyncio.get_running_loop().run_in_executor(
+            executor, self.store_page, url, title, content, keywords, validators, links)
+        await scheduler.put(links)
+    
+    async def checkpoint_async(self, executor):
+        """Start a checkpoint from crawl_async if one is due"""
+        if not self.checkpoint_due():
+            return
+        # Claimed here so other workers do not start one too; the save
+        # waits for the page writer, so it runs off the event loop
+        self.last_checkpoint = time.monotonic()
+        await asyncio.get_running_loop().run_in_executor(executor, self.checkpoint, True)
+
+class HostScheduler:
+    """Hands out URLs from a Frontier per host, honouring a per-host delay
+    
+    Up to `max_buffered` URLs are taken from the frontier into per-host FIFO
+    queues. A host is ready when it has queued URLs, no request in flight
+    and its delay since the last request has passed; ready hosts are kept
+    in a heap ordered by that time, so many hosts can be served in
+    parallel. Every URL handed out by get() must be followed by release()
+    once its request finishes and task_done() once its outlinks are queued;
+    the crawl is over when nothing is queued and no task is active.
+    
+    The frontier may read or write its saved queue on any call and blocks
+    while a checkpoint holds it, so it is only used on `executor`, never
+    on the event loop.
+    """
+    
+    def __init__(self, delay, frontier, executor, max_buffered=10000):
+        self.delay = delay
+        self.frontier = frontier
+        self.executor = executor
+        self.max_buffered = max_buffered
+        self.buffered = 0
+        self.queues = {}
+        # Host delays saved by a resumed crawl, moved onto the event loop clock
+        now = asyncio.get_running_loop().time()
+        self.next_time = {host: now + frontier.wait_time(host) for host in frontier.host_times}
+        self.in_flight = set()
+        self.active = 0
+        self.scheduled = set()
+        self.ready = []
+        self.condition = asyncio.Condition()
+    
+    def _schedule(self, host):
+        if host in self.in_flight or host in self.scheduled or not self.queues.get(host):
+            return
+        now = asyncio.get_running_loop().time()
+        heapq.heappush(self.ready, (max(now, self.next_time.get(host, now)), host))
+        self.scheduled.add(host)
+    
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+    
+    async def _fill(self):
+        """Move URLs from the frontier into the per-host queues (under the condition)"""
+        wanted = self.max_buffered - self.buffered
+        if wanted <= 0 or not len(self.frontier):
+            return
+        for url in await self._run(self._pop, wanted):
+            host = urlparse(url).netloc
+            self.queues.setdefault(host, deque()).append(url)
+            self.buffered += 1
+            self._schedule(host)
+    
+    def _pop(self, limit):
+        urls = []
+        while len(urls) < limit:
+            url = self.frontier.pop()
+            if url is None:
+                break
+            urls.append(url)
+        return urls
+    
+    def _push(self, urls):
+        return sum(self.frontier.push(url) for url in urls)
+    
+    async def fill(self):
+        """Take URLs already in the frontier, such as those of a resumed crawl"""
+        async with self.condition:
+            await self._fill()
+            self.condition.notify_all()
+    
+    async def put(self, urls):
+        """Queue the URLs that were not queued before"""
+        if await self._run(self._push, urls):
+            await self.fill()
+    
+    async def get(self):
+        """Wait for the next URL whose host may be contacted, or None when done"""
+        loop = asyncio.get_running_loop()
+        async with self.condition:
+            while True:
+                timeout = None
+                if self.ready:
+                    ready_time, host = self.ready[0]
+                    timeout = ready_time - loop.time()
+                    if timeout <= 0:
+                        heapq.heappop(self.ready)
+                        self.scheduled.discard(host)
+                        self.in_flight.add(host)
+                        url = self.queues[host].popleft()
+                        self.buffered -= 1
+                        self.active += 1
+                        await self._fill()
+                        return url
+                elif not self.active:
+                    return None
+                
+                try:
+                    await asyncio.wait_for(self.condition.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+    
+    async def release(self, url):
+        """Mark the request to a URL's host as finished and start its delay"""
+        host = urlparse(url).netloc
+        await self._run(self.frontier.set_host_time, host, time.time() + self.delay)
+        async with self.condition:
+            self.in_flight.discard(host)
+            self.next_time[host] = asyncio.get_running_loop().time() + self.delay
+            self._schedule(host)
+            self.condition.notify_all()
+    
+    async def done(self, url):
+        """Mark a URL handed out by get() as crawled in the frontier"""
+        await self._run(self.frontier.done, url)
+    
+    async def task_done(self):
+        """Mark a URL handed out by get() as fully processed"""
+        async with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
 
 if __name__ == "__main__":
     crawler = WebCrawler()
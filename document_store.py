@@ -0,0 +1,108 @@
+"""
+On-demand access to page contents.
+
+SearchEngine keeps only the URL and title of each document in memory.
+Page bodies stay in SQLite: building the index streams them through a
+cursor in chunks, and snippets fetch the few contents they need by URL
+(``pages.url`` is UNIQUE, so this is an index lookup). Resident memory
+therefore grows with the index, not with the amount of crawled text.
+"""
+
+import sqlite3
+import threading
+from collections import OrderedDict
+
+FETCH_CHUNK_SIZE = 500
+
+# Contents of recently added pages kept in memory, since the crawler's
+# batched writer may not have committed them yet
+RECENT_LIMIT = 1000
+
+
+class DocumentStore:
+    """Sequence of page contents by doc id, read from the database when needed
+
+    ``urls`` is the engine's sequence of document URLs and is shared, so
+    documents appended to it are visible here. ``row_ids`` are the
+    ``pages.id`` values of the documents loaded at startup, used to stream
+    them in order. Both may be memory-mapped arrays from a saved index.
+    """
+
+    def __init__(self, db_path, urls, row_ids):
+        self.db_path = db_path
+        self.urls = urls
+        self.row_ids = row_ids
+        self.recent = OrderedDict()
+        self.recent_lock = threading.Lock()
+        self.local = threading.local()
+
+    def __len__(self):
+        return len(self.urls)
+
+    def _connect(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path)
+            self.local.conn = conn
+        return conn
+
+    def add(self, url, content):
+        """Remember the content of a page added after startup"""
+        with self.recent_lock:
+            self.recent[url] = content or ""
+            self.recent.move_to_end(url)
+            while len(self.recent) > RECENT_LIMIT:
+                self.recent.popitem(last=False)
+
+    def __getitem__(self, doc_id):
+        return self.get_many([doc_id])[0]
+
+    def get_many(self, doc_ids):
+        """Contents of several documents with one query; '' for missing pages"""
+        return self.get_by_urls([self.urls[doc_id] for doc_id in doc_ids])
+
+    def get_by_urls(self, urls):
+        """Contents of the pages stored under urls; '' for missing pages"""
+        with self.recent_lock:
+            contents = {url: self.recent[url] for url in urls if url in self.recent}
+        missing = [url for url in urls if url not in contents]
+        for start in range(0, len(missing), FETCH_CHUNK_SIZE):
+            chunk = missing[start:start + FETCH_CHUNK_SIZE]
+            placeholders = ','.join('?' * len(chunk))
+            try:
+                rows = self._connect().execute(
+                    f"SELECT url, content FROM pages WHERE url IN ({placeholders})", chunk).fetchall()
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+                rows = []
+            contents.update(rows)
+        return [contents.get(url) or "" for url in urls]
+
+    def __iter__(self):
+        """Stream every document's content in doc id order"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            # Rows added after startup have larger ids and are excluded; a row
+            # replaced since then is gone, and its document reads as empty
+            last_id = int(self.row_ids[-1]) if len(self.row_ids) else 0
+            cursor = conn.execute("SELECT id, content FROM pages WHERE id <= ? ORDER BY id", (last_id,))
+            position = 0
+            while position < len(self.row_ids):
+                rows = cursor.fetchmany(FETCH_CHUNK_SIZE)
+                if not rows:
+                    break
+                for row_id, content in rows:
+                    while position < len(self.row_ids) and self.row_ids[position] < row_id:
+                        position += 1
+                        yield ""
+                    if position < len(self.row_ids) and self.row_ids[position] == row_id:
+                        position += 1
+                        yield content or ""
+            for _ in range(position, len(self.row_ids)):
+                yield ""
+        finally:
+            conn.close()
+
+        # Documents added through SearchEngine.add_document
+        for doc_id in range(len(self.row_ids), len(self.urls)):
+            yield self[doc_id]
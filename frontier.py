@@ -0,0 +1,394 @@
+"""
+Crawl frontier with a bounded memory footprint.
+
+URLs are normalized before they are queued and deduplicated on enqueue,
+so every URL enters the queue at most once. Seen URLs are kept as 64-bit
+fingerprints in a sorted NumPy array (8 bytes each instead of a full
+string in a set); past ``max_memory_urls`` they are spilled to SQLite
+behind a Bloom filter, or folded into the Bloom filter alone when no
+database is given.
+
+With a database, the queue lives in a SQLite table that is read back in
+chunks, and ``Frontier.checkpoint()`` saves new URLs, finished URLs,
+visited fingerprints and per-host politeness times, so a crawl stopped at
+any point can be resumed from its last checkpoint. URLs handed out but
+not finished by then are crawled again after a restart. The checkpoint
+may run on a worker thread while the crawl keeps queueing URLs.
+"""
+
+import hashlib
+import math
+import sqlite3
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit, urlunsplit
+
+import numpy as np
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url):
+    """Canonical form of a URL: lowercase scheme/host, no default port or fragment"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    netloc = host
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{parts.port}"
+    if parts.username:
+        userinfo = parts.username + (f":{parts.password}" if parts.password else '')
+        netloc = f"{userinfo}@{netloc}"
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+def url_fingerprint(url):
+    """64-bit fingerprint of an already normalized URL"""
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def to_signed(fingerprint):
+    """Map an unsigned 64-bit fingerprint onto SQLite's signed INTEGER range"""
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over 64-bit fingerprints"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, fingerprint):
+        # Double hashing from the two 32-bit halves of the fingerprint
+        h1 = fingerprint & 0xFFFFFFFF
+        h2 = (fingerprint >> 32) | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, fingerprint):
+        for position in self._positions(fingerprint):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def add_many(self, fingerprints):
+        """Vectorized add of an array of uint64 fingerprints"""
+        fingerprints = np.asarray(fingerprints, dtype=np.uint64)
+        bits = np.frombuffer(self.bits, dtype=np.uint8)
+        h1 = fingerprints & np.uint64(0xFFFFFFFF)
+        h2 = (fingerprints >> np.uint64(32)) | np.uint64(1)
+        for i in range(self.num_hashes):
+            positions = (h1 + np.uint64(i) * h2) % np.uint64(self.num_bits)
+            np.bitwise_or.at(bits, (positions >> np.uint64(3)).astype(np.int64),
+                             (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8)))
+
+    def __contains__(self, fingerprint):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(fingerprint))
+
+
+class VisitedSet:
+    """Set of URLs stored as fingerprints within a fixed memory budget"""
+
+    MERGE_SIZE = 4096
+
+    def __init__(self, max_memory_urls=1000000, spill_path=None, expected_urls=10000000, error_rate=0.001):
+        self.max_memory_urls = max_memory_urls
+        self.spill_path = spill_path
+        self.expected_urls = expected_urls
+        self.error_rate = error_rate
+        self.sorted = np.zeros(0, dtype=np.uint64)
+        self.recent = set()
+        self.bloom = None
+        self.conn = None
+        self.count = 0
+        # Fingerprints not yet written to the database
+        self.unsaved = []
+        # Called before spilling, so callers can first save what depends on it
+        self.on_spill = None
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, url):
+        return self._contains(url_fingerprint(normalize_url(url)))
+
+    def add(self, url):
+        """Add a URL; returns False if it was already present"""
+        fingerprint = url_fingerprint(normalize_url(url))
+        if self._contains(fingerprint):
+            return False
+        self.recent.add(fingerprint)
+        self.count += 1
+        if self.spill_path is not None:
+            self.unsaved.append(fingerprint)
+        if len(self.recent) >= self.MERGE_SIZE:
+            self._merge()
+        return True
+
+    def _contains(self, fingerprint):
+        if fingerprint in self.recent:
+            return True
+        position = np.searchsorted(self.sorted, np.uint64(fingerprint))
+        if position < len(self.sorted) and self.sorted[position] == fingerprint:
+            return True
+        if self.bloom is None or fingerprint not in self.bloom:
+            return False
+        if self.spill_path is None:
+            # Bloom-only mode: a rare false positive skips an unseen URL
+            return True
+        cursor = self._connect().execute("SELECT 1 FROM crawl_seen WHERE fingerprint = ?", (to_signed(fingerprint),))
+        return cursor.fetchone() is not None
+
+    def _merge(self):
+        """Fold recent fingerprints into the sorted array, spilling if over budget"""
+        if self.recent:
+            recent = np.fromiter(self.recent, dtype=np.uint64, count=len(self.recent))
+            self.sorted = np.union1d(self.sorted, recent)
+            self.recent = set()
+        if len(self.sorted) > self.max_memory_urls:
+            self._spill()
+
+    def _spill(self):
+        if self.on_spill:
+            self.on_spill()
+        if self.bloom is None:
+            self.bloom = BloomFilter(self.expected_urls, self.error_rate)
+        self.bloom.add_many(self.sorted)
+        if self.spill_path is not None:
+            conn = self._connect()
+            with conn:
+                conn.executemany("INSERT OR IGNORE INTO crawl_seen (fingerprint) VALUES (?)",
+                                 ((f,) for f in self.sorted.view(np.int64).tolist()))
+        self.sorted = np.zeros(0, dtype=np.uint64)
+
+    def _connect(self):
+        if self.conn is None:
+            # A Frontier may save the set from a checkpoint thread
+            self.conn = sqlite3.connect(self.spill_path, check_same_thread=False)
+            self.conn.execute("CREATE TABLE IF NOT EXISTS crawl_seen (fingerprint INTEGER PRIMARY KEY)")
+        return self.conn
+
+    def save(self):
+        """Write fingerprints added since the last save to the database"""
+        if self.spill_path is None or not self.unsaved:
+            return
+        conn = self._connect()
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO crawl_seen (fingerprint) VALUES (?)",
+                             ((to_signed(f),) for f in self.unsaved))
+        self.unsaved = []
+
+    def load(self):
+        """Restore the fingerprints saved by an earlier crawl"""
+        self.reset(drop=False)
+        if self.spill_path is None:
+            return
+        conn = self._connect()
+        self.count = conn.execute("SELECT COUNT(*) FROM crawl_seen").fetchone()[0]
+        if self.count <= self.max_memory_urls:
+            rows = conn.execute("SELECT fingerprint FROM crawl_seen").fetchall()
+            self.sorted = np.sort(np.array([f for f, in rows], dtype=np.int64).view(np.uint64))
+            return
+        # Too many to hold: leave them on disk behind the Bloom filter
+        self.bloom = BloomFilter(max(self.expected_urls, self.count), self.error_rate)
+        cursor = conn.execute("SELECT fingerprint FROM crawl_seen")
+        while True:
+            rows = cursor.fetchmany(100000)
+            if not rows:
+                break
+            self.bloom.add_many(np.array([f for f, in rows], dtype=np.int64).view(np.uint64))
+
+    def reset(self, drop=True):
+        """Forget every URL, including those saved by an earlier crawl unless drop is False"""
+        self.sorted = np.zeros(0, dtype=np.uint64)
+        self.recent = set()
+        self.unsaved = []
+        self.bloom = None
+        self.count = 0
+        if drop and self.spill_path is not None:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM crawl_seen")
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class Frontier:
+    """FIFO queue of normalized, deduplicated URLs
+
+    Without a database the queue is an in-memory deque. With one, queued
+    URLs are appended to the crawl_frontier table in batches and read back
+    max_memory_urls at a time; a row is only deleted by the checkpoint
+    after its URL is marked done(), so the saved queue can be resumed.
+    ``host_times`` maps a host to the wall-clock time it may next be
+    contacted and is saved with the queue; set it with set_host_time().
+
+    With resume=True the saved state is loaded. Otherwise it is left
+    alone until reset() starts a new crawl, so merely creating a Frontier
+    never discards an interrupted crawl's checkpoint.
+    """
+
+    SPILL_BATCH = 1000
+
+    def __init__(self, max_memory_urls=100000, spill_path=None, seen=None, resume=False):
+        self.max_memory_urls = max_memory_urls
+        self.spill_path = spill_path
+        self.seen = seen if seen is not None else VisitedSet(spill_path=spill_path)
+        # URLs in memory; (row id, url) pairs when backed by the database
+        self.queue = deque()
+        self.pending = []
+        self.unread = 0
+        self.read_id = 0
+        self.in_progress = {}
+        self.finished = []
+        self.host_times = {}
+        self.conn = None
+        # Lets checkpoint() run on another thread than the crawl
+        self.lock = threading.Lock()
+        if spill_path is not None:
+            # Queued URLs must reach the database before their fingerprints do
+            self.seen.on_spill = self._write_pending
+            if resume:
+                self._load()
+
+    def __len__(self):
+        return len(self.queue) + len(self.pending) + self.unread
+
+    def push(self, url):
+        """Queue a URL unless it was queued before; returns True if queued"""
+        url = normalize_url(url)
+        with self.lock:
+            queue = self.queue if self.spill_path is None else self.pending
+            queue.append(url)
+            if not self.seen.add(url):
+                queue.pop()
+                return False
+            if len(self.pending) >= self.SPILL_BATCH:
+                self._write_pending()
+            return True
+
+    def pop(self):
+        """Return the next URL, or None if the frontier is empty"""
+        with self.lock:
+            if self.spill_path is None:
+                return self.queue.popleft() if self.queue else None
+            if not self.queue:
+                self._refill()
+                if not self.queue:
+                    return None
+            row_id, url = self.queue.popleft()
+            self.in_progress[url] = row_id
+            return url
+
+    def done(self, url):
+        """Mark a URL returned by pop() as crawled"""
+        with self.lock:
+            row_id = self.in_progress.pop(url, None)
+            if row_id is not None:
+                self.finished.append(row_id)
+
+    def set_host_time(self, host, next_time):
+        """Record the wall-clock time a host may next be contacted"""
+        with self.lock:
+            self.host_times[host] = next_time
+
+    def wait_time(self, host):
+        """Seconds until a host may be contacted again"""
+        return max(0.0, self.host_times.get(host, 0.0) - time.time())
+
+    def _connect(self):
+        if self.conn is None:
+            # Used under self.lock, from whichever thread runs checkpoint()
+            self.conn = sqlite3.connect(self.spill_path, check_same_thread=False)
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS crawl_frontier (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT
+                )
+            ''')
+            self.conn.execute("CREATE TABLE IF NOT EXISTS crawl_hosts (host TEXT PRIMARY KEY, next_time REAL)")
+        return self.conn
+
+    def _write_pending(self):
+        if not self.pending:
+            return
+        conn = self._connect()
+        with conn:
+            conn.executemany("INSERT INTO crawl_frontier (url) VALUES (?)", ((u,) for u in self.pending))
+        self.unread += len(self.pending)
+        self.pending = []
+
+    def _refill(self):
+        self._write_pending()
+        if not self.unread:
+            return
+        rows = self._connect().execute("SELECT id, url FROM crawl_frontier WHERE id > ? ORDER BY id LIMIT ?",
+                                       (self.read_id, max(1, self.max_memory_urls))).fetchall()
+        if not rows:
+            self.unread = 0
+            return
+        self.read_id = rows[-1][0]
+        self.unread -= len(rows)
+        self.queue.extend(rows)
+
+    def take_finished(self):
+        """Remove and return the row ids of URLs marked done since the last call"""
+        with self.lock:
+            finished, self.finished = self.finished, []
+            return finished
+
+    def checkpoint(self, finished=None):
+        """Save queued and finished URLs, host times and visited fingerprints
+
+        finished is a list of row ids from take_finished(); by default every
+        URL marked done so far is saved as finished.
+        """
+        if self.spill_path is None:
+            return
+        with self.lock:
+            if finished is None:
+                finished, self.finished = self.finished, []
+            self._write_pending()
+            now = time.time()
+            self.host_times = {host: t for host, t in self.host_times.items() if t > now}
+            conn = self._connect()
+            with conn:
+                conn.executemany("DELETE FROM crawl_frontier WHERE id = ?", ((row_id,) for row_id in finished))
+                conn.execute("DELETE FROM crawl_hosts")
+                conn.executemany("INSERT INTO crawl_hosts (host, next_time) VALUES (?, ?)", self.host_times.items())
+            self.seen.save()
+
+    def _load(self):
+        """Restore the queue, host times and visited set of an earlier crawl"""
+        self.seen.load()
+        conn = self._connect()
+        self.unread = conn.execute("SELECT COUNT(*) FROM crawl_frontier").fetchone()[0]
+        self.host_times = dict(conn.execute("SELECT host, next_time FROM crawl_hosts"))
+        # The queue may have been saved without the fingerprints that followed it
+        for url, in conn.execute("SELECT url FROM crawl_frontier"):
+            self.seen.add(url)
+
+    def reset(self):
+        """Empty the queue and visited set, including any saved crawl state"""
+        self.queue = deque()
+        self.pending = []
+        self.unread = 0
+        self.in_progress = {}
+        self.finished = []
+        self.host_times = {}
+        self.seen.reset()
+        if self.spill_path is not None:
+            conn = self._connect()
+            with conn:
+                conn.execute("DELETE FROM crawl_frontier")
+                conn.execute("DELETE FROM crawl_hosts")
+
+    def close(self):
+        self.checkpoint()
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        self.seen.close()
@@ -0,0 +1,125 @@
+"""
+Serving SearchEngine with hot swaps of rebuilt index generations.
+
+The web app gets its engine from ``IndexManager.current()`` once per
+request. ``rebuild()`` constructs a new engine in a background thread,
+off the request path, and then replaces the current one with a single
+assignment. Requests that already hold the old engine finish on it; the
+next request sees the new generation. In shared-index mode each worker
+also notices when the saved index on disk has been replaced (by another
+worker's rebuild or ``python main.py index``) and attaches to it the
+same way.
+"""
+
+import os
+import threading
+import time
+import traceback
+
+from index_store import META_FILE
+
+
+class IndexManager:
+    """Holds the serving engine and swaps in rebuilt generations"""
+
+    def __init__(self, factory, rebuild_factory=None, index_path=None, poll_interval=5.0):
+        """factory() returns the engine to serve; rebuild_factory() builds a fresh one
+
+        index_path, if given, is watched for a newly saved index at most
+        every poll_interval seconds.
+        """
+        self.factory = factory
+        self.rebuild_factory = rebuild_factory or factory
+        self.index_path = index_path
+        self.poll_interval = poll_interval
+        self.engine = None
+        self.generation = 0
+        self.lock = threading.Lock()
+        self.thread = None
+        self.index_mtime = self._index_mtime()
+        self.last_poll = time.monotonic()
+        self.state = 'idle'
+        self.started = None
+        self.finished = None
+        self.seconds = None
+        self.error = None
+
+    def current(self):
+        """Return the engine to serve this request, loading the first one if needed"""
+        engine = self.engine
+        if engine is None:
+            with self.lock:
+                if self.engine is None:
+                    self._swap(self.factory())
+                engine = self.engine
+        elif self.index_path is not None and time.monotonic() - self.last_poll >= self.poll_interval:
+            self.last_poll = time.monotonic()
+            if self._index_mtime() != self.index_mtime:
+                self._start(self.factory)
+        return engine
+
+    def rebuild(self):
+        """Start building a new generation in the background; False if one is running"""
+        return self._start(self.rebuild_factory)
+
+    def wait(self, timeout=None):
+        """Wait for a running rebuild to finish"""
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def status(self):
+        engine = self.engine
+        return {
+            'state': self.state,
+            'generation': self.generation,
+            'documents': len(engine.documents) if engine is not None else 0,
+            'started': self.started,
+            'finished': self.finished,
+            'seconds': self.seconds,
+            'error': self.error,
+        }
+
+    def _start(self, factory):
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return False
+            self.state = 'building'
+            self.started = time.time()
+            self.finished = None
+            self.seconds = None
+            self.error = None
+            self.thread = threading.Thread(target=self._run, args=(factory,), name='index-rebuild', daemon=True)
+            self.thread.start()
+            return True
+
+    def _run(self, factory):
+        start = time.perf_counter()
+        try:
+            engine = factory()
+        except Exception as e:
+            traceback.print_exc()
+            with self.lock:
+                self.state = 'failed'
+                self.error = str(e)
+        else:
+            with self.lock:
+                self._swap(engine)
+                # An index saved by the factory itself needs no reload
+                self.index_mtime = self._index_mtime()
+                self.state = 'idle'
+        self.finished = time.time()
+        self.seconds = time.perf_counter() - start
+
+    def _swap(self, engine):
+        self.generation += 1
+        engine.generation = self.generation
+        self.engine = engine
+
+    def _index_mtime(self):
+        if self.index_path is None:
+            return None
+        try:
+            return os.stat(os.path.join(self.index_path, META_FILE)).st_mtime_ns
+        except OSError:
+            return None
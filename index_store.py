@@ -0,0 +1,249 @@
+"""
+On-disk persistence for the search index.
+
+The index is written as a directory next to the SQLite database
+(``database.db.index/`` by default) containing the vocabulary, the IDF
+vector, the TF-IDF matrix in CSR form, the inverted index posting lists,
+the BM25F impact postings with their statistics, the spelling delete map,
+the document priors and the document metadata. The arrays, including the
+URLs, titles and spelling deletes (as UTF-8 blobs with offsets), are stored as ``.npy`` files
+and memory-mapped on load. Every process that loads the same index shares
+one copy of it in the OS page cache instead of holding its own, and
+``index_lock`` lets concurrently starting workers agree on a single
+builder. Loads hold the lock shared, so they never see a directory that a
+save is swapping out.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: builds are not coordinated between processes
+    fcntl = None
+
+import numpy as np
+from scipy import sparse
+
+from inverted_index import InvertedIndex
+from spelling import SpellingIndex
+
+INDEX_FORMAT_VERSION = 6
+
+META_FILE = 'meta.json'
+TERMS_FILE = 'terms.json'
+
+
+class StringTable:
+    """Read-only sequence of strings stored as one UTF-8 blob and offsets"""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [string.encode('utf-8') for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(data) for data in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('string index out of range')
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        data = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield data[start:end].decode('utf-8')
+
+    def save(self, path, name):
+        np.save(os.path.join(path, f'{name}_blob.npy'), self.blob)
+        np.save(os.path.join(path, f'{name}_offsets.npy'), self.offsets)
+
+    @classmethod
+    def load(cls, path, name):
+        return cls(np.load(os.path.join(path, f'{name}_blob.npy'), mmap_mode='r'),
+                   np.load(os.path.join(path, f'{name}_offsets.npy'), mmap_mode='r'))
+
+
+@contextmanager
+def index_lock(index_path, shared=False):
+    """Hold a lock on an index: exclusive while it is checked and built, shared while it is loaded"""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{index_path}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def default_index_path(db_path):
+    """Return the index directory used for a database file"""
+    return db_path + '.index'
+
+
+def corpus_fingerprint(db_path):
+    """Summarize the pages and page_ranks tables so a stale index can be detected cheaply
+    
+    The saved priors include PageRank, so new scores make the index stale too.
+    """
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='pages'")
+            if not cursor.fetchone():
+                return None
+            cursor.execute("SELECT COUNT(*), MAX(id), SUM(id), MAX(crawl_time) FROM pages")
+            fingerprint = list(cursor.fetchone())
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='page_ranks'")
+            if cursor.fetchone():
+                cursor.execute("SELECT COUNT(*), SUM(score * score) FROM page_ranks")
+                fingerprint.extend(cursor.fetchone())
+            return fingerprint
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Database error: {e}")
+        return None
+
+
+def save_index(index_path, fingerprint, vectorizer, tfidf_matrix, inverted_index, urls, titles,
+               row_ids, priors, bm25_scorer, bm25_index, spelling_index):
+    """Write the index to disk, replacing any previous copy"""
+    tmp_path = f"{index_path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+    os.makedirs(tmp_path)
+
+    matrix = sparse.csr_matrix(tfidf_matrix)
+    np.save(os.path.join(tmp_path, 'data.npy'), matrix.data)
+    np.save(os.path.join(tmp_path, 'indices.npy'), matrix.indices)
+    np.save(os.path.join(tmp_path, 'indptr.npy'), matrix.indptr)
+    np.save(os.path.join(tmp_path, 'idf.npy'), vectorizer.idf_)
+    for name, array in inverted_index.to_arrays().items():
+        np.save(os.path.join(tmp_path, f'postings_{name}.npy'), array)
+    np.save(os.path.join(tmp_path, 'bm25_idf.npy'), bm25_scorer.idf)
+    for name, array in bm25_index.to_arrays().items():
+        np.save(os.path.join(tmp_path, f'bm25_postings_{name}.npy'), array)
+    StringTable.from_strings(spelling_index.keys).save(tmp_path, 'spelling_keys')
+    for name, array in spelling_index.to_arrays().items():
+        np.save(os.path.join(tmp_path, f'spelling_{name}.npy'), array)
+
+    terms = [None] * len(vectorizer.vocabulary_)
+    for term, column in vectorizer.vocabulary_.items():
+        terms[column] = term
+    with open(os.path.join(tmp_path, TERMS_FILE), 'w') as f:
+        json.dump(terms, f)
+
+    StringTable.from_strings(urls).save(tmp_path, 'urls')
+    StringTable.from_strings(titles).save(tmp_path, 'titles')
+    np.save(os.path.join(tmp_path, 'row_ids.npy'), np.asarray(row_ids, dtype=np.int64))
+    np.save(os.path.join(tmp_path, 'priors.npy'), np.asarray(priors, dtype=np.float64)[:len(urls)])
+
+    # The metadata file is written last; a directory without it is incomplete
+    with open(os.path.join(tmp_path, META_FILE), 'w') as f:
+        json.dump({
+            'version': INDEX_FORMAT_VERSION,
+            'fingerprint': fingerprint,
+            'shape': list(matrix.shape),
+            'bm25': bm25_scorer.state(),
+            'spelling_max_distance': spelling_index.max_distance,
+        }, f)
+
+    old_path = f"{index_path}.old-{os.getpid()}"
+    if os.path.exists(index_path):
+        os.replace(index_path, old_path)
+    os.replace(tmp_path, index_path)
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path, ignore_errors=True)
+
+
+def load_index(index_path, fingerprint, stale_ok=False, locked=False):
+    """Load a saved index, or return None if it is missing or stale
+    
+    With stale_ok=True an index built from an older state of the database
+    is loaded too. The index is read under a shared index_lock unless the
+    caller already holds it (locked=True).
+    """
+    if locked:
+        return _load_index(index_path, fingerprint, stale_ok)
+    with index_lock(index_path, shared=True):
+        return _load_index(index_path, fingerprint, stale_ok)
+
+
+def _load_index(index_path, fingerprint, stale_ok):
+    meta_file = os.path.join(index_path, META_FILE)
+    if (fingerprint is None and not stale_ok) or not os.path.exists(meta_file):
+        return None
+
+    try:
+        with open(meta_file) as f:
+            meta = json.load(f)
+        if meta.get('version') != INDEX_FORMAT_VERSION:
+            return None
+        if meta.get('fingerprint') != fingerprint and not stale_ok:
+            return None
+
+        with open(os.path.join(index_path, TERMS_FILE)) as f:
+            terms = json.load(f)
+        urls = StringTable.load(index_path, 'urls')
+        titles = StringTable.load(index_path, 'titles')
+        row_ids = np.load(os.path.join(index_path, 'row_ids.npy'), mmap_mode='r')
+        priors = np.load(os.path.join(index_path, 'priors.npy'), mmap_mode='r')
+
+        data = np.load(os.path.join(index_path, 'data.npy'), mmap_mode='r')
+        indices = np.load(os.path.join(index_path, 'indices.npy'), mmap_mode='r')
+        indptr = np.load(os.path.join(index_path, 'indptr.npy'), mmap_mode='r')
+        idf = np.load(os.path.join(index_path, 'idf.npy'))
+
+        tfidf_matrix = sparse.csr_matrix((data, indices, indptr), shape=tuple(meta['shape']), copy=False)
+        postings = {
+            name: np.load(os.path.join(index_path, f'postings_{name}.npy'), mmap_mode='r')
+            for name in InvertedIndex.ARRAY_NAMES
+        }
+        inverted_index = InvertedIndex.from_arrays(postings, num_docs=tfidf_matrix.shape[0])
+        bm25_postings = {
+            name: np.load(os.path.join(index_path, f'bm25_postings_{name}.npy'), mmap_mode='r')
+            for name in InvertedIndex.ARRAY_NAMES
+        }
+        bm25_index = InvertedIndex.from_arrays(bm25_postings, num_docs=tfidf_matrix.shape[0])
+        bm25_idf = np.load(os.path.join(index_path, 'bm25_idf.npy'))
+        spelling_arrays = {
+            name: np.load(os.path.join(index_path, f'spelling_{name}.npy'), mmap_mode='r')
+            for name in SpellingIndex.ARRAY_NAMES
+        }
+        spelling_index = SpellingIndex.from_arrays(terms, StringTable.load(index_path, 'spelling_keys'),
+                                                   spelling_arrays, meta['spelling_max_distance'])
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error loading index from {index_path}: {e}")
+        return None
+
+    return {
+        'vocabulary': {term: column for column, term in enumerate(terms)},
+        'idf': idf,
+        'tfidf_matrix': tfidf_matrix,
+        'inverted_index': inverted_index,
+        'bm25_index': bm25_index,
+        'bm25_idf': bm25_idf,
+        'bm25_state': meta['bm25'],
+        'spelling_index': spelling_index,
+        'urls': urls,
+        'titles': titles,
+        'row_ids': row_ids,
+        'priors': priors,
+    }
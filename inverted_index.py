@@ -0,0 +1,411 @@
+"""
+Inverted index over the TF-IDF matrix.
+
+Each term maps to a posting list of the documents containing it and the
+term's weight in each of them. Document ids are stored as gaps encoded
+with variable-byte compression and weights as float32, and both are
+decoded with vectorized NumPy operations, so a query only touches the
+postings of its own terms instead of every document in the corpus.
+
+Posting lists are split into fixed-size blocks that record their largest
+weight and last doc id. top_k uses these block-max bounds for MaxScore
+dynamic pruning: blocks that cannot lift a document into the current
+top-k are never decoded. Scores can be weighted per document, so the
+search engine's priors take part in the pruning.
+
+score_budget visits the blocks of all query terms from the highest
+block-max contribution down instead, and can stop after a posting or time
+budget with approximate scores for broad queries.
+"""
+
+import time
+
+import numpy as np
+from scipy import sparse
+
+BLOCK_SIZE = 128
+
+# Blocks decoded between checks of the deadline in score_budget
+BUDGET_CHECK_BLOCKS = 64
+
+
+def encoded_lengths(values):
+    """Number of bytes encode_gaps uses for each value"""
+    values = np.asarray(values, dtype=np.uint64)
+    bits = np.zeros(len(values), dtype=np.int64)
+    nonzero = values > 0
+    bits[nonzero] = np.floor(np.log2(values[nonzero].astype(np.float64))).astype(np.int64) + 1
+    return np.maximum(1, (bits + 6) // 7)
+
+
+def encode_gaps(values):
+    """Variable-byte encode non-negative integers, 7 bits per byte"""
+    values = np.asarray(values, dtype=np.uint64)
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.uint8)
+
+    num_bytes = encoded_lengths(values)
+
+    # Position of every output byte within its value
+    starts = np.cumsum(num_bytes) - num_bytes
+    value_index = np.repeat(np.arange(len(values)), num_bytes)
+    position = np.arange(num_bytes.sum()) - starts[value_index]
+
+    shifted = values[value_index] >> (7 * position).astype(np.uint64)
+    encoded = (shifted & np.uint64(0x7F)).astype(np.uint8)
+    # The high bit marks that more bytes of the same value follow
+    encoded[position < num_bytes[value_index] - 1] |= 0x80
+    return encoded
+
+
+def decode_gaps(encoded):
+    """Decode a variable-byte encoded array produced by encode_gaps"""
+    encoded = np.asarray(encoded, dtype=np.uint8)
+    if len(encoded) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    last_byte = (encoded & 0x80) == 0
+    ends = np.flatnonzero(last_byte)
+    starts = np.empty(len(ends), dtype=np.int64)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+
+    value_index = np.cumsum(last_byte) - last_byte
+    position = np.arange(len(encoded)) - starts[value_index]
+    parts = (encoded & 0x7F).astype(np.int64) << (7 * position)
+    return np.add.reduceat(parts, starts)
+
+
+def gather_ranges(starts, ends):
+    """Concatenated indices of the half-open ranges [starts[i], ends[i])"""
+    lengths = ends - starts
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+
+class InvertedIndex:
+    """Compressed term -> (doc id, weight) posting lists"""
+
+    ARRAY_NAMES = (
+        'doc_freqs', 'byte_offsets', 'posting_bytes', 'weight_offsets', 'weights',
+        'term_blocks', 'block_starts', 'block_byte_starts', 'block_base_docs', 'block_last_docs',
+        'block_max_weights', 'max_weights',
+    )
+
+    def __init__(self, doc_freqs, byte_offsets, posting_bytes, weight_offsets, weights,
+                 term_blocks, block_starts, block_byte_starts, block_base_docs, block_last_docs,
+                 block_max_weights, max_weights, num_docs):
+        self.doc_freqs = doc_freqs
+        self.byte_offsets = byte_offsets
+        self.posting_bytes = posting_bytes
+        self.weight_offsets = weight_offsets
+        self.weights = weights
+        # Block metadata: term_blocks[t]:term_blocks[t + 1] are the blocks of
+        # term t; block_starts and block_byte_starts have a trailing sentinel
+        self.term_blocks = term_blocks
+        self.block_starts = block_starts
+        self.block_byte_starts = block_byte_starts
+        self.block_base_docs = block_base_docs
+        self.block_last_docs = block_last_docs
+        self.block_max_weights = block_max_weights
+        self.max_weights = max_weights
+        self.num_docs = num_docs
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        """Build posting lists from a documents x terms sparse matrix"""
+        csc = sparse.csc_matrix(matrix)
+        csc.sort_indices()
+        num_docs, num_terms = csc.shape
+
+        doc_freqs = np.diff(csc.indptr).astype(np.int32)
+        doc_ids = csc.indices.astype(np.int64)
+
+        # Gaps between consecutive doc ids; each list starts from zero
+        gaps = np.diff(doc_ids, prepend=0)
+        list_starts = csc.indptr[:-1][doc_freqs > 0]
+        gaps[list_starts] = doc_ids[list_starts]
+
+        posting_bytes = encode_gaps(gaps)
+        posting_byte_starts = np.zeros(len(gaps) + 1, dtype=np.int64)
+        posting_byte_starts[1:] = np.cumsum(encoded_lengths(gaps))
+        byte_offsets = posting_byte_starts[csc.indptr]
+        weights = csc.data.astype(np.float32)
+
+        # Split every posting list into blocks of BLOCK_SIZE postings
+        blocks_per_term = (doc_freqs.astype(np.int64) + BLOCK_SIZE - 1) // BLOCK_SIZE
+        term_blocks = np.zeros(num_terms + 1, dtype=np.int64)
+        term_blocks[1:] = np.cumsum(blocks_per_term)
+        block_terms = np.repeat(np.arange(num_terms), blocks_per_term)
+        block_rank = np.arange(term_blocks[-1]) - term_blocks[block_terms]
+        first_postings = csc.indptr[block_terms] + block_rank * BLOCK_SIZE
+        last_postings = np.minimum(first_postings + BLOCK_SIZE, csc.indptr[block_terms + 1]) - 1
+
+        block_starts = np.append(first_postings, len(gaps)).astype(np.int64)
+        block_byte_starts = np.append(posting_byte_starts[first_postings], len(posting_bytes)).astype(np.int64)
+        block_base_docs = np.where(block_rank > 0, doc_ids[np.maximum(first_postings - 1, 0)], 0)
+        block_last_docs = doc_ids[last_postings]
+        if len(first_postings):
+            block_max_weights = np.maximum.reduceat(weights, first_postings)
+        else:
+            block_max_weights = np.zeros(0, dtype=np.float32)
+
+        max_weights = np.zeros(num_terms, dtype=np.float32)
+        np.maximum.at(max_weights, block_terms, block_max_weights)
+
+        return cls(
+            doc_freqs=doc_freqs,
+            byte_offsets=byte_offsets,
+            posting_bytes=posting_bytes,
+            weight_offsets=csc.indptr.astype(np.int64),
+            weights=weights,
+            term_blocks=term_blocks,
+            block_starts=block_starts,
+            block_byte_starts=block_byte_starts,
+            block_base_docs=block_base_docs.astype(np.int64),
+            block_last_docs=block_last_docs.astype(np.int64),
+            block_max_weights=block_max_weights.astype(np.float32),
+            max_weights=max_weights,
+            num_docs=num_docs,
+        )
+
+    @classmethod
+    def from_arrays(cls, arrays, num_docs):
+        """Rebuild an index from the arrays returned by to_arrays"""
+        return cls(*(arrays[name] for name in cls.ARRAY_NAMES), num_docs=num_docs)
+
+    def to_arrays(self):
+        """Return the arrays backing the index, keyed by name"""
+        return {name: getattr(self, name) for name in self.ARRAY_NAMES}
+
+    @property
+    def num_terms(self):
+        return len(self.doc_freqs)
+
+    def to_matrix(self):
+        """Decode every posting list back into a documents x terms CSR matrix"""
+        term_ids = np.repeat(np.arange(self.num_terms), np.asarray(self.doc_freqs, dtype=np.int64))
+        doc_ids, weights = self.decode_blocks(np.arange(len(self.block_max_weights)))
+        return sparse.csr_matrix((weights, (doc_ids, term_ids)), shape=(self.num_docs, self.num_terms))
+
+    def postings(self, term_id):
+        """Return the doc ids and weights of a term's posting list"""
+        start, end = self.byte_offsets[term_id], self.byte_offsets[term_id + 1]
+        doc_ids = np.cumsum(decode_gaps(self.posting_bytes[start:end]))
+        weights = self.weights[self.weight_offsets[term_id]:self.weight_offsets[term_id + 1]]
+        return doc_ids, weights
+
+    def term_rows(self, term_ids):
+        """len(term_ids) x docs CSR matrix of the postings of the given terms"""
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        doc_ids, weights = self.decode_blocks(gather_ranges(self.term_blocks[term_ids],
+                                                            self.term_blocks[term_ids + 1]))
+        lengths = self.block_starts[self.term_blocks[term_ids + 1]] - self.block_starts[self.term_blocks[term_ids]]
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        return sparse.csr_matrix((weights, doc_ids, indptr), shape=(len(term_ids), self.num_docs))
+
+    def score(self, term_ids, query_weights):
+        """Term-at-a-time accumulation of dot-product scores
+
+        Returns the ids of every document containing at least one query
+        term together with its score, without touching other documents.
+        """
+        doc_parts = []
+        score_parts = []
+        for term_id, query_weight in zip(term_ids, query_weights):
+            if self.doc_freqs[term_id] == 0:
+                continue
+            doc_ids, weights = self.postings(term_id)
+            doc_parts.append(doc_ids)
+            score_parts.append(weights * np.float64(query_weight))
+
+        if not doc_parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+
+        if len(doc_parts) == 1:
+            return doc_parts[0], score_parts[0]
+
+        doc_ids, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts), minlength=len(doc_ids))
+        return doc_ids, scores
+
+    def score_budget(self, term_ids, query_weights, max_postings=None, deadline=None):
+        """score() that stops early once a posting or time budget runs out
+
+        Blocks are scored in decreasing order of block-max weight times query
+        weight, so the postings most likely to decide the top results come
+        first. At most max_postings postings are scored, and no new batch of
+        blocks is started after deadline (a time.perf_counter() value); the
+        first block is always scored. Returns doc ids, scores, the number of
+        postings scored and whether every posting was scored.
+        """
+        terms = [(t, np.float64(q)) for t, q in zip(term_ids, query_weights) if self.doc_freqs[t] > 0]
+        if not terms:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64), 0, True
+
+        blocks = np.concatenate([np.arange(self.term_blocks[t], self.term_blocks[t + 1]) for t, _ in terms])
+        block_weights = np.concatenate([np.full(self.term_blocks[t + 1] - self.term_blocks[t], q)
+                                        for t, q in terms])
+        order = np.argsort(-self.block_max_weights[blocks] * block_weights, kind='stable')
+        blocks, block_weights = blocks[order], block_weights[order]
+        lengths = self.block_starts[blocks + 1] - self.block_starts[blocks]
+
+        num_blocks = len(blocks)
+        if max_postings is not None:
+            num_blocks = max(1, int(np.searchsorted(np.cumsum(lengths), max_postings, side='right')))
+
+        doc_parts = []
+        score_parts = []
+        scored_blocks = 0
+        while scored_blocks < num_blocks:
+            if scored_blocks and deadline is not None and time.perf_counter() >= deadline:
+                break
+            batch = slice(scored_blocks, min(scored_blocks + BUDGET_CHECK_BLOCKS, num_blocks))
+            doc_ids, weights = self.decode_blocks(blocks[batch])
+            doc_parts.append(doc_ids)
+            score_parts.append(weights * np.repeat(block_weights[batch], lengths[batch]))
+            scored_blocks = batch.stop
+
+        postings = int(lengths[:scored_blocks].sum())
+        doc_ids, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts), minlength=len(doc_ids))
+        return doc_ids, scores, postings, scored_blocks == len(blocks)
+
+    def decode_blocks(self, block_ids):
+        """Decode a set of blocks into doc ids and weights
+
+        Blocks are decoded together; the result is in the order of block_ids.
+        """
+        block_ids = np.asarray(block_ids, dtype=np.int64)
+        if len(block_ids) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        byte_positions = gather_ranges(self.block_byte_starts[block_ids], self.block_byte_starts[block_ids + 1])
+        gaps = decode_gaps(self.posting_bytes[byte_positions])
+
+        # Restart the running sum at each block from its base doc id
+        lengths = self.block_starts[block_ids + 1] - self.block_starts[block_ids]
+        firsts = np.cumsum(lengths) - lengths
+        gaps[firsts] += self.block_base_docs[block_ids]
+        totals = np.cumsum(gaps)
+        before = np.where(firsts > 0, totals[np.maximum(firsts - 1, 0)], 0)
+        doc_ids = totals - np.repeat(before, lengths)
+
+        positions = gather_ranges(self.block_starts[block_ids], self.block_starts[block_ids + 1])
+        return doc_ids, self.weights[positions]
+
+    def select_blocks(self, blocks, query_weight, rest, threshold, cand_docs, cand_scores, cand_weights, max_weight):
+        """Which of a term's blocks top_k must decode
+
+        Returns two masks over blocks: those whose bound could admit a new
+        document, and those to decode, which adds the blocks holding a
+        candidate that the block could still lift over the threshold.
+        cand_docs must be sorted; cand_weights are their document weights.
+        """
+        block_bounds = self.block_max_weights[blocks] * query_weight + rest
+        admits_new = block_bounds * max_weight >= threshold
+        selected = admits_new.copy()
+        if len(cand_docs):
+            # Block b holds doc ids in (base, last]; the first block starts at 0
+            lo = np.searchsorted(cand_docs, self.block_base_docs[blocks], side='right')
+            lo[0] = 0
+            hi = np.searchsorted(cand_docs, self.block_last_docs[blocks], side='right')
+            occupied = np.flatnonzero(hi > lo)
+            bounds = np.column_stack([lo[occupied], hi[occupied]]).ravel()
+            # (score + bound) * weight of a candidate is at most the best weighted
+            # score plus the bound times the largest weight in the block
+            best_candidate = np.maximum.reduceat(np.append(cand_scores * cand_weights, -np.inf), bounds)[::2]
+            heaviest = np.maximum.reduceat(np.append(cand_weights, -np.inf), bounds)[::2]
+            selected[occupied] |= best_candidate + block_bounds[occupied] * heaviest >= threshold
+        return admits_new, selected
+
+    def seed_threshold(self, terms, k, min_weight):
+        """A lower bound on the k-th best weighted score from block maxima alone
+
+        Every block maximum is the weight of a distinct document, so the
+        k-th largest block maximum of any term, times the smallest document
+        weight, is reached by at least k documents.
+        """
+        threshold = 0.0
+        for term_id, query_weight in terms:
+            block_maxima = self.block_max_weights[self.term_blocks[term_id]:self.term_blocks[term_id + 1]]
+            if len(block_maxima) >= k:
+                threshold = max(threshold, np.partition(block_maxima, -k)[-k] * query_weight * min_weight)
+        return threshold
+
+    def top_k(self, term_ids, query_weights, k, doc_weights=None):
+        """Return the k best-scoring documents using block-max MaxScore
+
+        Terms are visited from the shortest posting list to the longest.
+        The k-th best partial score seen so far is a lower bound on the
+        final top-k threshold. A block is only decoded if it could admit a
+        new document (its block-max bound plus the bounds of the remaining
+        terms reaches the threshold) or could still lift one of the
+        current candidates over it.
+
+        With doc_weights, an array indexed by doc id, documents are ranked
+        by their score times their weight, and the block bounds are scaled
+        by the largest weight. Returns doc ids and unweighted scores, best
+        first, with ties going to the lower doc id.
+        """
+        terms = [(t, np.float64(q)) for t, q in zip(term_ids, query_weights) if self.doc_freqs[t] > 0 and q > 0]
+        empty = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        if not terms or k <= 0:
+            return empty
+        if doc_weights is None:
+            doc_weights = np.ones(self.num_docs)
+        doc_weights = np.asarray(doc_weights[:self.num_docs], dtype=np.float64)
+        max_weight = doc_weights.max()
+
+        upper_bounds = np.array([q * self.max_weights[t] for t, q in terms])
+        order = np.lexsort((-upper_bounds, [self.doc_freqs[t] for t, _ in terms]))
+        remaining = np.append(np.cumsum(upper_bounds[order][::-1])[::-1], 0.0)
+        threshold = self.seed_threshold(terms, k, doc_weights.min())
+
+        cand_docs, cand_scores = empty
+        cand_weights = np.zeros(0)
+        for position, term_index in enumerate(order):
+            term_id, query_weight = terms[term_index]
+            rest = remaining[position + 1]
+
+            # Candidates that can no longer reach the threshold are dropped
+            if len(cand_docs):
+                keep = (cand_scores + remaining[position]) * cand_weights >= threshold
+                cand_docs, cand_scores, cand_weights = cand_docs[keep], cand_scores[keep], cand_weights[keep]
+
+            blocks = np.arange(self.term_blocks[term_id], self.term_blocks[term_id + 1])
+            admits_new, selected = self.select_blocks(blocks, query_weight, rest, threshold,
+                                                      cand_docs, cand_scores, cand_weights, max_weight)
+            if not selected.any():
+                continue
+
+            doc_ids, weights = self.decode_blocks(blocks[selected])
+            contributions = weights * query_weight
+
+            pos = np.searchsorted(cand_docs, doc_ids)
+            found = pos < len(cand_docs)
+            found[found] = cand_docs[pos[found]] == doc_ids[found]
+            cand_scores[pos[found]] += contributions[found]
+
+            block_admits = np.repeat(admits_new[selected],
+                                     self.block_starts[blocks[selected] + 1] - self.block_starts[blocks[selected]])
+            new = ~found & block_admits
+            new[new] = (contributions[new] + rest) * doc_weights[doc_ids[new]] >= threshold
+            if new.any():
+                cand_docs = np.concatenate([cand_docs, doc_ids[new]])
+                cand_scores = np.concatenate([cand_scores, contributions[new]])
+                cand_weights = np.concatenate([cand_weights, doc_weights[doc_ids[new]]])
+                merged = np.argsort(cand_docs, kind='stable')
+                cand_docs, cand_scores, cand_weights = cand_docs[merged], cand_scores[merged], cand_weights[merged]
+
+            # Partial scores only grow, so the k-th best is a safe threshold
+            if len(cand_scores) >= k:
+                threshold = max(threshold, np.partition(cand_scores * cand_weights, -k)[-k])
+
+        weighted = cand_scores * cand_weights
+        if len(cand_docs) > k:
+            # Keep every candidate tied with the k-th so ties still go by doc id
+            best = weighted >= np.partition(weighted, -k)[-k]
+            cand_docs, cand_scores, weighted = cand_docs[best], cand_scores[best], weighted[best]
+        ranked = np.lexsort((cand_docs, -weighted))[:k]
+        return cand_docs[ranked], cand_scores[ranked]
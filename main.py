@@ -11,17 +11,45 @@ import sys
 import os
 from crawler import WebCrawler
 from search_engine import SearchEngine
+from pagerank import compute_page_ranks
+from serving import serve
 from web_app import app, initialize_search_engine
 
-def crawl_websites(urls, max_pages=50, delay=2):
+def crawl_websites(urls, max_pages=50, delay=2, concurrency=1, resume=False):
     """Crawl websites and populate the database"""
-    print(f"Starting to crawl {len(urls)} websites...")
+    if resume:
+        print(f"Resuming the saved crawl with {len(urls)} extra websites...")
+    else:
+        print(f"Starting to crawl {len(urls)} websites...")
     print(f"Max pages: {max_pages}, Delay: {delay} seconds")
     
-    crawler = WebCrawler('database.db')
-    crawler.crawl(urls, max_pages=max_pages, delay=delay)
+    crawler = WebCrawler('database.db', resume=resume)
+    if concurrency > 1:
+        print(f"Concurrency: {concurrency} requests (delay applied per host)")
+        crawler.crawl_async(urls, max_pages=max_pages, delay=delay, concurrency=concurrency)
+    else:
+        crawler.crawl(urls, max_pages=max_pages, delay=delay)
     
     print("Crawling completed!")
+    # Pages are only indexed incrementally when the crawler runs in the engine's process
+    print("Run `python main.py index` (or POST /admin/reindex to a running server) to make new pages searchable")
+
+def refresh_pages(max_pages=None, delay=2):
+    """Re-fetch stored pages, skipping those that have not changed"""
+    print("Refreshing stored pages...")
+    WebCrawler('database.db').refresh(max_pages=max_pages, delay=delay)
+
+def rank_pages(damping=0.85, tol=1e-8, max_iter=100):
+    """Compute PageRank from the crawled links; used by the next index load"""
+    print("Computing PageRank from crawled links...")
+    compute_page_ranks('database.db', damping=damping, tol=tol, max_iter=max_iter)
+
+def build_index(workers=None):
+    """Build the search index and save it for servers to load; workers=None uses every core"""
+    print("Building search index...")
+    engine = SearchEngine('database.db', workers=workers)
+    if engine.inverted_index is not None:
+        print(f"Index for {len(engine.documents)} documents saved to {engine.index_path}")
 
 def test_search_engine():
     """Test the search engine with sample queries"""
@@ -61,27 +89,56 @@ def test_search_engine():
         else:
             print("No results found.")
 
-def run_web_server(host='127.0.0.1', port=5000, debug=True):
-    """Run the Flask web server"""
+def run_web_server(host='127.0.0.1', port=5000, debug=True, production=False,
+                   workers=4, max_pending=32, timeout=5.0):
+    """Run the Flask web server, or waitress with admission control with production=True"""
     print(f"Starting web server at http://{host}:{port}")
     print("Press Ctrl+C to stop the server")
     
     # Initialize the search engine
     initialize_search_engine()
     
-    app.run(host=host, port=port, debug=debug)
+    if production:
+        serve(app, host, port, workers=workers, max_pending=max_pending, timeout=timeout)
+    else:
+        app.run(host=host, port=port, debug=debug)
 
 def main():
     parser = argparse.ArgumentParser(description='PySearch - A Google-like Search Engine')
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
     
     # Crawl command
-    crawl_parser = subparsers.add_parser('crawl', help='Crawl websites and build index')
-    crawl_parser.add_argument('urls', nargs='+', help='URLs to start crawling from')
+    crawl_parser = subparsers.add_parser('crawl', help='Crawl websites into the database')
+    crawl_parser.add_argument('urls', nargs='*', help='URLs to start crawling from')
     crawl_parser.add_argument('--max-pages', type=int, default=50, 
                              help='Maximum number of pages to crawl (default: 50)')
     crawl_parser.add_argument('--delay', type=float, default=2, 
                              help='Delay between requests in seconds (default: 2)')
+    crawl_parser.add_argument('--concurrency', type=int, default=1,
+                             help='Concurrent requests across hosts; >1 uses the async crawler (default: 1)')
+    crawl_parser.add_argument('--resume', action='store_true',
+                             help='Continue the queue saved by an interrupted crawl')
+    
+    # Refresh command
+    refresh_parser = subparsers.add_parser('refresh', help='Re-fetch stored pages that have changed')
+    refresh_parser.add_argument('--max-pages', type=int, default=None,
+                               help='Maximum number of pages to check (default: all)')
+    refresh_parser.add_argument('--delay', type=float, default=2,
+                               help='Delay between requests in seconds (default: 2)')
+    
+    # Index command
+    index_parser = subparsers.add_parser('index', help='Build and save the search index for the server')
+    index_parser.add_argument('--workers', type=int, default=None,
+                             help='Processes preprocessing documents (default: all cores)')
+    
+    # PageRank command
+    pagerank_parser = subparsers.add_parser('pagerank', help='Compute PageRank from crawled links')
+    pagerank_parser.add_argument('--damping', type=float, default=0.85,
+                                help='Probability of following a link (default: 0.85)')
+    pagerank_parser.add_argument('--tol', type=float, default=1e-8,
+                                help='Stop once the L1 change between iterations is below this (default: 1e-8)')
+    pagerank_parser.add_argument('--max-iter', type=int, default=100,
+                                help='Maximum number of iterations (default: 100)')
     
     # Test command
     test_parser = subparsers.add_parser('test', help='Test the search engine')
@@ -94,6 +151,14 @@ def main():
                               help='Port to bind to (default: 5000)')
     server_parser.add_argument('--no-debug', action='store_true', 
                               help='Disable debug mode')
+    server_parser.add_argument('--production', action='store_true',
+                              help='Serve with waitress behind admission control')
+    server_parser.add_argument('--workers', type=int, default=4,
+                              help='Threads running requests in production mode (default: 4)')
+    server_parser.add_argument('--max-pending', type=int, default=32,
+                              help='Requests allowed to wait for a worker before 503s (default: 32)')
+    server_parser.add_argument('--timeout', type=float, default=5.0,
+                              help='Seconds before a request is answered 503 (default: 5)')
     
     # Parse arguments
     args = parser.parse_args()
@@ -104,13 +169,25 @@ def main():
     
     # Execute commands
     if args.command == 'crawl':
-        crawl_websites(args.urls, args.max_pages, args.delay)
+        if not args.urls and not args.resume:
+            crawl_parser.error('give URLs to crawl or --resume')
+        crawl_websites(args.urls, args.max_pages, args.delay, args.concurrency, args.resume)
+    
+    elif args.command == 'refresh':
+        refresh_pages(args.max_pages, args.delay)
+    
+    elif args.command == 'index':
+        build_index(args.workers)
+    
+    elif args.command == 'pagerank':
+        rank_pages(args.damping, args.tol, args.max_iter)
     
     elif args.command == 'test':
         test_search_engine()
     
     elif args.command == 'server':
-        run_web_server(args.host, args.port, not args.no_debug)
+        run_web_server(args.host, args.port, not args.no_debug, args.production,
+                       args.workers, args.max_pending, args.timeout)
 
 def setup_demo():
     """Set up a demo with sample data"""
@@ -0,0 +1,122 @@
+"""
+PageRank over the crawled link graph.
+
+The crawler records the outlinks of every stored page in the ``links``
+table. ``compute_page_ranks`` keeps the edges between stored pages, builds
+a sparse adjacency matrix and runs power iteration until the L1 change
+between iterations drops below ``tol``. Pages without outlinks spread their
+rank evenly over all pages. It is run offline (``python main.py pagerank``)
+and writes one score per page to ``page_ranks``; the scores sum to 1 and
+SearchEngine loads them at startup as part of each document's prior.
+"""
+
+import sqlite3
+import time
+from array import array
+
+import numpy as np
+from scipy import sparse
+
+from frontier import normalize_url
+
+DAMPING = 0.85
+
+
+def load_graph(conn):
+    """Return the stored page URLs and their adjacency matrix (row links to column)"""
+    urls = [url for url, in conn.execute("SELECT url FROM pages ORDER BY id")]
+    page_ids = {}
+    for page_id, url in enumerate(urls):
+        page_ids[url] = page_id
+        page_ids.setdefault(normalize_url(url), page_id)
+
+    sources = array('q')
+    targets = array('q')
+    try:
+        edges = conn.execute("SELECT source, target FROM links")
+        for source, target in edges:
+            source_id = page_ids.get(source)
+            target_id = page_ids.get(target)
+            # Links to pages that were never stored carry no rank
+            if source_id is not None and target_id is not None and source_id != target_id:
+                sources.append(source_id)
+                targets.append(target_id)
+    except sqlite3.OperationalError:
+        pass  # No links recorded yet
+
+    adjacency = sparse.csr_matrix(
+        (np.ones(len(sources)), (np.frombuffer(sources, dtype=np.int64), np.frombuffer(targets, dtype=np.int64))),
+        shape=(len(urls), len(urls)))
+    # Repeated edges (e.g. two stored URLs normalizing alike) count once
+    adjacency.data[:] = 1.0
+    return urls, adjacency
+
+
+def pagerank(adjacency, damping=DAMPING, tol=1e-8, max_iter=100):
+    """Power iteration; returns (ranks summing to 1, iterations, final L1 change)"""
+    num_pages = adjacency.shape[0]
+    if num_pages == 0:
+        return np.zeros(0), 0, 0.0
+
+    out_degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    inverse_degree = np.divide(1.0, out_degree, out=np.zeros(num_pages), where=out_degree > 0)
+    dangling = out_degree == 0
+    incoming = adjacency.T.tocsr()
+
+    ranks = np.full(num_pages, 1.0 / num_pages)
+    change = 0.0
+    for iteration in range(1, max_iter + 1):
+        updated = damping * (incoming @ (ranks * inverse_degree))
+        updated += (damping * ranks[dangling].sum() + 1.0 - damping) / num_pages
+        change = float(np.abs(updated - ranks).sum())
+        ranks = updated
+        if change < tol:
+            break
+    return ranks, iteration, change
+
+
+def compute_page_ranks(db_path, damping=DAMPING, tol=1e-8, max_iter=100):
+    """Compute PageRank for every stored page and save it to page_ranks"""
+    start = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    try:
+        urls, adjacency = load_graph(conn)
+        ranks, iterations, change = pagerank(adjacency, damping, tol, max_iter)
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS page_ranks (
+                    url TEXT PRIMARY KEY,
+                    score REAL
+                )
+            ''')
+            conn.execute("DELETE FROM page_ranks")
+            conn.executemany("INSERT OR REPLACE INTO page_ranks (url, score) VALUES (?, ?)",
+                             zip(urls, ranks.tolist()))
+    finally:
+        conn.close()
+
+    stats = {
+        'pages': len(urls),
+        'links': int(adjacency.nnz),
+        'iterations': iterations,
+        'change': change,
+        'converged': change < tol,
+        'seconds': time.perf_counter() - start,
+    }
+    print(f"PageRank for {stats['pages']} pages and {stats['links']} links: "
+          f"{iterations} iterations, L1 change {change:.2e} ({stats['seconds']:.2f}s)")
+    if not stats['converged']:
+        print(f"Warning: PageRank did not converge to {tol} in {max_iter} iterations")
+    return stats
+
+
+def load_page_ranks(db_path):
+    """Return (url, score) pairs saved by compute_page_ranks; empty if never run"""
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute("SELECT url, score FROM page_ranks").fetchall()
+        finally:
+            conn.close()
+    except sqlite3.OperationalError:
+        return []
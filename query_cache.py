@@ -0,0 +1,83 @@
+"""
+Query result cache for the web layer.
+
+Entries are kept in an ``OrderedDict`` in least-recently-used order, so
+both lookup and eviction are O(1). Each entry expires ``ttl`` seconds
+after it was stored, and the whole cache is dropped when the index
+version it was filled from changes (a rebuild or an added page). Callers
+that may still hold an older index pass its version to get() and put(),
+so results of one version are never served for another.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryCache:
+    """Thread-safe LRU cache with per-entry TTL and hit/miss counters"""
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def sync(self, version):
+        """Drop every entry if the index has changed since they were stored"""
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+
+    def get(self, key, version=None):
+        """Return the cached value for key, or None on a miss or a version other than the cache's"""
+        with self.lock:
+            entry = self.entries.get(key) if version is None or version == self.version else None
+            if entry is not None and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, version=None):
+        """Store a value, evicting the least recently used entries if full
+        
+        A value computed from another index version than the cache's is dropped.
+        """
+        with self.lock:
+            if version is not None and version != self.version:
+                return
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """Return size and hit/miss counters"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -1,14 +1,30 @@
 import sqlite3
 import re
-import math
-from collections import defaultdict, Counter
+import os
+import struct
+import threading
+import time
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from array import array
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
 import nltk
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 from nltk.stem import PorterStemmer
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
 import numpy as np
+from index_store import corpus_fingerprint, default_index_path, index_lock, load_index, save_index
+from inverted_index import InvertedIndex
+from segments import SegmentedIndex
+from spelling import SpellingIndex
+from autocomplete import QueryCompleter
+from analysis import FastAnalyzer
+from document_store import DocumentStore
+from snippets import make_snippet
+from pagerank import load_page_ranks
+from bm25 import BM25FScorer
 
 # Download required NLTK data
 try:
@@ -26,26 +42,125 @@ try:
 except LookupError:
     nltk.download('stopwords')
 
+# Documents per task sent to preprocessing worker processes
+PREPROCESS_CHUNK_SIZE = 256
+
+# Term extraction of the TF-IDF index; BM25F counts terms with the same settings
+VECTORIZER_PARAMS = dict(max_features=10000, stop_words='english', lowercase=True, ngram_range=(1, 2))
+
+# 'fast' is the single-pass tokenizer with memoized stems in analysis.py;
+# 'nltk' runs word_tokenize and stems every token. Both give the same terms.
+ANALYZERS = ('fast', 'nltk')
+
+def make_analyzer(name, stemmer, stop_words):
+    """Return a function mapping raw text to its space-separated index terms"""
+    if name not in ANALYZERS:
+        raise ValueError(f"Unknown analyzer: {name}")
+    if name == 'fast':
+        return FastAnalyzer(stemmer, stop_words)
+    return lambda text: preprocess_text(text, stemmer, stop_words)
+
+# Analyzer of a preprocessing worker process
+_worker_analyzer = None
+
+def _init_preprocess_worker(name):
+    global _worker_analyzer
+    _worker_analyzer = make_analyzer(name, PorterStemmer(), set(stopwords.words('english')))
+
+def _preprocess_chunk(texts):
+    return [_worker_analyzer(text) for text in texts]
+
+def preprocess_text(text, stemmer, stop_words):
+    """Clean and preprocess text"""
+    # Convert to lowercase and remove special characters
+    text = re.sub(r'[^a-zA-Z0-9\s]', ' ', text.lower())
+    
+    # Tokenize
+    tokens = word_tokenize(text)
+    
+    # Remove stopwords and stem
+    processed_tokens = []
+    for token in tokens:
+        if token not in stop_words and len(token) > 2:
+            stemmed = stemmer.stem(token)
+            processed_tokens.append(stemmed)
+    
+    return ' '.join(processed_tokens)
+
+# 'exhaustive' scores every document in the query terms' posting lists;
+# 'maxscore' uses block-max upper bounds to skip postings outside the top-k
+RETRIEVAL_STRATEGIES = ('exhaustive', 'maxscore')
+
+# 'tfidf' ranks by cosine similarity of content TF-IDF vectors;
+# 'bm25' by BM25F over titles and contents
+RANKINGS = ('tfidf', 'bm25')
+
+# Scores at or below this are not results. The cosine cutoff does not carry
+# over to BM25F, whose scores for terms in most documents are tiny but real.
+MIN_SCORES = {'tfidf': 0.01, 'bm25': 0.0}
+
+def encode_cursor(final_score, doc_id):
+    """Opaque, URL-safe position after the hit with this final score and doc id"""
+    return urlsafe_b64encode(struct.pack('<dq', final_score, doc_id)).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """(final score, doc id) of a cursor; ValueError if it is malformed"""
+    try:
+        return struct.unpack('<dq', urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (struct.error, ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
 class SearchEngine:
-    def __init__(self, db_path='database.db'):
+    def __init__(self, db_path='database.db', index_path=None, use_index_cache=True, memtable_limit=1000,
+                 workers=1, analyzer='fast', shared=False):
         self.db_path = db_path
+        self.index_path = index_path or default_index_path(db_path)
+        self.use_index_cache = use_index_cache
+        self.memtable_limit = memtable_limit
+        # Processes used to preprocess documents in build_index; None uses every core
+        self.workers = workers or os.cpu_count() or 1
         self.stemmer = PorterStemmer()
         self.stop_words = set(stopwords.words('english'))
-        self.tfidf_vectorizer = TfidfVectorizer(
-            max_features=10000,
-            stop_words='english',
-            lowercase=True,
-            ngram_range=(1, 2)
-        )
-        self.documents = []
+        self.analyzer = analyzer
+        self.analyze = make_analyzer(analyzer, self.stemmer, self.stop_words)
+        self.tfidf_vectorizer = TfidfVectorizer(**VECTORIZER_PARAMS)
         self.document_urls = []
         self.document_titles = []
+        # Page contents stay in the database and are read when needed
+        self.documents = DocumentStore(db_path, self.document_urls, array('q'))
+        self.url_to_doc = {}
+        self.update_lock = threading.Lock()
         self.tfidf_matrix = None
-        self.load_documents()
-        self.build_index()
+        self.inverted_index = None
+        # BM25F impacts, built and saved together with the TF-IDF index
+        self.bm25_scorer = None
+        self.bm25_index = None
+        # Static score of each document (URL heuristic times link weight), by
+        # doc id; may be longer than the corpus
+        self.priors = np.ones(0)
+        # Saved and memory-mapped with the index; without a saved index it is
+        # built on the first suggest_spelling() call after each full index build
+        self.spelling_index = None
+        self.spelling_lock = threading.Lock()
+        # (index_version, QueryCompleter) of the titles it was built from
+        self.query_completer = None
+        self.completer_lock = threading.Lock()
+        self.index_loaded_from_cache = False
+        # Bumped whenever search results may change, so callers can drop cached results
+        self.index_version = 0
+        # Set by IndexManager to tell apart successive engines it serves
+        self.generation = 0
+        self.corpus_fingerprint = corpus_fingerprint(db_path) if use_index_cache else None
+        # A shared engine serves the saved index read-only, for web workers
+        self.shared = shared
+        if shared:
+            self.attach_index()
+        else:
+            self.load_documents()
+            self.build_index()
     
     def load_documents(self):
-        """Load documents from database"""
+        """Load document URLs and titles from database"""
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
@@ -57,15 +172,14 @@ class SearchEngine:
                 conn.close()
                 return
             
-            cursor.execute("SELECT url, title, content FROM pages")
-            results = cursor.fetchall()
-            conn.close()
-            
-            for url, title, content in results:
+            cursor.execute("SELECT id, url, title FROM pages ORDER BY id")
+            for row_id, url, title in cursor:
+                self.url_to_doc[url] = len(self.document_urls)
                 self.document_urls.append(url)
                 self.document_titles.append(title or "")
-                self.documents.append(content or "")
-                
+                self.documents.row_ids.append(row_id)
+            conn.close()
+            
         except sqlite3.Error as e:
             print(f"Database error: {e}")
         except Exception as e:
@@ -73,20 +187,33 @@ class SearchEngine:
     
     def preprocess_text(self, text):
         """Clean and preprocess text"""
-        # Convert to lowercase and remove special characters
-        text = re.sub(r'[^a-zA-Z0-9\s]', ' ', text.lower())
-        
-        # Tokenize
-        tokens = word_tokenize(text)
-        
-        # Remove stopwords and stem
-        processed_tokens = []
-        for token in tokens:
-            if token not in self.stop_words and len(token) > 2:
-                stemmed = self.stemmer.stem(token)
-                processed_tokens.append(stemmed)
+        return self.analyze(text)
+    
+    def preprocess_documents(self, texts, workers=None):
+        """Preprocess many texts, sharded across worker processes if workers > 1"""
+        return list(self.iter_preprocessed(texts, workers))
+    
+    def iter_preprocessed(self, texts, workers=None):
+        """Yield the preprocessed form of each text in order, reading texts lazily"""
+        workers = workers or self.workers
+        if workers <= 1 or len(texts) <= PREPROCESS_CHUNK_SIZE:
+            for text in texts:
+                yield self.preprocess_text(text)
+            return
         
-        return ' '.join(processed_tokens)
+        texts = iter(texts)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_preprocess_worker,
+                                 initargs=(self.analyzer,)) as executor:
+            # Keep a few chunks per worker in flight so texts are read as needed
+            pending = deque()
+            while True:
+                chunk = list(islice(texts, PREPROCESS_CHUNK_SIZE))
+                if chunk:
+                    pending.append(executor.submit(_preprocess_chunk, chunk))
+                if pending and (not chunk or len(pending) >= workers * 2):
+                    yield from pending.popleft().result()
+                if not chunk and not pending:
+                    return
     
     def build_index(self):
         """Build TF-IDF index for all documents"""
@@ -94,12 +221,170 @@ class SearchEngine:
             print("No documents found in database")
             return
         
-        # Preprocess all documents
-        processed_docs = [self.preprocess_text(doc) for doc in self.documents]
+        self.index_version += 1
+        self.spelling_index = None
+        self.query_completer = None
+        self.bm25_scorer = None
+        self.bm25_index = None
+        self.priors = np.array(self.calculate_page_rank(self.document_urls), dtype=np.float64)
+        self.priors *= self.link_weights()
+        if not self.use_index_cache:
+            self._build_index()
+        else:
+            # Processes starting together wait for one of them to build the index
+            with index_lock(self.index_path):
+                if self.load_cached_index():
+                    print(f"Loaded cached index for {len(self.documents)} documents")
+                else:
+                    self._build_index()
+    
+    def _build_index(self):
+        # Preprocess all documents, streamed from the database into the vectorizer
+        content_lengths = array('d')
+        
+        def processed_docs():
+            for text in self.iter_preprocessed(self.documents):
+                content_lengths.append(len(text.split()))
+                yield text
+        
+        # Count terms once; TF-IDF weights and BM25F impacts both derive from the counts
+        counter = CountVectorizer(**VECTORIZER_PARAMS)
+        counts = counter.fit_transform(processed_docs())
+        transformer = TfidfTransformer().fit(counts)
+        self.tfidf_vectorizer.vocabulary_ = counter.vocabulary_
+        self.tfidf_vectorizer.idf_ = transformer.idf_
+        self.tfidf_matrix = transformer.transform(counts)
+        base_index = InvertedIndex.from_matrix(self.tfidf_matrix)
+        self.inverted_index = SegmentedIndex(base_index, memtable_limit=self.memtable_limit)
         
-        # Build TF-IDF matrix
-        self.tfidf_matrix = self.tfidf_vectorizer.fit_transform(processed_docs)
+        scorer = BM25FScorer(counter.vocabulary_)
+        titles = (self.preprocess_text(title) for title in self.document_titles)
+        impacts = scorer.fit_counts({
+            'title': scorer.count(titles),
+            'content': (counts, np.frombuffer(content_lengths, dtype=np.float64)),
+        })
+        bm25_base = InvertedIndex.from_matrix(impacts)
+        self.bm25_scorer = scorer
+        self.bm25_index = SegmentedIndex(bm25_base, memtable_limit=self.memtable_limit)
         print(f"Index built for {len(self.documents)} documents")
+        
+        if self.use_index_cache and self.corpus_fingerprint is not None:
+            self.spelling_index = self.build_spelling_index()
+            try:
+                save_index(self.index_path, self.corpus_fingerprint, self.tfidf_vectorizer,
+                           self.tfidf_matrix, base_index,
+                           self.document_urls, self.document_titles,
+                           self.documents.row_ids, self.priors,
+                           self.bm25_scorer, bm25_base, self.spelling_index)
+            except OSError as e:
+                print(f"Error saving index to {self.index_path}: {e}")
+    
+    def attach_index(self):
+        """Serve the saved index read-only, building and saving it first if there is none
+        
+        Nothing is loaded from the pages table: URLs, titles, priors and
+        postings are memory-mapped from the index directory, so every process
+        attached to it shares one copy. The saved index is used even if the
+        database changed since it was built; `python main.py index` rebuilds it.
+        """
+        cached = load_index(self.index_path, None, stale_ok=True)
+        if cached is None:
+            # The first worker to get here builds the index for all of them
+            SearchEngine(self.db_path, self.index_path, memtable_limit=self.memtable_limit,
+                         workers=self.workers, analyzer=self.analyzer)
+            cached = load_index(self.index_path, None, stale_ok=True)
+            if cached is None:
+                print("No documents found in database")
+                return
+        
+        self.document_urls = cached['urls']
+        self.document_titles = cached['titles']
+        self.documents = DocumentStore(self.db_path, self.document_urls, cached['row_ids'])
+        self.priors = cached['priors']
+        self.tfidf_vectorizer.vocabulary_ = cached['vocabulary']
+        self.tfidf_vectorizer.idf_ = cached['idf']
+        self.tfidf_matrix = cached['tfidf_matrix']
+        self.inverted_index = SegmentedIndex(cached['inverted_index'], memtable_limit=self.memtable_limit)
+        self.load_cached_bm25(cached)
+        self.spelling_index = cached['spelling_index']
+        self.index_loaded_from_cache = True
+        self.index_version += 1
+        print(f"Attached to shared index for {len(self.documents)} documents")
+    
+    def load_cached_index(self):
+        """Restore the TF-IDF index from disk if it matches the database"""
+        cached = load_index(self.index_path, self.corpus_fingerprint, locked=True)
+        if cached is None or list(cached['urls']) != self.document_urls:
+            return False
+        
+        self.tfidf_vectorizer.vocabulary_ = cached['vocabulary']
+        self.tfidf_vectorizer.idf_ = cached['idf']
+        self.tfidf_matrix = cached['tfidf_matrix']
+        self.inverted_index = SegmentedIndex(cached['inverted_index'], memtable_limit=self.memtable_limit)
+        self.load_cached_bm25(cached)
+        self.spelling_index = cached['spelling_index']
+        self.index_loaded_from_cache = True
+        return True
+    
+    def load_cached_bm25(self, cached):
+        self.bm25_scorer = BM25FScorer.from_state(cached['vocabulary'], cached['bm25_state'], cached['bm25_idf'])
+        self.bm25_index = SegmentedIndex(cached['bm25_index'], memtable_limit=self.memtable_limit)
+    
+    def add_document(self, url, title, content):
+        """Make a newly stored page searchable without a full rebuild
+        
+        A page stored again under the same URL replaces the earlier version,
+        which is tombstoned in the index.
+        """
+        if self.shared:
+            raise RuntimeError("A shared index is read-only; rebuild it with `python main.py index`")
+        with self.update_lock:
+            previous = self.url_to_doc.get(url)
+            doc_id = len(self.document_urls)
+            self.url_to_doc[url] = doc_id
+            self.document_urls.append(url)
+            self.document_titles.append(title or "")
+            self.documents.add(url, content)
+            
+            if self.inverted_index is None:
+                # Nothing to extend yet, so build the first index from scratch
+                self.build_index()
+            else:
+                self.set_prior(doc_id, url)
+                processed = self.preprocess_text(content or "")
+                self.inverted_index.add(doc_id, self.tfidf_vectorizer.transform([processed]))
+                if self.bm25_index is not None:
+                    row = self.bm25_scorer.transform(self.preprocess_text(title or ""), processed)
+                    self.bm25_index.add(doc_id, row)
+            
+            if previous is not None and self.inverted_index is not None:
+                self.inverted_index.delete(previous)
+                if self.bm25_index is not None:
+                    self.bm25_index.delete(previous)
+            self.index_version += 1
+    
+    def link_weights(self):
+        """Per-document weight from the saved PageRank scores, 1 for an average page
+        
+        Scores are scaled by the number of pages so an average page scores 1,
+        then damped logarithmically; pages without a score get 1.
+        """
+        weights = np.ones(len(self.document_urls))
+        ranks = load_page_ranks(self.db_path)
+        for url, score in ranks:
+            doc_id = self.url_to_doc.get(url)
+            if doc_id is not None:
+                weights[doc_id] = np.log2(1.0 + len(ranks) * score)
+        return weights
+    
+    def set_prior(self, doc_id, url):
+        """Record the prior of a document added after the index was built"""
+        if doc_id >= len(self.priors):
+            # Grow geometrically so a stream of additions stays cheap
+            grown = np.ones(max(2 * len(self.priors), doc_id + 1))
+            grown[:len(self.priors)] = self.priors
+            self.priors = grown
+        self.priors[doc_id] = self.calculate_page_rank([url])[0]
     
     def calculate_page_rank(self, urls):
         """Simple page rank calculation based on URL characteristics"""
@@ -126,93 +411,291 @@ class SearchEngine:
         
         return scores
     
-    def search(self, query, max_results=10):
-        """Search for documents matching the query"""
-        if not self.documents or self.tfidf_matrix is None:
-            return []
+    def retrieve(self, query_vector, k, retrieval='exhaustive', index=None):
+        """Return ids and similarity scores of candidates that hold the k best documents
         
-        # Preprocess query
-        processed_query = self.preprocess_text(query)
+        Documents are compared by final score, their similarity weighted
+        with their priors: exhaustive retrieval returns every matching
+        document, MaxScore only the k best.
+        """
+        if retrieval not in RETRIEVAL_STRATEGIES:
+            raise ValueError(f"Unknown retrieval strategy: {retrieval}")
+        index = index or self.inverted_index
         
-        # Transform query using the same vectorizer
-        query_vector = self.tfidf_vectorizer.transform([processed_query])
+        # For TF-IDF both vectors are L2-normalized, so the dot product over
+        # the query's posting lists is the cosine similarity; for BM25 the
+        # postings hold impacts and the query holds term counts
+        if retrieval == 'maxscore':
+            return index.top_k(query_vector.indices, query_vector.data, k, self.priors)
+        return index.score(query_vector.indices, query_vector.data)
+    
+    def search(self, query, max_results=10, retrieval='exhaustive', snippets=True, highlight_offsets=False,
+               ranking='tfidf', time_budget=None, max_postings=None, with_stats=False):
+        """Search for documents matching the query
+        
+        Snippets are made only for the results returned; with snippets=False
+        they are left out so the caller can add them later with add_snippets.
+        
+        time_budget (seconds) and max_postings bound the scoring work for
+        broad queries: postings are scored from the highest-impact blocks
+        down until either runs out, and the results may then be
+        approximate. With with_stats=True, return (results, stats), where
+        stats says whether the results are exact and gives the total number
+        of hits, estimated from posting lengths when not every posting was
+        scored.
+        """
+        start = time.perf_counter()
+        if ranking not in RANKINGS:
+            raise ValueError(f"Unknown ranking: {ranking}")
+        if not self.documents or self.inverted_index is None:
+            stats = {'exact': True, 'total_hits': 0, 'total_hits_exact': True,
+                     'postings_scored': 0, 'postings_total': 0, 'seconds': 0.0}
+            return ([], stats) if with_stats else []
         
-        # Calculate cosine similarity
-        similarity_scores = cosine_similarity(query_vector, self.tfidf_matrix).flatten()
+        # Preprocess query
+        processed_query = self.preprocess_text(query)
         
         # Get top results
-        top_indices = similarity_scores.argsort()[-max_results * 2:][::-1]
+        index, query_vector = self.vectorize_queries([processed_query], ranking)
+        budgeted = time_budget is not None or max_postings is not None
+        if budgeted or (with_stats and retrieval == 'exhaustive'):
+            deadline = start + time_budget if time_budget is not None else None
+            doc_ids, similarity_scores, postings, exact = index.score_budget(
+                query_vector.indices, query_vector.data, max_postings, deadline)
+            hits = int(np.count_nonzero(similarity_scores > MIN_SCORES[ranking]))
+            if not exact:
+                # Scale the estimated matches by the share of scored ones that were hits
+                hits = max(hits, round(self.estimate_matches(index, query_vector.indices) *
+                                       hits / max(len(doc_ids), 1)))
+            stats = {'exact': exact, 'total_hits': hits, 'total_hits_exact': exact, 'postings_scored': postings}
+        else:
+            # With MaxScore twice the results are kept, so ones under the minimum score cannot crowd out hits
+            doc_ids, similarity_scores = self.retrieve(query_vector, max_results * 2, retrieval, index)
+            if with_stats:
+                stats = {'exact': True, 'total_hits': round(self.estimate_matches(index, query_vector.indices)),
+                         'total_hits_exact': False, 'postings_scored': None}
+        doc_ids, similarity_scores, _, _ = self.rank_candidates(doc_ids, similarity_scores, ranking, max_results)
+        results = self.make_results(doc_ids, similarity_scores)
         
-        # Filter out results with very low similarity
-        results = []
-        for idx in top_indices:
-            if similarity_scores[idx] > 0.01:  # Minimum similarity threshold
-                results.append({
-                    'url': self.document_urls[idx],
-                    'title': self.document_titles[idx],
-                    'content_snippet': self.get_snippet(self.documents[idx], query),
-                    'similarity_score': similarity_scores[idx],
-                    'page_rank': self.calculate_page_rank([self.document_urls[idx]])[0]
-                })
+        if snippets:
+            results = self.add_snippets(results, query, highlight_offsets)
+        if not with_stats:
+            return results
+        stats['postings_total'] = int(index.doc_freqs()[query_vector.indices].sum())
+        stats['seconds'] = time.perf_counter() - start
+        return results, stats
+    
+    def estimate_matches(self, index, term_ids):
+        """Documents containing any of the terms, from posting lengths, assuming independent terms"""
+        if index.num_docs == 0 or len(term_ids) == 0:
+            return 0.0
+        doc_freqs = np.minimum(index.doc_freqs()[term_ids], index.num_docs)
+        return float(index.num_docs * (1.0 - np.prod(1.0 - doc_freqs / index.num_docs)))
+    
+    def search_batch(self, queries, max_results=10, snippets=True, highlight_offsets=False, ranking='tfidf'):
+        """Search for many queries at once; returns one result list per query
         
-        # Combine similarity and page rank for final scoring
-        for result in results:
-            result['final_score'] = result['similarity_score'] * result['page_rank']
+        All queries are vectorized into one sparse matrix and scored against
+        the index with a single sparse product, then each row's matches are
+        ranked as in search().
+        """
+        if ranking not in RANKINGS:
+            raise ValueError(f"Unknown ranking: {ranking}")
+        if not queries:
+            return []
+        if not self.documents or self.inverted_index is None:
+            return [[] for _ in queries]
         
-        # Sort by final score
-        results.sort(key=lambda x: x['final_score'], reverse=True)
+        processed_queries = [self.preprocess_text(query) for query in queries]
+        index, query_matrix = self.vectorize_queries(processed_queries, ranking)
+        scores = index.score_batch(query_matrix)
         
-        return results[:max_results]
+        batch = []
+        for row, query in enumerate(queries):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            doc_ids, similarity_scores, _, _ = self.rank_candidates(scores.indices[start:end], scores.data[start:end],
+                                                                    ranking, max_results)
+            results = self.make_results(doc_ids, similarity_scores)
+            if snippets:
+                results = self.add_snippets(results, query, highlight_offsets)
+            batch.append(results)
+        return batch
     
-    def get_snippet(self, content, query, max_length=200):
-        """Extract relevant snippet from content"""
-        query_words = query.lower().split()
-        content_lower = content.lower()
+    def rank_hits(self, query, ranking='tfidf', limit=None):
+        """Documents matching query, best first, as (doc_ids, similarity scores, final scores, total hits)
         
-        # Find the best position to start the snippet
-        best_pos = 0
-        best_score = 0
+        Ties on the final score are broken by doc id, so the order is total
+        and a page can be found again from the last hit before it. With a
+        limit only the best limit hits are ranked and returned, but total
+        hits still counts all of them.
+        """
+        if ranking not in RANKINGS:
+            raise ValueError(f"Unknown ranking: {ranking}")
+        if not self.documents or self.inverted_index is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0), 0
         
-        for i in range(0, len(content) - max_length, 50):
-            snippet = content_lower[i:i + max_length]
-            score = sum(1 for word in query_words if word in snippet)
-            if score > best_score:
-                best_score = score
-                best_pos = i
+        index, query_vector = self.vectorize_queries([self.preprocess_text(query)], ranking)
+        doc_ids, similarity_scores = index.score(query_vector.indices, query_vector.data)
+        return self.rank_candidates(doc_ids, similarity_scores, ranking, limit)
+    
+    def rank_candidates(self, doc_ids, similarity_scores, ranking='tfidf', limit=None):
+        """Rank scored documents into rank_hits() output
         
-        snippet = content[best_pos:best_pos + max_length]
+        Documents at or below the ranking's minimum score are dropped and
+        the priors are applied to all the others before any are cut, so
+        search(), search_batch() and rank_hits() agree on the order.
+        """
+        keep = similarity_scores > MIN_SCORES[ranking]
+        doc_ids = doc_ids[keep]
+        similarity_scores = similarity_scores[keep]
+        final_scores = similarity_scores * self.priors[doc_ids]
+        total = len(doc_ids)
+        if limit is not None and limit < total:
+            # Keep every hit tied with the limit-th so ties still go by doc id
+            threshold = np.partition(final_scores, -limit)[-limit] if limit > 0 else np.inf
+            best = final_scores >= threshold
+            doc_ids, similarity_scores, final_scores = doc_ids[best], similarity_scores[best], final_scores[best]
+        order = np.lexsort((doc_ids, -final_scores))[:limit]
+        return doc_ids[order], similarity_scores[order], final_scores[order], total
+    
+    def page_start(self, hits, cursor=None, offset=0):
+        """Position in rank_hits() output of the hit after cursor, or offset without one"""
+        if cursor is None:
+            return offset
+        doc_ids, _, final_scores, _ = hits
+        final_score, doc_id = decode_cursor(cursor)
+        # Hits with the cursor's score are ordered by doc id
+        negated = -final_scores
+        low = np.searchsorted(negated, -final_score, side='left')
+        high = np.searchsorted(negated, -final_score, side='right')
+        return int(low + np.searchsorted(doc_ids[low:high], doc_id, side='right'))
+    
+    def covers_page(self, hits, page_size=10, cursor=None, offset=0):
+        """Whether hits, which may be a limited prefix, hold the whole page"""
+        doc_ids, _, _, total = hits
+        return len(doc_ids) == total or self.page_start(hits, cursor, offset) + page_size <= len(doc_ids)
+    
+    def page_results(self, hits, page_size=10, cursor=None, offset=0):
+        """One page of result dicts from rank_hits() output, and the cursor of the next page
         
-        # Highlight query terms (basic implementation)
-        for word in query_words:
-            pattern = re.compile(re.escape(word), re.IGNORECASE)
-            snippet = pattern.sub(f'**{word}**', snippet)
+        The page starts after cursor if one is given, otherwise at offset.
+        The next cursor is None on the last page.
+        """
+        if page_size < 1:
+            raise ValueError("Page size must be at least 1")
+        doc_ids, similarity_scores, final_scores, total = hits
+        start = self.page_start(hits, cursor, offset)
+        end = min(start + page_size, len(doc_ids))
+        results = self.make_results(doc_ids[start:end], similarity_scores[start:end])
+        next_cursor = None
+        if start < end < total:
+            next_cursor = encode_cursor(float(final_scores[end - 1]), int(doc_ids[end - 1]))
+        return results, next_cursor
+    
+    def vectorize_queries(self, processed_queries, ranking='tfidf'):
+        """Return the index for ranking and a queries x terms matrix to score against it"""
+        if ranking == 'bm25':
+            return self.bm25_index, self.bm25_scorer.query_weights(processed_queries)
+        # Transform queries using the same vectorizer
+        return self.inverted_index, self.tfidf_vectorizer.transform(processed_queries)
+    
+    def make_results(self, doc_ids, similarity_scores):
+        """Result dicts for documents in the given order"""
+        page_ranks = self.priors[doc_ids]
+        final_scores = similarity_scores * page_ranks
+        return [{
+            'url': self.document_urls[doc_ids[i]],
+            'title': self.document_titles[doc_ids[i]],
+            'similarity_score': float(similarity_scores[i]),
+            'page_rank': float(page_ranks[i]),
+            'final_score': float(final_scores[i])
+        } for i in range(len(doc_ids))]
+    
+    def add_snippets(self, results, query, highlight_offsets=False):
+        """Return copies of results with a content snippet for query
         
-        return snippet.strip() + ('...' if len(content) > best_pos + max_length else '')
+        With highlight_offsets=True the snippet is left unmarked and the
+        [start, end] offsets of the query words are given in 'highlights'.
+        """
+        contents = self.documents.get_by_urls([result['url'] for result in results])
+        with_snippets = []
+        for result, content in zip(results, contents):
+            result = dict(result)
+            if highlight_offsets:
+                result['content_snippet'], result['highlights'] = make_snippet(content, query, offsets=True)
+            else:
+                result['content_snippet'] = make_snippet(content, query)
+            with_snippets.append(result)
+        return with_snippets
+    
+    def get_snippet(self, content, query, max_length=200):
+        """Extract relevant snippet from content"""
+        return make_snippet(content, query, max_length)
     
     def suggest_spelling(self, query):
-        """Basic spelling suggestion based on document terms"""
-        if not hasattr(self.tfidf_vectorizer, 'vocabulary_'):
+        """Suggest indexed terms close to query words that are not in the index"""
+        if self.inverted_index is None:
             return []
         
-        vocabulary = list(self.tfidf_vectorizer.vocabulary_.keys())
-        query_words = query.lower().split()
+        spelling_index = self.get_spelling_index()
         suggestions = []
-        
-        for word in query_words:
-            if word not in vocabulary:
-                # Find similar words using edit distance
-                similar_words = []
-                for vocab_word in vocabulary:
-                    if abs(len(word) - len(vocab_word)) <= 2:
-                        # Simple edit distance check
-                        if self.edit_distance(word, vocab_word) <= 2:
-                            similar_words.append(vocab_word)
-                
-                if similar_words:
-                    suggestions.extend(similar_words[:3])
+        for word in query.lower().split():
+            if word not in spelling_index:
+                suggestions.extend(spelling_index.lookup(word, max_results=3))
         
         return suggestions
     
+    def get_spelling_index(self):
+        """Return the spelling index for the current vocabulary, building it once if needed"""
+        spelling_index = self.spelling_index
+        if spelling_index is None:
+            with self.spelling_lock:
+                spelling_index = self.spelling_index
+                if spelling_index is None:
+                    spelling_index = self.build_spelling_index()
+                    self.spelling_index = spelling_index
+        return spelling_index
+    
+    def build_spelling_index(self):
+        """Build a spelling index for the current vocabulary, ranked by document frequency"""
+        terms = [None] * len(self.tfidf_vectorizer.vocabulary_)
+        for term, column in self.tfidf_vectorizer.vocabulary_.items():
+            terms[column] = term
+        return SpellingIndex.build(terms, self.inverted_index.doc_freqs())
+    
+    def complete(self, prefix, limit=10):
+        """Complete a partially typed query from title words and titles"""
+        if self.inverted_index is None:
+            return []
+        return self.get_query_completer().complete(prefix, limit)
+    
+    def get_query_completer(self):
+        """Return the completion index for the current titles, building it once per index version
+        
+        Words are taken from document titles and weighted by how many
+        documents contain their stem, so common indexed terms come first.
+        """
+        version = self.index_version
+        built = self.query_completer
+        if built is not None and built[0] == version:
+            return built[1]
+        with self.completer_lock:
+            built = self.query_completer
+            if built is not None and built[0] == version:
+                return built[1]
+            vocabulary = self.tfidf_vectorizer.vocabulary_
+            doc_freqs = self.inverted_index.doc_freqs()
+            word_weights = {}
+            for title in self.document_titles:
+                for word in re.findall(r'[a-z0-9]+', title.lower()):
+                    if word in word_weights or word in self.stop_words or len(word) <= 2:
+                        continue
+                    column = vocabulary.get(self.stemmer.stem(word))
+                    word_weights[word] = int(doc_freqs[column]) if column is not None else 0
+            completer = QueryCompleter(word_weights, self.document_titles)
+            self.query_completer = (version, completer)
+        return completer
+    
     def edit_distance(self, s1, s2):
         """Calculate edit distance between two strings"""
         if len(s1) < len(s2):
@@ -0,0 +1,233 @@
+"""
+Segmented, incrementally updatable index.
+
+The index built by SearchEngine.build_index becomes the first immutable
+segment. Pages stored after that are added to a small in-memory segment
+that is searchable immediately. When it reaches ``memtable_limit``
+documents it is flushed into an immutable segment, and adjacent segments
+of similar size are merged (LSM-style) so the number of segments stays
+logarithmic in the number of added pages. Merges run in a background
+thread and only take the lock to swap the merged segment in, so queries
+keep running on the old segments meanwhile. A page replaced by a later
+``INSERT OR REPLACE`` keeps its old doc id as a tombstone: it is filtered
+out of results and its postings are dropped at the next merge.
+
+New documents are weighted with the vocabulary and IDF of the last full
+build; terms outside that vocabulary are ignored until the next rebuild.
+"""
+
+import threading
+
+import numpy as np
+from scipy import sparse
+
+from inverted_index import InvertedIndex
+
+
+class Segment:
+    """An immutable inverted index covering doc ids [doc_offset, doc_offset + num_docs)"""
+
+    def __init__(self, index, doc_offset):
+        self.index = index
+        self.doc_offset = doc_offset
+
+    @property
+    def num_docs(self):
+        return self.index.num_docs
+
+
+class SegmentedIndex:
+    """Immutable segments plus an in-memory segment for new documents"""
+
+    def __init__(self, base_index, memtable_limit=1000, merge_factor=4):
+        self.memtable_limit = memtable_limit
+        self.merge_factor = merge_factor
+        self.num_terms = base_index.num_terms
+        self.segments = [Segment(base_index, 0)]
+        self.deleted = np.zeros(base_index.num_docs, dtype=bool)
+        self.num_deleted = 0
+        self.memtable_offset = base_index.num_docs
+        self.memtable_rows = []
+        self.memtable_segment = None
+        self.lock = threading.Lock()
+        self.merging = False
+        self.merge_thread = None
+
+    @property
+    def num_docs(self):
+        return self.memtable_offset + len(self.memtable_rows)
+
+    def add(self, doc_id, row):
+        """Add a 1 x terms sparse row for the next doc id"""
+        with self.lock:
+            if doc_id != self.num_docs:
+                raise ValueError(f"Expected doc id {self.num_docs}, got {doc_id}")
+            self.memtable_rows.append(sparse.csr_matrix(row))
+            self.memtable_segment = None
+            if len(self.deleted) <= doc_id:
+                self.deleted = np.concatenate([self.deleted, np.zeros(max(doc_id + 1, len(self.deleted)), dtype=bool)])
+            if len(self.memtable_rows) >= self.memtable_limit:
+                self._flush()
+
+    def delete(self, doc_id):
+        """Mark a document as deleted (tombstone)"""
+        with self.lock:
+            if not self.deleted[doc_id]:
+                self.deleted[doc_id] = True
+                self.num_deleted += 1
+
+    def flush(self):
+        """Turn the in-memory segment into an immutable one"""
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if not self.memtable_rows:
+            return
+        rows = sparse.vstack(self.memtable_rows, format='csr')
+        self.segments = self.segments + [Segment(InvertedIndex.from_matrix(rows), self.memtable_offset)]
+        self.memtable_offset += rows.shape[0]
+        self.memtable_rows = []
+        self.memtable_segment = None
+
+        if not self.merging:
+            self.merging = True
+            self.merge_thread = threading.Thread(target=self._merge_segments, name='segment-merge', daemon=True)
+            self.merge_thread.start()
+
+    def wait_for_merges(self):
+        """Block until background merges have finished"""
+        thread = self.merge_thread
+        if thread is not None:
+            thread.join()
+
+    def _merge_candidate(self):
+        """Newest adjacent pair of segments of comparable size, or None"""
+        for position in range(len(self.segments) - 2, -1, -1):
+            older, newer = self.segments[position], self.segments[position + 1]
+            if newer.num_docs * self.merge_factor >= older.num_docs:
+                return older, newer
+        return None
+
+    def _merge_segments(self):
+        """Merge segments of comparable size until none are left (merge thread)"""
+        while True:
+            with self.lock:
+                pair = self._merge_candidate()
+                if pair is None:
+                    self.merging = False
+                    return
+            older, newer = pair
+            merged = self._merge(older, newer)
+            with self.lock:
+                # Flushes only append, so the pair is still adjacent
+                position = self.segments.index(older)
+                self.segments = self.segments[:position] + [merged] + self.segments[position + 2:]
+
+    def _merge(self, older, newer):
+        """Merge two adjacent segments, dropping the postings of deleted documents"""
+        matrix = sparse.vstack([older.index.to_matrix(), newer.index.to_matrix()], format='csr')
+        end = older.doc_offset + matrix.shape[0]
+        live = ~self.deleted[older.doc_offset:end]
+        matrix = sparse.diags(live.astype(matrix.dtype)) @ matrix
+        matrix.eliminate_zeros()
+        return Segment(InvertedIndex.from_matrix(matrix), older.doc_offset)
+
+    def snapshot(self):
+        """Return the segments to search, including the in-memory one"""
+        with self.lock:
+            segments = list(self.segments)
+            if self.memtable_rows:
+                if self.memtable_segment is None:
+                    rows = sparse.vstack(self.memtable_rows, format='csr')
+                    self.memtable_segment = Segment(InvertedIndex.from_matrix(rows), self.memtable_offset)
+                segments.append(self.memtable_segment)
+            return segments, self.deleted
+
+    def doc_freqs(self):
+        """Documents containing each term, summed over segments (tombstones included)"""
+        segments, _ = self.snapshot()
+        return sum(np.asarray(segment.index.doc_freqs, dtype=np.int64) for segment in segments)
+    
+    def score(self, term_ids, query_weights):
+        """Term-at-a-time scores over every segment, skipping deleted documents"""
+        segments, deleted = self.snapshot()
+        doc_parts = []
+        score_parts = []
+        for segment in segments:
+            doc_ids, scores = segment.index.score(term_ids, query_weights)
+            doc_ids = doc_ids + segment.doc_offset
+            live = ~deleted[doc_ids]
+            doc_parts.append(doc_ids[live])
+            score_parts.append(scores[live])
+        return np.concatenate(doc_parts), np.concatenate(score_parts)
+
+    def score_budget(self, term_ids, query_weights, max_postings=None, deadline=None):
+        """score() under a posting and time budget shared by the segments
+        
+        The posting budget is split between segments in proportion to their
+        size. Returns doc ids, scores, postings scored and whether every
+        posting was scored.
+        """
+        segments, deleted = self.snapshot()
+        total_docs = max(sum(segment.num_docs for segment in segments), 1)
+        doc_parts = []
+        score_parts = []
+        postings = 0
+        exact = True
+        for segment in segments:
+            share = None
+            if max_postings is not None:
+                share = max(1, max_postings * segment.num_docs // total_docs)
+            doc_ids, scores, scored, complete = segment.index.score_budget(term_ids, query_weights, share, deadline)
+            doc_ids = doc_ids + segment.doc_offset
+            live = ~deleted[doc_ids]
+            doc_parts.append(doc_ids[live])
+            score_parts.append(scores[live])
+            postings += scored
+            exact = exact and complete
+        return np.concatenate(doc_parts), np.concatenate(score_parts), postings, exact
+
+    def score_batch(self, query_matrix):
+        """Scores of many queries at once, as a queries x docs CSR matrix
+        
+        Only the postings of terms in some query are decoded, into a
+        temporary terms x docs matrix per segment that is scored with one
+        sparse-sparse product; deleted documents get no entry.
+        """
+        segments, deleted = self.snapshot()
+        query_matrix = sparse.csr_matrix(query_matrix)
+        terms = np.unique(query_matrix.indices)
+        queries = query_matrix[:, terms]
+        scores = sparse.hstack([queries @ segment.index.term_rows(terms) for segment in segments], format='csr')
+        if deleted[:scores.shape[1]].any():
+            scores = scores @ sparse.diags((~deleted[:scores.shape[1]]).astype(scores.dtype))
+            scores = scores.tocsr()
+            scores.eliminate_zeros()
+        return scores
+    
+    def top_k(self, term_ids, query_weights, k, doc_weights=None):
+        """MaxScore top-k per segment, merged into a global top-k
+        
+        doc_weights, indexed by global doc id, weight the scores as in
+        InvertedIndex.top_k; ties go to the lower doc id.
+        """
+        segments, deleted = self.snapshot()
+        doc_parts = []
+        score_parts = []
+        for segment in segments:
+            # Ask for extra results so tombstones cannot push live documents out
+            end = segment.doc_offset + segment.num_docs
+            extra = int(deleted[segment.doc_offset:end].sum())
+            weights = None if doc_weights is None else doc_weights[segment.doc_offset:end]
+            doc_ids, scores = segment.index.top_k(term_ids, query_weights, k + extra, weights)
+            doc_ids = doc_ids + segment.doc_offset
+            live = ~deleted[doc_ids]
+            doc_parts.append(doc_ids[live])
+            score_parts.append(scores[live])
+
+        doc_ids = np.concatenate(doc_parts)
+        scores = np.concatenate(score_parts)
+        weighted = scores if doc_weights is None else scores * doc_weights[doc_ids]
+        ranked = np.lexsort((doc_ids, -weighted))[:k]
+        return doc_ids[ranked], scores[ranked]
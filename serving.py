@@ -0,0 +1,130 @@
+"""
+Production serving of the web app with admission control.
+
+HTTP is handled by waitress, a maintained pure-Python WSGI server. Its
+threads hand every request to ``AdmissionControl``, a WSGI middleware that
+runs the app (the Flask app in web_app, where the scoring happens) on a
+fixed pool of ``workers`` threads and bounds the work it takes on:
+
+- admission control: at most ``workers + max_pending`` requests are
+  running or waiting for a worker; any more are answered 503 at once
+  instead of being queued
+- per-request timeouts: a request that has not finished ``timeout``
+  seconds after admission is answered 503; if it has not started yet it
+  is dropped from the queue
+
+A request that times out while running still holds its worker until it
+returns, and keeps counting against admission until then, so the limits
+reflect the work actually in progress.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from waitress.server import create_server as create_waitress_server
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+# waitress threads beyond the admitted requests, so overload is still
+# answered with a prompt 503 while every admitted request holds a thread
+SPARE_THREADS = 4
+
+
+class AdmissionControl:
+    """WSGI middleware that runs an app on a bounded thread pool"""
+
+    def __init__(self, app, workers=4, max_pending=32, timeout=5.0):
+        self.app = app
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='wsgi')
+        self.lock = threading.Lock()
+        self.active = 0
+        self.served = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def __call__(self, environ, start_response):
+        with self.lock:
+            if self.active >= self.workers + self.max_pending:
+                self.rejected += 1
+                return self._unavailable(start_response, 'Server overloaded, try again later')
+            self.active += 1
+
+        future = self.pool.submit(self._call_app, environ)
+        # Released when the app actually returns, not when the client gives up on it
+        future.add_done_callback(self._release)
+        try:
+            status, headers, body = future.result(self.timeout)
+        except FutureTimeoutError:
+            future.cancel()  # Only succeeds if it is still waiting for a worker
+            with self.lock:
+                self.timed_out += 1
+            return self._unavailable(start_response, 'Request timed out, try again later')
+        with self.lock:
+            self.served += 1
+        start_response(status, headers)
+        return [body]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'active': self.active,
+                'served': self.served,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+            }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, future):
+        with self.lock:
+            self.active -= 1
+
+    def _call_app(self, environ):
+        """Call the WSGI app and collect its whole response (runs on a pool thread)"""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+
+        result = self.app(environ, start_response)
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], body
+
+    def _unavailable(self, start_response, message):
+        headers = [('Content-Type', 'text/plain; charset=utf-8'), ('Retry-After', '1')]
+        start_response('503 Service Unavailable', headers)
+        return [(message + '\n').encode()]
+
+
+def create_server(admission, host='127.0.0.1', port=5000):
+    """A waitress server for an AdmissionControl-wrapped app; run() serves, close() stops it"""
+    return create_waitress_server(admission, host=host, port=port,
+                                  threads=admission.workers + admission.max_pending + SPARE_THREADS,
+                                  max_request_header_size=MAX_HEADER_BYTES,
+                                  max_request_body_size=MAX_BODY_BYTES)
+
+
+def serve(app, host='127.0.0.1', port=5000, workers=4, max_pending=32, timeout=5.0):
+    """Serve app until the process is interrupted"""
+    admission = AdmissionControl(app, workers, max_pending, timeout)
+    server = create_server(admission, host, port)
+    print(f"Serving on http://{host}:{server.effective_port} with {workers} workers, "
+          f"{max_pending} pending, {timeout}s timeout")
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        admission.shutdown()
+    print(f"Server stopped: {admission.stats()}")
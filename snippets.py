@@ -0,0 +1,106 @@
+"""
+Query-biased snippets built from term offsets.
+
+The offsets of every query word in a document are found with one string
+scan per word, and the best window is chosen from those offsets alone:
+each occurrence can only fall inside the few window starts (multiples of
+``WINDOW_STEP``) that cover it, so scoring costs time proportional to the
+number of occurrences rather than to the length of the document. Short
+pages with more occurrences than windows just test every window. The
+chosen window is highlighted in a single pass over a regex alternation of
+the query words, and the highlights can be returned as offsets instead of
+being written into the text.
+"""
+
+import re
+
+WINDOW_STEP = 50
+
+
+def term_offsets(content_lower, words):
+    """Map each word to the (start, end) offsets of its occurrences in lowercased content"""
+    offsets = {}
+    for word in words:
+        spans = []
+        start = content_lower.find(word)
+        while start >= 0:
+            spans.append((start, start + len(word)))
+            start = content_lower.find(word, start + 1)
+        offsets[word] = spans
+    return offsets
+
+
+def best_window(content, words, max_length=200, step=WINDOW_STEP):
+    """Start of the window covering the most distinct query words, earliest on ties"""
+    last_start = len(content) - max_length - 1
+    if last_start < 0 or not words:
+        return 0
+    content_lower = content.lower()
+    if len(content_lower) == len(content):
+        occurrences = sum(content_lower.count(word) for word in words)
+        if occurrences >= last_start // step + 1:
+            # Short pages dense in query words: testing every window is cheaper
+            return scan_windows(content_lower, words, max_length, step)
+        offsets = term_offsets(content_lower, words)
+    else:
+        # Lowercasing changed some lengths, so offsets must come from the original
+        offsets = {word: [match.span() for match in re.finditer(re.escape(word), content, re.IGNORECASE)]
+                   for word in words}
+
+    # Number of distinct words inside each window that contains any
+    scores = {}
+    for spans in offsets.values():
+        covered = {window for start, end in spans
+                   for window in range(max(0, (end - max_length + step - 1) // step * step),
+                                       min(start, last_start) + 1, step)}
+        for window in covered:
+            scores[window] = scores.get(window, 0) + 1
+    if not scores:
+        return 0
+    best_score = max(scores.values())
+    return min(window for window, score in scores.items() if score == best_score)
+
+
+def scan_windows(content_lower, words, max_length=200, step=WINDOW_STEP):
+    """best_window by testing each window for each word"""
+    best_pos = 0
+    best_score = 0
+    for i in range(0, len(content_lower) - max_length, step):
+        window = content_lower[i:i + max_length]
+        score = sum(1 for word in words if word in window)
+        if score > best_score:
+            best_score = score
+            best_pos = i
+    return best_pos
+
+
+def highlight_offsets(text, words):
+    """Non-overlapping (start, end) offsets of query words in text, longest match first"""
+    if not words:
+        return []
+    pattern = '|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True))
+    return [match.span() for match in re.finditer(pattern, text, re.IGNORECASE)]
+
+
+def make_snippet(content, query, max_length=200, offsets=False):
+    """Best passage of content for query, with query words marked as **word**
+
+    With offsets=True, return (snippet, highlights) instead, where highlights
+    is a list of [start, end] offsets into the unmarked snippet.
+    """
+    words = list(dict.fromkeys(query.lower().split()))
+    start = best_window(content, words, max_length)
+    snippet = content[start:start + max_length].strip()
+    highlights = highlight_offsets(snippet, words)
+    suffix = '...' if len(content) > start + max_length else ''
+    if offsets:
+        return snippet + suffix, [[begin, end] for begin, end in highlights]
+
+    parts = []
+    position = 0
+    for begin, end in highlights:
+        parts.append(snippet[position:begin])
+        parts.append(f'**{snippet[begin:end]}**')
+        position = end
+    parts.append(snippet[position:])
+    return ''.join(parts) + suffix
@@ -0,0 +1,114 @@
+"""
+Spelling suggestions with a symmetric-delete index (as in SymSpell).
+
+Every vocabulary term is stored under each string obtained by deleting
+up to ``max_distance`` characters from it. Two words within edit distance
+``max_distance`` always share such a delete, so a lookup only generates
+the deletes of the query word, collects the terms stored under them and
+verifies those few candidates with a bounded edit distance, instead of
+comparing the word with the whole vocabulary.
+"""
+
+from bisect import bisect_left
+from itertools import chain
+
+import numpy as np
+
+
+def deletes(word, max_distance):
+    """Every string obtained by deleting up to max_distance characters"""
+    results = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))}
+        results |= frontier
+    return results
+
+
+def bounded_edit_distance(s1, s2, max_distance):
+    """Levenshtein distance, or max_distance + 1 once it is known to be larger"""
+    if abs(len(s1) - len(s2)) > max_distance:
+        return max_distance + 1
+    previous_row = list(range(len(s2) + 1))
+    for i, c1 in enumerate(s1):
+        current_row = [i + 1]
+        for j, c2 in enumerate(s2):
+            current_row.append(min(previous_row[j + 1] + 1, current_row[j] + 1, previous_row[j] + (c1 != c2)))
+        if min(current_row) > max_distance:
+            return max_distance + 1
+        previous_row = current_row
+    return previous_row[-1]
+
+
+class SpellingIndex:
+    """Symmetric-delete lookup of vocabulary terms, ranked by frequency
+
+    The delete map is kept as arrays so it can be saved with the index and
+    memory-mapped on load: ``keys`` is the sorted sequence of deletes and
+    ``entry_terms[entry_offsets[i]:entry_offsets[i + 1]]`` are the ids of
+    the terms stored under ``keys[i]``.
+    """
+
+    ARRAY_NAMES = ('frequencies', 'entry_offsets', 'entry_terms')
+
+    def __init__(self, terms, keys, frequencies, entry_offsets, entry_terms, max_distance=2):
+        self.terms = terms
+        self.keys = keys
+        self.frequencies = frequencies
+        self.entry_offsets = entry_offsets
+        self.entry_terms = entry_terms
+        self.max_distance = max_distance
+        # Bigram features contain a space and never match a single word
+        self.term_ids = {term: term_id for term_id, term in enumerate(terms) if ' ' not in term}
+
+    @classmethod
+    def build(cls, terms, frequencies, max_distance=2):
+        """Build the delete map of terms, whose frequencies are given by term id"""
+        delete_map = {}
+        for term_id, term in enumerate(terms):
+            if ' ' in term:
+                continue
+            for variant in deletes(term, max_distance):
+                delete_map.setdefault(variant, []).append(term_id)
+
+        keys = sorted(delete_map)
+        entry_offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([len(delete_map[key]) for key in keys], out=entry_offsets[1:])
+        entry_terms = np.fromiter(chain.from_iterable(delete_map[key] for key in keys),
+                                  dtype=np.int32, count=entry_offsets[-1])
+        return cls(terms, keys, np.asarray(frequencies, dtype=np.int64), entry_offsets, entry_terms,
+                   max_distance)
+
+    @classmethod
+    def from_arrays(cls, terms, keys, arrays, max_distance=2):
+        """Rebuild an index from its keys and the arrays returned by to_arrays"""
+        return cls(terms, keys, *(arrays[name] for name in cls.ARRAY_NAMES), max_distance=max_distance)
+
+    def to_arrays(self):
+        """Return the arrays backing the delete map, keyed by name"""
+        return {name: getattr(self, name) for name in self.ARRAY_NAMES}
+
+    def __contains__(self, word):
+        return word in self.term_ids
+
+    def candidates(self, variant):
+        """Ids of the terms stored under a delete"""
+        i = bisect_left(self.keys, variant)
+        if i == len(self.keys) or self.keys[i] != variant:
+            return ()
+        return self.entry_terms[self.entry_offsets[i]:self.entry_offsets[i + 1]].tolist()
+
+    def lookup(self, word, max_results=3):
+        """Terms within max_distance of word, closest and most frequent first"""
+        candidates = set()
+        for variant in deletes(word, self.max_distance):
+            candidates.update(self.candidates(variant))
+
+        matches = []
+        for term_id in candidates:
+            term = self.terms[term_id]
+            distance = bounded_edit_distance(word, term, self.max_distance)
+            if distance <= self.max_distance:
+                matches.append((distance, -int(self.frequencies[term_id]), term))
+        matches.sort()
+        return [term for _, _, term in matches[:max_results]]
@@ -0,0 +1,192 @@
+"""
+Batched SQLite writer for crawled pages.
+
+A single background thread owns one connection to the database and turns
+queued pages into ``executemany`` transactions of up to ``batch_size``
+rows, so a crawl pays one commit per batch instead of one connection,
+commit and fsync per page. The connection runs in WAL mode so readers
+(e.g. a running web server) are not blocked while the crawl writes.
+
+If the writer thread fails on anything but a SQLite error for a single
+page, it keeps taking pages and drops them, so flush() and close() still
+return; they and put() then raise the failure.
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+
+INSERT_PAGE = '''
+    INSERT OR REPLACE INTO pages (url, title, content, keywords)
+    VALUES (?, ?, ?, ?)
+'''
+
+INSERT_VALIDATORS = '''
+    INSERT OR REPLACE INTO page_validators (url, etag, last_modified)
+    VALUES (?, ?, ?)
+'''
+
+# Outlinks of a page replace those recorded when it was last stored
+DELETE_LINKS = 'DELETE FROM links WHERE source = ?'
+
+INSERT_LINK = 'INSERT OR IGNORE INTO links (source, target) VALUES (?, ?)'
+
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-65536',
+)
+
+_STOP = object()
+
+
+class PageWriter:
+    """Queue + background thread that batches page inserts"""
+
+    def __init__(self, db_path, batch_size=100, flush_interval=1.0, max_queue=10000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.rows_written = 0
+        self.batches = 0
+        self.write_seconds = 0.0
+        self.errors = 0
+        # What stopped the writer thread from writing, if anything
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name='page-writer', daemon=True)
+        self.thread.start()
+
+    def put(self, url, title, content, keywords_str, etag=None, last_modified=None, links=None):
+        """Queue a page for insertion; blocks only if the queue is full
+        
+        links, if given, are the page's outlink targets and replace the
+        ones stored for the URL before.
+        """
+        self._check()
+        self.queue.put((url, title, content, keywords_str, etag, last_modified, links))
+
+    def flush(self):
+        """Wait until every queued page has been committed"""
+        self.queue.join()
+        self._check()
+
+    def close(self):
+        """Commit outstanding pages and stop the writer thread"""
+        self.queue.put(_STOP)
+        self.thread.join()
+        self._check()
+
+    def _check(self):
+        if self.error is not None:
+            raise RuntimeError(f"Page writer failed: {self.error}") from self.error
+
+    def stats(self):
+        """Return rows written, transactions and throughput"""
+        rate = self.rows_written / self.write_seconds if self.write_seconds else 0.0
+        return {
+            'rows': self.rows_written,
+            'batches': self.batches,
+            'errors': self.errors,
+            'write_seconds': self.write_seconds,
+            'rows_per_sec': rate,
+        }
+
+    def _run(self):
+        conn = None
+        try:
+            conn = self._connect()
+        except Exception as e:
+            self._fail(e)
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            try:
+                if self.error is not None:
+                    # Dropped, so that flush() and close() still return
+                    self.errors += len(batch)
+                elif batch:
+                    self._write(conn, batch)
+            except Exception as e:
+                self.errors += len(batch)
+                self._fail(e)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+        if conn is not None:
+            conn.close()
+
+    def _fail(self, error):
+        self.error = error
+        print(f"Page writer failed, dropping pages from now on: {error}")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        for pragma in PRAGMAS:
+            try:
+                conn.execute(pragma)
+            except sqlite3.Error as e:
+                # Switching to WAL fails while another connection is writing;
+                # the pages are still written, just with the current journal
+                print(f"Error applying {pragma}: {e}")
+        return conn
+
+    def _next_batch(self):
+        """Up to batch_size queued pages and whether close() was called
+
+        Waits up to flush_interval for the first page, then takes only
+        pages that are already queued.
+        """
+        try:
+            item = self.queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return [], False
+
+        batch = []
+        while item is not _STOP:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                return batch, False
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                return batch, False
+        self.queue.task_done()
+        return batch, True
+
+    def _write(self, conn, batch):
+        start = time.perf_counter()
+        try:
+            with conn:
+                conn.executemany(INSERT_PAGE, [row[:4] for row in batch])
+                conn.executemany(INSERT_VALIDATORS, [(row[0], row[4], row[5]) for row in batch])
+                write_links(conn, batch)
+        except sqlite3.Error as e:
+            # Retry row by row so one bad page does not lose the whole batch
+            print(f"Error storing batch of {len(batch)} pages: {e}")
+            for row in batch:
+                try:
+                    with conn:
+                        conn.execute(INSERT_PAGE, row[:4])
+                        conn.execute(INSERT_VALIDATORS, (row[0], row[4], row[5]))
+                        write_links(conn, [row])
+                except sqlite3.Error as row_error:
+                    self.errors += 1
+                    print(f"Error storing {row[0]}: {row_error}")
+                    continue
+                self.rows_written += 1
+        else:
+            self.rows_written += len(batch)
+        self.batches += 1
+        self.write_seconds += time.perf_counter() - start
+
+
+def write_links(conn, rows):
+    """Replace the stored outlinks of the rows that carry them"""
+    rows = [row for row in rows if row[6] is not None]
+    if not rows:
+        return
+    conn.executemany(DELETE_LINKS, [(row[0],) for row in rows])
+    conn.executemany(INSERT_LINK, [(row[0], target) for row in rows for target in row[6]])
@@ -4,11 +4,30 @@ Basic tests for the search engine functionality
 """
 
 import os
+import re
+import shutil
 import sqlite3
 import sys
 import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from crawler import WebCrawler
+import search_engine
 from search_engine import SearchEngine
+from inverted_index import InvertedIndex, decode_gaps, encode_gaps
+from storage import PageWriter
+from frontier import Frontier, VisitedSet, normalize_url
+from query_cache import QueryCache
+from index_manager import IndexManager
+from index_store import index_lock, load_index
+from autocomplete import CompletionIndex
+from pagerank import compute_page_ranks, load_page_ranks
+from serving import AdmissionControl, create_server
+import web_app
 
 def setup_test_database(db_path):
     """Setup a test database with sample data"""
@@ -40,6 +59,20 @@ def setup_test_database(db_path):
     
     print(f"Test database created with {len(test_documents)} documents")
 
+@contextmanager
+def temporary_database():
+    """Path of a temporary database holding the test documents, removed afterwards with its index"""
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp_db:
+        db_path = tmp_db.name
+    try:
+        setup_test_database(db_path)
+        yield db_path
+    finally:
+        for suffix in ('', '-wal', '-shm', '.index.lock'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+        shutil.rmtree(db_path + '.index', ignore_errors=True)
+
 def test_search_engine():
     """Test basic search engine functionality"""
     print("Running basic search engine tests...")
@@ -81,8 +114,781 @@ def test_search_engine():
     
     finally:
         # Cleanup
-        if os.path.exists(db_path):
-            os.unlink(db_path)
+        for suffix in ('', '-wal', '-shm', '.index.lock'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+        shutil.rmtree(db_path + '.index', ignore_errors=True)
+
+def test_url_priors():
+    """Test that results are ranked by similarity weighted with precomputed URL priors"""
+    print("Running URL prior tests...")
+    
+    try:
+        import random
+        import numpy as np
+        
+        with temporary_database() as db_path:
+            engine = SearchEngine(db_path)
+            results = engine.search("python programming", max_results=5)
+            assert [r['page_rank'] for r in results] == engine.calculate_page_rank([r['url'] for r in results]), \
+                "Precomputed priors differ from URL scores"
+            assert [r['final_score'] for r in results] == \
+                sorted((r['final_score'] for r in results), reverse=True), "Results not ranked by final score"
+            print(f"✓ {len(results)} results ranked with precomputed priors")
+            
+            # Priors spread as widely as PageRank weights reorder hits far down the similarity order
+            rng = random.Random(0)
+            words = ["python", "web", "flask", "data", "guide", "server", "query", "index"]
+            conn = sqlite3.connect(db_path)
+            conn.executemany('INSERT INTO pages (url, title, content) VALUES (?, ?, ?)',
+                             [(f"http://spread.test/{i}", f"Page {i}", ' '.join(rng.choices(words, k=rng.randint(3, 30))))
+                              for i in range(600)])
+            conn.commit()
+            conn.close()
+            engine = SearchEngine(db_path)
+            engine.priors = np.array([rng.uniform(0.2, 7.6) for _ in engine.priors])
+            queries = ["python", "python web", "flask data"]
+            for ranking in ('tfidf', 'bm25'):
+                batch = engine.search_batch(queries, max_results=10, snippets=False, ranking=ranking)
+                for query, batched in zip(queries, batch):
+                    expected, _ = engine.page_results(engine.rank_hits(query, ranking=ranking), page_size=10)
+                    results = engine.search(query, max_results=10, snippets=False, ranking=ranking)
+                    assert results == expected, f"Search differs from rank_hits for {query!r}"
+                    assert batched == expected, f"Batch search differs from rank_hits for {query!r}"
+                    # MaxScore adds up the same scores in another order
+                    pruned = engine.search(query, max_results=10, retrieval='maxscore', snippets=False, ranking=ranking)
+                    assert [r['url'] for r in pruned] == [r['url'] for r in expected] and \
+                        np.allclose([r['final_score'] for r in pruned], [r['final_score'] for r in expected]), \
+                        f"MaxScore search differs from rank_hits for {query!r}"
+            print("✓ search(), search_batch() and rank_hits() rank with priors alike")
+        
+        print("URL prior tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"URL prior test failed: {e}")
+        return False
+
+def test_maxscore_retrieval():
+    """Test that MaxScore pruning returns the same results as exhaustive scoring"""
+    print("Running MaxScore retrieval tests...")
+    
+    try:
+        with temporary_database() as db_path:
+            engine = SearchEngine(db_path)
+            exhaustive = engine.search("python programming", max_results=5, retrieval='exhaustive')
+            pruned = engine.search("python programming", max_results=5, retrieval='maxscore')
+            assert [r['url'] for r in pruned] == [r['url'] for r in exhaustive], "Retrieval strategies disagree"
+            print("✓ MaxScore retrieval matches exhaustive retrieval")
+        
+        print("MaxScore retrieval tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"MaxScore retrieval test failed: {e}")
+        return False
+
+def test_spelling_suggestions():
+    """Test spelling suggestions from the saved and the lazily built spelling index"""
+    print("Running spelling suggestion tests...")
+    
+    try:
+        with temporary_database() as db_path:
+            engine = SearchEngine(db_path)
+            assert engine.spelling_index is not None, "Spelling index not saved with the index"
+            suggestions = engine.suggest_spelling("pythong")
+            assert suggestions and suggestions[0] == "python", f"Unexpected suggestions: {suggestions}"
+            assert engine.suggest_spelling("python") == [], "Suggestions made for an indexed word"
+            print(f"✓ Spelling suggestions: {suggestions}")
+            
+            # Without a saved index it is built once, by the first lookup
+            lazy_engine = SearchEngine(db_path, use_index_cache=False)
+            assert lazy_engine.spelling_index is None, "Spelling index built eagerly"
+            builds = []
+            build = lazy_engine.build_spelling_index
+            lazy_engine.build_spelling_index = lambda: (builds.append(1), time.sleep(0.1), build())[2]
+            lookups = [threading.Thread(target=lazy_engine.suggest_spelling, args=("pythong",)) for _ in range(4)]
+            for thread in lookups:
+                thread.start()
+            for thread in lookups:
+                thread.join()
+            assert len(builds) == 1, f"Spelling index built {len(builds)} times"
+            assert lazy_engine.suggest_spelling("pythong") == suggestions, "Lazy spelling index differs"
+            print("✓ Spelling index built once without a saved index")
+        
+        print("Spelling suggestion tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Spelling suggestion test failed: {e}")
+        return False
+
+def test_parallel_preprocessing():
+    """Test that preprocessing across worker processes gives the serial output"""
+    print("Running parallel preprocessing tests...")
+    
+    try:
+        with temporary_database() as db_path:
+            engine = SearchEngine(db_path)
+            texts = list(engine.documents) * 100
+            assert engine.preprocess_documents(texts, workers=2) == engine.preprocess_documents(texts, workers=1), \
+                "Parallel preprocessing differs"
+            print("✓ Parallel preprocessing matches serial")
+        
+        print("Parallel preprocessing tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Parallel preprocessing test failed: {e}")
+        return False
+
+def test_fast_analyzer():
+    """Test that the fast analyzer gives the same terms as the NLTK pipeline"""
+    print("Running fast analyzer tests...")
+    
+    try:
+        with temporary_database() as db_path:
+            engine = SearchEngine(db_path)
+            nltk_engine = SearchEngine(db_path, analyzer='nltk')
+            samples = list(engine.documents) + ["You CANNOT, gimme gonna gotta lemme wanna: it's a café x-ray!"]
+            assert [engine.preprocess_text(t) for t in samples] == [nltk_engine.preprocess_text(t) for t in samples], \
+                "Fast analyzer output differs"
+            print("✓ Fast analyzer matches NLTK analyzer")
+        
+        print("Fast analyzer tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Fast analyzer test failed: {e}")
+        return False
+
+def test_document_store():
+    """Test that page contents are read from the database on demand"""
+    print("Running document store tests...")
+    
+    try:
+        with temporary_database() as db_path:
+            engine = SearchEngine(db_path)
+            conn = sqlite3.connect(db_path)
+            stored = [row[0] for row in conn.execute("SELECT content FROM pages ORDER BY id")]
+            conn.close()
+            assert list(engine.documents) == stored, "Streamed contents differ from the database"
+            assert engine.documents.get_many([2, 0]) == [stored[2], stored[0]], "Contents fetched for the wrong documents"
+            engine.add_document("https://example.com/new", "New Page", "Freshly added content")
+            assert list(engine.documents)[-1] == "Freshly added content", "Added document not streamed"
+            print("✓ Document contents streamed from the database")
+        
+        print("Document store tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Document store test failed: {e}")
+        return False
+
+def test_snippets():
+    """Test snippets highlighted as marked text or as offsets, and deferred snippets"""
+    print("Running snippet tests...")
+    
+    try:
+        with temporary_database() as db_path:
+            engine = SearchEngine(db_path)
+            marked = engine.search("python web", max_results=1)[0]['content_snippet']
+            plain = engine.search("python web", max_results=1, highlight_offsets=True)[0]
+            assert "**Python**" in marked and "**web**" in marked, f"Query words not highlighted: {marked}"
+            assert [plain['content_snippet'][start:end].lower() for start, end in plain['highlights']] == \
+                ["web", "python", "web"], "Wrong highlight offsets"
+            assert 'content_snippet' not in engine.search("python", snippets=False)[0], "Snippet not deferred"
+            print("✓ Snippets highlighted")
+        
+        print("Snippet tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Snippet test failed: {e}")
+        return False
+
+def test_bm25_ranking():
+    """Test BM25F ranking, including documents added after it was built"""
+    print("Running BM25F ranking tests...")
+    
+    try:
+        with temporary_database() as db_path:
+            engine = SearchEngine(db_path)
+            bm25 = engine.search("python", max_results=5, ranking='bm25')
+            assert bm25 and bm25[0]['url'] == "http://test1.com", "Title match not ranked first by BM25F"
+            pruned = engine.search("python", max_results=5, ranking='bm25', retrieval='maxscore')
+            assert [r['url'] for r in pruned] == [r['url'] for r in bm25], "BM25F retrieval strategies disagree"
+            engine.add_document("https://example.com/flask", "Flask", "Flask is a web framework")
+            assert engine.search("flask", ranking='bm25')[0]['url'] == "https://example.com/flask", \
+                "Added document not ranked by BM25F"
+            print("✓ BM25F ranking")
+        
+        print("BM25F ranking tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"BM25F ranking test failed: {e}")
+        return False
+
+def test_search_batch():
+    """Test that batched queries match one search() call per query"""
+    print("Running batch search tests...")
+    
+    try:
+        with temporary_database() as db_path:
+            engine = SearchEngine(db_path)
+            engine.add_document("https://example.com/flask", "Flask", "Flask is a web framework")
+            queries = ["python programming", "web", "machine learning data", "nonexistent xyz", "flask"]
+            for ranking in ('tfidf', 'bm25'):
+                batch = engine.search_batch(queries, max_results=5, ranking=ranking)
+                single = [engine.search(query, max_results=5, ranking=ranking) for query in queries]
+                assert [[(r['url'], round(r['final_score'], 6)) for r in results] for results in batch] == \
+                    [[(r['url'], round(r['final_score'], 6)) for r in results] for results in single], \
+                    f"Batched {ranking} results differ"
+            print(f"✓ Batch search matches {len(queries)} single searches")
+        
+        print("Batch search tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Batch search test failed: {e}")
+        return False
+
+def test_cursor_pagination():
+    """Test that cursor pages walk every hit once, ties included"""
+    print("Running cursor pagination tests...")
+    
+    try:
+        with temporary_database() as db_path:
+            engine = SearchEngine(db_path)
+            for i in range(5):
+                engine.add_document(f"https://example.com/tie{i}", "Tie", "Identical python page")
+            hits = engine.rank_hits("python")
+            pages, cursor = [], None
+            while True:
+                page, cursor = engine.page_results(hits, page_size=2, cursor=cursor)
+                pages.extend(r['url'] for r in page)
+                if cursor is None:
+                    break
+            everything, _ = engine.page_results(hits, page_size=len(hits[0]))
+            assert pages == [r['url'] for r in everything] and len(set(pages)) == len(hits[0]) == 7, \
+                "Cursor pages skipped or repeated hits"
+            assert engine.page_results(hits, page_size=3, offset=3)[0] == everything[3:6], "Offset page differs"
+            prefix = engine.rank_hits("python", limit=4)
+            assert prefix[3] == 7 and engine.page_results(prefix, page_size=4)[0] == everything[:4], \
+                "Limited hits are not the best ones"
+            assert engine.covers_page(prefix, 2, offset=2) and not engine.covers_page(prefix, 2, offset=3), \
+                "Wrong page coverage of limited hits"
+            assert everything[0]['final_score'] == engine.search("python", max_results=1)[0]['final_score'], \
+                "Best hit differs from search()"
+            print(f"✓ Cursor pagination over {len(pages)} hits")
+        
+        print("Cursor pagination tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Cursor pagination test failed: {e}")
+        return False
+
+def test_search_budget():
+    """Test that a posting budget stops scoring early and says so"""
+    print("Running search budget tests...")
+    
+    try:
+        with temporary_database() as db_path:
+            engine = SearchEngine(db_path)
+            full, stats = engine.search("python web", snippets=False, with_stats=True)
+            assert stats['exact'] and stats['total_hits'] == len(engine.rank_hits("python web")[0]), \
+                f"Unexpected stats without a budget: {stats}"
+            assert engine.search("python web", snippets=False, max_postings=10 ** 6) == full, \
+                "Ample budget changed results"
+            partial, stats = engine.search("python web", snippets=False, max_postings=1, with_stats=True)
+            assert not stats['exact'] and stats['postings_scored'] < stats['postings_total'], \
+                f"Budget not applied: {stats}"
+            assert stats['total_hits'] >= len(partial) > 0, "No estimate or results under a budget"
+            print(f"✓ Budgeted search scored {stats['postings_scored']} of {stats['postings_total']} postings")
+        
+        print("Search budget tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Search budget test failed: {e}")
+        return False
+
+def test_autocomplete():
+    """Test prefix completion of query words and titles"""
+    print("Running autocomplete tests...")
+    
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp_db:
+        db_path = tmp_db.name
+    
+    try:
+        # Precomputed prefixes must agree with a plain scan
+        words = {f"{a}{b}{c}": (ord(a) * 7 + ord(b) * 3 + ord(c)) % 11
+                 for a in 'abc' for b in 'abc' for c in 'abcd'}
+        index = CompletionIndex(words, top_k=5, scan_limit=2)
+        for prefix in ['a', 'ab', 'abc', 'b', 'cc', 'x']:
+            expected = sorted((w for w in words if w.startswith(prefix)), key=lambda w: (-words[w], w))[:5]
+            assert index.complete(prefix, 5) == expected, f"Wrong completions for {prefix!r}"
+        print(f"✓ {len(index.top)} precomputed prefixes match a full scan")
+        
+        setup_test_database(db_path)
+        engine = SearchEngine(db_path, use_index_cache=False)
+        assert engine.complete("pyth")[0] == "python", "Title word not completed"
+        assert "python programming" in engine.complete("python prog"), "Last word not completed"
+        assert engine.complete("machine learning ") == ["Machine Learning Basics"], "Title not completed"
+        print("✓ Query words and titles completed")
+        
+        # Concurrent first requests build the completer once; added titles rebuild it
+        engine.add_document("http://test4.com", "Zebra Migration Patterns", "Zebras migrate in large herds.")
+        builds = []
+        completer_class = search_engine.QueryCompleter
+        
+        def counting_completer(*args):
+            builds.append(1)
+            time.sleep(0.1)
+            return completer_class(*args)
+        search_engine.QueryCompleter = counting_completer
+        try:
+            lookups = [threading.Thread(target=engine.complete, args=("zeb",)) for _ in range(4)]
+            for thread in lookups:
+                thread.start()
+            for thread in lookups:
+                thread.join()
+        finally:
+            search_engine.QueryCompleter = completer_class
+        assert len(builds) == 1, f"Completer built {len(builds)} times"
+        assert engine.complete("zebra migration ") == ["Zebra Migration Patterns"], "Added title not completed"
+        print("✓ Completer built once and rebuilt for added titles")
+        
+        with serve_web_app(db_path) as client:
+            response = client.get('/api/complete?q=pyth&limit=1')
+            assert response.status_code == 200 and response.get_json()['completions'] == ["python"], \
+                f"Unexpected completions: {response.get_json()}"
+            for limit in ('abc', '0', '-1'):
+                response = client.get(f'/api/complete?q=pyth&limit={limit}')
+                assert response.status_code == 400 and 'limit' in response.get_json()['error'], \
+                    f"limit={limit} not rejected"
+        print("✓ Completion endpoint validates limit")
+        
+        print("Autocomplete tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Autocomplete test failed: {e}")
+        return False
+    
+    finally:
+        for suffix in ('', '-wal', '-shm', '.index.lock'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+        shutil.rmtree(db_path + '.index', ignore_errors=True)
+
+def test_index_cache():
+    """Test that the on-disk index is reused and invalidated correctly"""
+    print("Running index cache tests...")
+    
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp_db:
+        db_path = tmp_db.name
+    
+    try:
+        import numpy as np
+        
+        setup_test_database(db_path)
+        
+        # First start builds the index and writes it next to the database
+        engine = SearchEngine(db_path)
+        assert not engine.index_loaded_from_cache, "Index unexpectedly loaded from cache"
+        assert os.path.isdir(db_path + '.index'), "Index directory not written"
+        expected = engine.search("python programming", max_results=5)
+        
+        # Second start loads the saved index without rebuilding
+        cached_engine = SearchEngine(db_path)
+        assert cached_engine.index_loaded_from_cache, "Saved index was not reused"
+        results = cached_engine.search("python programming", max_results=5)
+        assert [r['url'] for r in results] == [r['url'] for r in expected], "Cached index gave different results"
+        assert cached_engine.search("python programming", max_results=5, ranking='bm25') == \
+            engine.search("python programming", max_results=5, ranking='bm25'), "Cached BM25F index gave different results"
+        print("✓ Saved index reused on startup")
+        
+        # Changing the pages table makes the saved index stale
+        conn = sqlite3.connect(db_path)
+        conn.execute('INSERT INTO pages (url, title, content) VALUES (?, ?, ?)',
+                     ("http://test4.com", "Data Science", "Data science combines statistics and programming."))
+        conn.commit()
+        conn.close()
+        
+        rebuilt_engine = SearchEngine(db_path)
+        assert not rebuilt_engine.index_loaded_from_cache, "Stale index was reused"
+        assert len(rebuilt_engine.document_urls) == 4, "New page missing after rebuild"
+        print("✓ Stale index rebuilt")
+        
+        # A shared engine builds the missing index once, then serves it memory-mapped
+        shutil.rmtree(db_path + '.index')
+        shared_engine = SearchEngine(db_path, shared=True)
+        assert os.path.isdir(db_path + '.index'), "Shared engine did not build the index"
+        assert isinstance(shared_engine.inverted_index.segments[0].index.weights, np.memmap), \
+            "Postings not memory-mapped"
+        assert isinstance(shared_engine.bm25_index.segments[0].index.weights, np.memmap), \
+            "BM25F postings not memory-mapped"
+        assert isinstance(shared_engine.spelling_index.entry_terms, np.memmap), "Spelling index not memory-mapped"
+        assert shared_engine.suggest_spelling("sciense") == ["scienc"], "Shared engine has no spelling index"
+        assert shared_engine.search("data science", max_results=5) == \
+            rebuilt_engine.search("data science", max_results=5), "Shared index gave different results"
+        assert shared_engine.search("data science", max_results=5, ranking='bm25') == \
+            rebuilt_engine.search("data science", max_results=5, ranking='bm25'), "Shared BM25F results differ"
+        assert shared_engine.search_batch(["data science", "python"], max_results=5) == \
+            rebuilt_engine.search_batch(["data science", "python"], max_results=5), "Shared batch results differ"
+        print("✓ Shared index attached read-only")
+        
+        # A rebuild swaps in a new generation while the old one keeps serving
+        def rebuild():
+            SearchEngine(db_path)  # Brings the saved index up to date
+            return SearchEngine(db_path, shared=True)
+        
+        manager = IndexManager(lambda: SearchEngine(db_path, shared=True), rebuild)
+        old_engine = manager.current()
+        conn = sqlite3.connect(db_path)
+        conn.execute('INSERT INTO pages (url, title, content) VALUES (?, ?, ?)',
+                     ("http://test5.com", "Hot Swap", "Zebras are swapped in without a restart."))
+        conn.commit()
+        conn.close()
+        assert manager.rebuild(), "Rebuild did not start"
+        manager.wait()
+        status = manager.status()
+        assert status['state'] == 'idle' and status['generation'] == 2 and status['documents'] == 5, \
+            f"Unexpected rebuild status: {status}"
+        assert manager.current().search("zebras"), "New page missing after hot swap"
+        assert not old_engine.search("zebras") and old_engine.search("data science"), "Old generation changed"
+        print("✓ Rebuilt index hot-swapped")
+        
+        # Loading waits while a builder holds the index lock to swap it
+        loaded = []
+        with index_lock(db_path + '.index'):
+            loader = threading.Thread(target=lambda: loaded.append(load_index(db_path + '.index', None, stale_ok=True)))
+            loader.start()
+            loader.join(0.2)
+            assert loader.is_alive() and not loaded, "Index loaded while a build held the lock"
+        loader.join(5)
+        assert loaded and loaded[0] is not None, "Index not loaded after the lock was released"
+        print("✓ Index loads wait for saves")
+        
+        print("Index cache tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Index cache test failed: {e}")
+        return False
+    
+    finally:
+        for suffix in ('', '-wal', '-shm', '.index.lock'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+        shutil.rmtree(db_path + '.index', ignore_errors=True)
+
+@contextmanager
+def serve_web_app(db_path, rebuild_factory=None):
+    """Point the web app at a test database and yield a Flask test client"""
+    saved = web_app.index_manager, web_app.result_cache
+    web_app.index_manager = IndexManager(lambda: SearchEngine(db_path), rebuild_factory)
+    web_app.result_cache = QueryCache(max_entries=1024, ttl=300)
+    try:
+        yield web_app.app.test_client()
+    finally:
+        web_app.index_manager.wait()
+        web_app.index_manager, web_app.result_cache = saved
+
+def test_admin_reindex():
+    """Test that /admin/reindex is disabled without a token and guarded with one"""
+    print("Running admin reindex tests...")
+    
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp_db:
+        db_path = tmp_db.name
+    admin_token = web_app.ADMIN_TOKEN
+    release = threading.Event()
+    
+    try:
+        setup_test_database(db_path)
+        
+        def rebuild():
+            release.wait(5)
+            return SearchEngine(db_path)
+        
+        with serve_web_app(db_path, rebuild) as client:
+            web_app.ADMIN_TOKEN = None
+            assert client.post('/admin/reindex').status_code == 403, "Rebuild started without a token configured"
+            assert client.get('/admin/reindex').status_code == 403, "Status served without a token configured"
+            print("✓ Admin endpoints disabled without a token")
+            
+            web_app.ADMIN_TOKEN = 'secret'
+            assert client.post('/admin/reindex').status_code == 403, "Rebuild started without a token"
+            assert client.post('/admin/reindex', headers={'X-Admin-Token': 'secreT'}).status_code == 403, \
+                "Rebuild started with a wrong token"
+            headers = {'X-Admin-Token': 'secret'}
+            response = client.post('/admin/reindex', headers=headers)
+            assert response.status_code == 202 and response.get_json()['state'] == 'building', \
+                f"Rebuild not started: {response.status_code}"
+            response = client.post('/admin/reindex', headers=headers)
+            assert response.status_code == 409 and response.get_json()['error'], "Second rebuild not refused"
+            release.set()
+            web_app.index_manager.wait()
+            status = client.get('/admin/reindex', headers=headers).get_json()
+            assert status['state'] == 'idle' and status['generation'] == 1 and status['documents'] == 3, \
+                f"Unexpected rebuild status: {status}"
+            print("✓ Rebuild started with the token, then refused while running")
+        
+        print("Admin reindex tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Admin reindex test failed: {e}")
+        return False
+    
+    finally:
+        release.set()
+        web_app.ADMIN_TOKEN = admin_token
+        for suffix in ('', '-wal', '-shm', '.index.lock'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+        shutil.rmtree(db_path + '.index', ignore_errors=True)
+
+def test_search_batch_api():
+    """Test /api/search/batch validation and results"""
+    print("Running batch search API tests...")
+    
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp_db:
+        db_path = tmp_db.name
+    
+    try:
+        setup_test_database(db_path)
+        
+        with serve_web_app(db_path) as client:
+            invalid = [
+                ["python"],
+                {'queries': "python"},
+                {'queries': ["python", 3]},
+                {'queries': ["python"] * (web_app.MAX_BATCH_QUERIES + 1)},
+                {'queries': ["python"], 'max_results': "abc"},
+                {'queries': ["python"], 'max_results': 0},
+                {'queries': ["python"], 'snippets': "false"},
+                {'queries': ["python"], 'snippets': 0},
+                {'queries': ["python"], 'ranking': "pagerank"},
+            ]
+            for body in invalid:
+                response = client.post('/api/search/batch', json=body)
+                assert response.status_code == 400 and response.get_json()['error'], f"Accepted {str(body)[:60]}"
+            print(f"✓ {len(invalid)} invalid batches rejected with 400")
+            
+            engine = web_app.index_manager.current()
+            queries = ["python programming", "web", "nonexistent xyz"]
+            for ranking in ('tfidf', 'bm25'):
+                response = client.post('/api/search/batch', json={'queries': queries, 'max_results': 2,
+                                                                  'ranking': ranking, 'snippets': False})
+                assert response.status_code == 200, f"Batch failed: {response.get_json()}"
+                batch = response.get_json()['results']
+                assert [entry['query'] for entry in batch] == queries, "Batch results out of order"
+                for entry, query in zip(batch, queries):
+                    expected = engine.search(query, max_results=2, snippets=False, ranking=ranking)
+                    assert [(r['url'], round(r['final_score'], 6)) for r in entry['results']] == \
+                        [(r['url'], round(r['final_score'], 6)) for r in expected], \
+                        f"Batched {ranking} results differ for {query!r}"
+                    assert entry['total_results'] == len(expected), "Wrong result count"
+            response = client.post('/api/search/batch', json={'queries': ["python web"]})
+            result = response.get_json()['results'][0]['results'][0]
+            assert result['content_snippet'] == engine.search("python web", max_results=1)[0]['content_snippet'], \
+                "Snippets differ from search()"
+            print("✓ Batch results match search()")
+        
+        print("Batch search API tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Batch search API test failed: {e}")
+        return False
+    
+    finally:
+        for suffix in ('', '-wal', '-shm', '.index.lock'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+        shutil.rmtree(db_path + '.index', ignore_errors=True)
+
+def test_search_pagination_api():
+    """Test cursor and page-number pagination through the web layer and its result cache"""
+    print("Running search pagination API tests...")
+    
+    try:
+        with temporary_database() as db_path:
+            # Enough hits to page past the cached best MAX_CACHED_HITS, with many tied scores
+            conn = sqlite3.connect(db_path)
+            conn.executemany('INSERT INTO pages (url, title, content) VALUES (?, ?, ?)',
+                             [(f"http://bulk.test/{i}", f"Bulk {i}", "python " * (i % 7 + 1) + f"filler{i}")
+                              for i in range(web_app.MAX_CACHED_HITS + 150)])
+            conn.commit()
+            conn.close()
+            
+            with serve_web_app(db_path) as client:
+                engine = web_app.index_manager.current()
+                hits = engine.rank_hits("python")
+                expected = [r['url'] for r in engine.page_results(hits, page_size=len(hits[0]))[0]]
+                assert len(expected) > web_app.MAX_CACHED_HITS, "Too few hits to cross the cached prefix"
+                
+                # Cursor pages cross from the cached hits into fully ranked ones
+                urls, cursor, pages = [], None, 0
+                while True:
+                    query = '/api/search?q=python&max_results=300' + (f'&cursor={cursor}' if cursor else '')
+                    response = client.get(query)
+                    assert response.status_code == 200, f"Page {pages} failed: {response.get_json()}"
+                    data = response.get_json()
+                    assert data['total_hits'] == len(expected), f"Wrong total hits: {data['total_hits']}"
+                    urls.extend(r['url'] for r in data['results'])
+                    pages += 1
+                    cursor = data['next_cursor']
+                    if cursor is None:
+                        break
+                assert urls == expected, "Cursor pages skipped, repeated or reordered hits"
+                print(f"✓ {pages} cursor pages walked {len(urls)} hits across the cached prefix")
+                
+                for cursor in ('!!!', 'abc', 'AAAA'):
+                    response = client.get(f'/api/search?q=python&cursor={cursor}')
+                    assert response.status_code == 400 and 'cursor' in response.get_json()['error'].lower(), \
+                        f"Invalid cursor {cursor!r} not rejected"
+                print("✓ Invalid cursors rejected with 400")
+                
+                for page in (1, 2, web_app.MAX_CACHED_HITS // 10 + 1, (len(expected) + 9) // 10):
+                    response = client.get(f'/search?q=python&page={page}')
+                    assert response.status_code == 200, f"Page {page} failed"
+                    shown = re.findall(r'class="result-url">([^<]*)<', response.get_data(as_text=True))
+                    assert shown == expected[(page - 1) * 10:page * 10], f"Wrong results on page {page}"
+                for page in ('abc', '0', '-2'):
+                    response = client.get(f'/search?q=python&page={page}')
+                    assert response.status_code == 200, f"Page {page!r} failed"
+                    shown = re.findall(r'class="result-url">([^<]*)<', response.get_data(as_text=True))
+                    assert shown == expected[:10], f"Page {page!r} did not fall back to page 1"
+                print("✓ Numbered pages match the ranked hits")
+                
+                # Pages of one query are served from one cache entry until the index changes
+                web_app.result_cache.clear()
+                before = web_app.result_cache.stats()
+                client.get('/api/search?q=python&max_results=10')
+                client.get('/search?q=python&page=3')
+                client.get('/api/search?q=Python!&max_results=10')
+                stats = client.get('/api/cache').get_json()
+                assert (stats['misses'] - before['misses'], stats['hits'] - before['hits']) == (1, 2), \
+                    f"Unexpected cache stats: {stats}"
+                engine.add_document("http://new.test/", "Python", "python " * 50)
+                first = client.get('/api/search?q=python&max_results=1').get_json()['results'][0]
+                assert first['url'] == "http://new.test/", "Cached results served after an index change"
+                print(f"✓ Result cache hit rate {stats['hit_rate']:.2f}, dropped on index change")
+        
+        print("Search pagination API tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Search pagination API test failed: {e}")
+        return False
+
+def test_incremental_indexing():
+    """Test that stored pages become searchable without a rebuild"""
+    print("Running incremental indexing tests...")
+    
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp_db:
+        db_path = tmp_db.name
+    
+    try:
+        setup_test_database(db_path)
+        engine = SearchEngine(db_path, use_index_cache=False, memtable_limit=2)
+        crawler = WebCrawler(db_path, indexer=engine)
+        
+        # A stored page is searchable immediately
+        crawler.store_page("http://test4.com", "Flask Python Tutorial",
+                           "Flask tutorial for Python web development with Flask.", [])
+        urls = [r['url'] for r in engine.search("flask tutorial", max_results=5)]
+        assert "http://test4.com" in urls, "New page not searchable"
+        print("✓ New page searchable without rebuild")
+        
+        # Replacing a page tombstones the old version
+        crawler.store_page("http://test4.com", "Gardening", "Roses need sunlight and water.", [])
+        urls = [r['url'] for r in engine.search("flask tutorial", max_results=5)]
+        assert "http://test4.com" not in urls, "Replaced page still matches old content"
+        print("✓ Replaced page tombstoned")
+        
+        # Flushes and merges keep results identical across strategies
+        for i in range(5):
+            crawler.store_page(f"http://extra{i}.com", "Python", "Python programming language guide.", [])
+        exhaustive = engine.search("python programming", max_results=5, retrieval='exhaustive')
+        pruned = engine.search("python programming", max_results=5, retrieval='maxscore')
+        assert [r['url'] for r in pruned] == [r['url'] for r in exhaustive], "Segments disagree across strategies"
+        print(f"✓ Searching across {len(engine.inverted_index.segments)} segments")
+        
+        # Queries do not wait for a merge running in the background
+        index = engine.inverted_index
+        index.wait_for_merges()
+        merge = index._merge
+        index._merge = lambda older, newer: (time.sleep(1.0), merge(older, newer))[1]
+        for i in range(2 * index.memtable_limit):
+            crawler.store_page(f"http://more{i}.com", "Python", "Python merge test page.", [])
+        start = time.time()
+        results = engine.search("python merge", max_results=5)
+        assert time.time() - start < 0.5 and results, "Search blocked by a segment merge"
+        index.wait_for_merges()
+        index._merge = merge
+        assert [r['url'] for r in engine.search("python merge", max_results=5)] == [r['url'] for r in results], \
+            "Results changed after the merge"
+        print("✓ Segments merged in the background")
+        
+        print("Incremental indexing tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Incremental indexing test failed: {e}")
+        return False
+    
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+def test_inverted_index():
+    """Test posting list compression and term-at-a-time scoring"""
+    print("Running inverted index tests...")
+    
+    try:
+        import numpy as np
+        from scipy import sparse
+        
+        # Variable-byte round trip across byte-length boundaries
+        values = np.array([0, 1, 127, 128, 16383, 16384, 2 ** 21, 2 ** 31 - 1])
+        assert (decode_gaps(encode_gaps(values)) == values).all(), "Gap encoding round trip failed"
+        print("✓ Posting list compression round trip")
+        
+        # Scores over posting lists match the full matrix product
+        matrix = sparse.random(500, 50, density=0.05, random_state=0, format='csr')
+        index = InvertedIndex.from_matrix(matrix)
+        term_ids = np.array([1, 7, 30])
+        query_weights = np.array([0.5, 0.25, 1.0])
+        doc_ids, scores = index.score(term_ids, query_weights)
+        expected = matrix[:, term_ids] @ query_weights
+        assert (doc_ids == np.flatnonzero(expected)).all(), "Wrong candidate documents"
+        assert np.allclose(scores, expected[doc_ids], rtol=1e-6), "Wrong candidate scores"
+        print(f"✓ Term-at-a-time scoring matches matrix product ({len(doc_ids)} candidates)")
+        
+        # MaxScore top-k returns the same best scores as exhaustive scoring
+        for k in (1, 5, 20):
+            top_ids, top_scores = index.top_k(term_ids, query_weights, k)
+            best = np.sort(scores)[::-1][:k]
+            assert np.allclose(top_scores, best), f"MaxScore top-{k} differs from exhaustive"
+        doc_weights = np.random.default_rng(0).uniform(0.2, 8.0, 500)
+        weighted = np.lexsort((doc_ids, -scores * doc_weights[doc_ids]))[:20]
+        top_ids, _ = index.top_k(term_ids, query_weights, 20, doc_weights)
+        assert (top_ids == doc_ids[weighted]).all(), "Weighted MaxScore top-k differs from exhaustive"
+        print("✓ MaxScore top-k matches exhaustive scoring")
+        
+        print("Inverted index tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Inverted index test failed: {e}")
+        return False
 
 def test_crawler():
     """Test basic crawler functionality"""
@@ -108,6 +914,18 @@ def test_crawler():
         assert result is not None, "Database table not created"
         print("✓ Crawler database setup successful")
         
+        # A single parse returns title, text, keywords and outlinks with every parser
+        html = (b'<html><head><title>Test Page</title><meta name="keywords" content="a, b">'
+                b'<script>var hidden = 1;</script></head>'
+                b'<body><p>Visible text</p><a href="/next">Next</a><a href="mailto:x@y.z">Mail</a></body></html>')
+        for parser in ('lxml', 'html.parser'):
+            title, content, keywords, links = WebCrawler(db_path, parser=parser).parse_page(html, 'http://test.com/page')
+            assert title == 'Test Page', f"Wrong title with {parser}"
+            assert 'Visible text' in content and 'hidden' not in content, f"Wrong text with {parser}"
+            assert keywords == ['a', 'b'], f"Wrong keywords with {parser}"
+            assert links == ['http://test.com/next'], f"Wrong links with {parser}"
+        print("✓ Page parsed in one pass with lxml and html.parser")
+        
         print("Crawler tests passed! ✅")
         return True
         
@@ -116,8 +934,526 @@ def test_crawler():
         return False
     
     finally:
-        if os.path.exists(db_path):
-            os.unlink(db_path)
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+def test_query_cache():
+    """Test LRU eviction, expiry and invalidation of cached results"""
+    print("Running query cache tests...")
+    
+    try:
+        cache = QueryCache(max_entries=2, ttl=60)
+        cache.sync(1)
+        cache.put('a', [1])
+        cache.put('b', [2])
+        assert cache.get('a') == [1], "Cached value not returned"
+        cache.put('c', [3])
+        assert cache.get('b') is None and cache.get('a') == [1], "Least recently used entry not evicted"
+        print("✓ Least recently used entry evicted")
+        
+        cache.sync(2)
+        assert cache.get('a') is None, "Cache not invalidated on index change"
+        cache.ttl = 0
+        cache.put('d', [4])
+        assert cache.get('d') is None, "Expired entry returned"
+        print("✓ Entries dropped on index change and expiry")
+        
+        # A request on the old generation finishes after the new one synced the cache
+        cache.ttl = 60
+        cache.sync(3)
+        cache.put('e', ['old hits'], version=2)
+        assert cache.get('e', version=3) is None, "Old generation's results stored in the new one"
+        cache.put('e', ['new hits'], version=3)
+        assert cache.get('e', version=2) is None, "New generation's results served to the old one"
+        assert cache.get('e', version=3) == ['new hits'], "Current version's results not cached"
+        print("✓ Results of another index version neither stored nor served")
+        
+        stats = cache.stats()
+        assert stats['hits'] == 3 and stats['misses'] == 5 and stats['evictions'] == 1, f"Wrong counters: {stats}"
+        print(f"✓ {stats['hits']} hits, {stats['misses']} misses")
+        
+        print("Query cache tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Query cache test failed: {e}")
+        return False
+
+def test_page_writer():
+    """Test batched page storage"""
+    print("Running page writer tests...")
+    
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp_db:
+        db_path = tmp_db.name
+    
+    try:
+        WebCrawler(db_path).setup_database()
+        writer = PageWriter(db_path, batch_size=50)
+        for i in range(120):
+            writer.put(f"http://page{i}.com", f"Page {i}", "Some content", "")
+        writer.put("http://page0.com", "Page 0 again", "Replaced content", "")
+        writer.flush()
+        
+        conn = sqlite3.connect(db_path)
+        count = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        title = conn.execute("SELECT title FROM pages WHERE url = 'http://page0.com'").fetchone()[0]
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        conn.close()
+        assert count == 120 and title == "Page 0 again", "Batched rows not written correctly"
+        assert journal_mode == 'wal', "WAL mode not enabled"
+        
+        writer.close()
+        stats = writer.stats()
+        assert stats['rows'] == 121 and stats['batches'] < 121, "Rows were not batched"
+        print(f"✓ {stats['rows']} rows written in {stats['batches']} transactions")
+        
+        # A writer that cannot connect or write a page still lets flush() and close() return, with the error
+        for writer in (PageWriter(db_path), PageWriter(os.path.join(db_path + '-missing', 'pages.db'))):
+            outcomes = []
+        
+            def finish():
+                bad_page = ("http://bad.com", "Bad", "Outlinks of the wrong type", "")
+                for step in (lambda: writer.put(*bad_page, links=5), writer.flush, writer.close):
+                    try:
+                        step()
+                        outcomes.append(None)
+                    except RuntimeError as e:
+                        outcomes.append(e)
+        
+            finisher = threading.Thread(target=finish, daemon=True)
+            finisher.start()
+            finisher.join(timeout=10)
+            assert not finisher.is_alive(), "flush() or close() hung after the writer failed"
+            # put() raises too once the failure has happened
+            assert len(outcomes) == 3 and all(outcomes[1:]), f"Writer failure not reported: {outcomes}"
+        print("✓ Writer failures reported by flush() and close()")
+
+        print("Page writer tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Page writer test failed: {e}")
+        return False
+    
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+def test_frontier():
+    """Test URL normalization, deduplication and spilling to disk"""
+    print("Running frontier tests...")
+    
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp_db:
+        db_path = tmp_db.name
+    
+    try:
+        assert normalize_url("HTTP://Example.COM:80/a#top") == "http://example.com/a", "URL not normalized"
+        assert normalize_url("https://example.com") == "https://example.com/", "Empty path not normalized"
+        
+        frontier = Frontier(max_memory_urls=10, spill_path=db_path)
+        assert frontier.push("http://example.com/0")
+        assert not frontier.push("http://EXAMPLE.com/0#section"), "Duplicate URL queued"
+        for i in range(1, 2500):
+            frontier.push(f"http://example.com/{i}")
+        popped = []
+        while True:
+            url = frontier.pop()
+            if url is None:
+                break
+            popped.append(url)
+        frontier.close()
+        assert popped == [f"http://example.com/{i}" for i in range(2500)], "Spilled URLs out of order"
+        print("✓ Frontier deduplicates and keeps FIFO order across spills")
+        
+        seen = VisitedSet(max_memory_urls=1000, spill_path=db_path, expected_urls=100000)
+        urls = [f"http://site{i}.com/page" for i in range(10000)]
+        for url in urls:
+            seen.add(url)
+        assert seen.bloom is not None, "Visited set did not spill"
+        assert all(url in seen for url in urls), "Spilled URL not found"
+        assert sum(f"http://other{i}.com/" in seen for i in range(10000)) == 0, "Unseen URL reported as seen"
+        seen.close()
+        print("✓ Visited set spills fingerprints to disk")
+        
+        # A crawl stopped without a checkpoint right after a spill loses no queued URL
+        frontier = Frontier(max_memory_urls=10, spill_path=db_path,
+                            seen=VisitedSet(max_memory_urls=100, spill_path=db_path))
+        frontier.reset()
+        urls = [f"http://spill.test/{i}" for i in range(VisitedSet.MERGE_SIZE)]
+        for url in urls:
+            frontier.push(url)
+        assert frontier.seen.bloom is not None, "Visited set did not spill"
+        frontier.conn.close()
+        frontier.seen.close()
+        resumed = Frontier(max_memory_urls=10, spill_path=db_path,
+                           seen=VisitedSet(max_memory_urls=100, spill_path=db_path), resume=True)
+        popped = []
+        while True:
+            url = resumed.pop()
+            if url is None:
+                break
+            popped.append(url)
+        resumed.close()
+        assert popped == urls, f"Resume after a spill lost {len(set(urls) - set(popped))} queued URLs"
+        print("✓ Queued URLs saved before their fingerprints spill")
+        
+        # A URL finished after the checkpoint's snapshot stays queued until the next one
+        frontier = Frontier(spill_path=db_path)
+        frontier.reset()
+        frontier.push("http://done.test/a")
+        frontier.push("http://done.test/b")
+        frontier.done(frontier.pop())
+        finished = frontier.take_finished()
+        frontier.done(frontier.pop())  # Its page may not be committed yet
+        frontier.checkpoint(finished)
+        frontier.conn.close()
+        frontier.seen.close()
+        resumed = Frontier(spill_path=db_path, resume=True)
+        assert resumed.pop() == "http://done.test/b" and resumed.pop() is None, \
+            "URL finished after the snapshot removed from the saved queue"
+        resumed.close()
+        print("✓ Checkpoints only save URLs finished before the page flush")
+        
+        print("Frontier tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Frontier test failed: {e}")
+        return False
+    
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+def start_test_server():
+    """Serve linked HTML pages locally, recording request times per host"""
+    request_times = defaultdict(list)
+    
+    class PageHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        
+        def do_GET(self):
+            request_times[self.headers['Host']].append(time.monotonic())
+            page = int(self.path.strip('/') or 0)
+            etag = f'"page-{page}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            port = self.server.server_address[1]
+            links = ''.join(f'<a href="http://{host}:{port}/{(page * 2 + i) % 20}">next</a>'
+                            for i, host in enumerate(['127.0.0.1', 'localhost']))
+            body = f'<html><title>Page {page}</title><body>Test page {page} {links}</body></html>'.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, request_times
+
+def test_async_crawler():
+    """Test the concurrent crawler against a local HTTP server"""
+    print("Running async crawler tests...")
+    
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp_db:
+        db_path = tmp_db.name
+    server, request_times = start_test_server()
+    
+    try:
+        port = server.server_address[1]
+        delay = 0.05
+        start_urls = [f'http://127.0.0.1:{port}/0', f'http://localhost:{port}/1']
+        
+        # Both start pages are fetched at once but only one is kept; the other
+        # stays queued for a resumed crawl. Checkpoints run after every page.
+        WebCrawler(db_path, checkpoint_interval=0).crawl_async(start_urls, max_pages=1, delay=delay, concurrency=4)
+        conn = sqlite3.connect(db_path)
+        stored = {url for url, in conn.execute("SELECT url FROM pages")}
+        left = {url for url, in conn.execute("SELECT url FROM crawl_frontier")}
+        conn.close()
+        assert sum(len(times) for times in request_times.values()) == 2, "Start pages not fetched together"
+        dropped = {normalize_url(url) for url in start_urls} - {normalize_url(url) for url in stored}
+        assert len(dropped) == 1 and dropped <= left, "Page fetched past max_pages not left in the saved queue"
+        WebCrawler(db_path, resume=True).crawl_async([], max_pages=2, delay=delay, concurrency=4)
+        conn = sqlite3.connect(db_path)
+        stored = {normalize_url(url) for url, in conn.execute("SELECT url FROM pages")}
+        conn.close()
+        assert dropped <= stored, "Page fetched past max_pages not crawled on resume"
+        print("✓ Pages fetched past max_pages crawled on resume")
+        os.unlink(db_path)
+        request_times.clear()
+        
+        # Frontier calls may touch disk, so none of them run on the event loop's thread
+        loop_calls = []
+        originals = {name: getattr(Frontier, name) for name in ('push', 'pop', 'done', 'set_host_time')}
+        
+        def recorded(name, method):
+            def call(*args):
+                if threading.current_thread() is threading.main_thread():
+                    loop_calls.append(name)
+                return method(*args)
+            return call
+        
+        for name, method in originals.items():
+            setattr(Frontier, name, recorded(name, method))
+        try:
+            crawler = WebCrawler(db_path, checkpoint_interval=0)
+            pages = crawler.crawl_async(start_urls, max_pages=12, delay=delay, concurrency=4)
+        finally:
+            for name, method in originals.items():
+                setattr(Frontier, name, method)
+        assert not loop_calls, f"Frontier called on the event loop: {sorted(set(loop_calls))}"
+        print("✓ Frontier kept off the event loop")
+        
+        conn = sqlite3.connect(db_path)
+        stored = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        conn.close()
+        assert pages == 12 and stored == 12, f"Expected 12 pages, crawled {pages} and stored {stored}"
+        print(f"✓ Crawled {pages} pages concurrently")
+        
+        # Both hosts were used and each one respected its own delay
+        assert len(request_times) == 2, "Crawl did not spread across hosts"
+        for host, times in request_times.items():
+            gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+            assert all(gap >= delay for gap in gaps), f"Per-host delay violated for {host}"
+        print("✓ Per-host delay respected")
+        
+        print("Async crawler tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Async crawler test failed: {e}")
+        return False
+    
+    finally:
+        server.shutdown()
+        server.server_close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+def test_resumable_crawl():
+    """Test resuming a stopped crawl and refreshing unchanged pages"""
+    print("Running resumable crawl tests...")
+    
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp_db:
+        db_path = tmp_db.name
+    server, request_times = start_test_server()
+    
+    try:
+        port = server.server_address[1]
+        WebCrawler(db_path).crawl([f'http://127.0.0.1:{port}/0'], max_pages=5, delay=0)
+        
+        # Creating a crawler without resume=True keeps the saved queue until it crawls
+        WebCrawler(db_path)
+        conn = sqlite3.connect(db_path)
+        queued = conn.execute("SELECT COUNT(*) FROM crawl_frontier").fetchone()[0]
+        conn.close()
+        assert queued > 0, "Saved queue cleared by creating a crawler"
+        
+        # A new crawler picks up the saved queue without re-fetching anything
+        WebCrawler(db_path, resume=True).crawl([], max_pages=100, delay=0)
+        conn = sqlite3.connect(db_path)
+        stored = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        conn.close()
+        fetched = sum(len(times) for times in request_times.values())
+        assert stored == 20 and fetched == 20, f"Expected 20 pages, stored {stored} in {fetched} requests"
+        print(f"✓ Resumed crawl stored {stored} pages with no repeated requests")
+        
+        changed, unchanged, failed = WebCrawler(db_path).refresh(delay=0)
+        assert (changed, unchanged, failed) == (0, 20, 0), "Unchanged pages were re-fetched"
+        print("✓ Refresh skipped unchanged pages")
+        
+        print("Resumable crawl tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Resumable crawl test failed: {e}")
+        return False
+    
+    finally:
+        server.shutdown()
+        server.server_close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+
+def test_pagerank():
+    """Test link storage and PageRank over the crawled link graph"""
+    print("Running PageRank tests...")
+    
+    with tempfile.NamedTemporaryFile(suffix='.db', delete=False) as tmp_db:
+        db_path = tmp_db.name
+    
+    try:
+        import numpy as np
+        
+        # a, b and c link to hub; hub links back to a; d has no outlinks
+        graph = {
+            'http://site.test/a': ['http://site.test/hub', 'http://site.test/b', 'http://other.test/'],
+            'http://site.test/b': ['http://SITE.test/hub#top', 'http://site.test/b'],
+            'http://site.test/c': ['http://site.test/hub'],
+            'http://site.test/hub': ['http://site.test/a'],
+            'http://site.test/d': [],
+        }
+        crawler = WebCrawler(db_path)
+        crawler.store_page('http://site.test/a', 'A', 'page a', [], links=['http://site.test/c'])
+        crawler.start_writer()
+        for url, links in graph.items():
+            crawler.store_page(url, url, f"page {url}", [], links=links)
+        crawler.stop_writer()
+        
+        conn = sqlite3.connect(db_path)
+        edges = sorted(conn.execute("SELECT source, target FROM links"))
+        conn.close()
+        assert ('http://site.test/a', 'http://site.test/c') not in edges, "Old outlinks not replaced"
+        assert ('http://site.test/b', 'http://site.test/hub') in edges, "Link not normalized"
+        assert ('http://site.test/b', 'http://site.test/b') not in edges, "Self-link stored"
+        print(f"✓ {len(edges)} links stored")
+        
+        SearchEngine(db_path)  # Saves an index with the priors before PageRank
+        stats = compute_page_ranks(db_path)
+        ranks = dict(load_page_ranks(db_path))
+        assert stats['converged'] and stats['links'] == 5, f"Unexpected PageRank run: {stats}"
+        
+        # Dense reference: rank = d * M @ rank + (1 - d) / n, dangling pages linking everywhere
+        urls = list(graph)
+        n = len(urls)
+        M = np.zeros((n, n))
+        for j, url in enumerate(urls):
+            targets = [urls.index(t) for t in ['http://site.test/hub', 'http://site.test/b', 'http://site.test/a']
+                       if (url, t) in edges]
+            for i in targets or range(n):
+                M[i, j] = 1.0 / (len(targets) or n)
+        expected = np.linalg.solve(np.eye(n) - 0.85 * M, np.full(n, 0.15 / n))
+        assert np.allclose([ranks[url] for url in urls], expected, atol=1e-6), "PageRank differs from reference"
+        assert max(ranks, key=ranks.get) == 'http://site.test/hub', "Hub page not ranked highest"
+        print("✓ PageRank matches the dense solution")
+        
+        engine = SearchEngine(db_path, use_index_cache=False)
+        hub, leaf = engine.url_to_doc['http://site.test/hub'], engine.url_to_doc['http://site.test/d']
+        assert engine.priors[hub] > engine.priors[leaf], "PageRank not used in priors"
+        assert not SearchEngine(db_path).index_loaded_from_cache, "Index saved before PageRank not stale"
+        assert np.allclose(SearchEngine(db_path, shared=True).priors, engine.priors), "Shared priors out of date"
+        print("✓ PageRank loaded into document priors")
+        
+        print("PageRank tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"PageRank test failed: {e}")
+        return False
+    
+    finally:
+        for suffix in ('', '-wal', '-shm', '.index.lock'):
+            if os.path.exists(db_path + suffix):
+                os.unlink(db_path + suffix)
+        shutil.rmtree(db_path + '.index', ignore_errors=True)
+
+def test_admission_control():
+    """Test admission control and timeouts of the production server"""
+    print("Running admission control tests...")
+    
+    def app(environ, start_response):
+        if environ['PATH_INFO'] == '/slow':
+            time.sleep(float(environ['QUERY_STRING']))
+        body = environ['wsgi.input'].read() + environ['QUERY_STRING'].encode()
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [body]
+    
+    def get(path, method='GET', body=None):
+        conn = HTTPConnection('127.0.0.1', server.effective_port, timeout=5)
+        try:
+            conn.request(method, path, body=body)
+            response = conn.getresponse()
+            return response.status, response.read()
+        finally:
+            conn.close()
+    
+    admission = AdmissionControl(app, workers=1, max_pending=1, timeout=1.0)
+    server = create_server(admission, port=0)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    
+    try:
+        assert get('/echo?q=1', 'POST', b'body:') == (200, b'body:q=1'), "Request not passed to the app"
+        print("✓ Requests served through the thread pool")
+        
+        # One request running and one waiting fill the server; a third is turned away
+        statuses = {}
+        
+        def fetch(i):
+            statuses[i] = get('/slow?0.3')[0]
+        
+        threads = [threading.Thread(target=fetch, args=(i,)) for i in range(3)]
+        for t in threads:
+            t.start()
+            time.sleep(0.05)
+        for t in threads:
+            t.join()
+        assert [statuses[i] for i in range(3)] == [200, 200, 503], f"Unexpected statuses: {statuses}"
+        print("✓ Overload answered with 503")
+        
+        assert get('/slow?1.5')[0] == 503, "Slow request not timed out"
+        assert admission.active == 1, "Timed-out request released its worker early"
+        time.sleep(0.7)
+        assert admission.active == 0, "Worker not released after the request finished"
+        assert admission.stats()['timed_out'] == 1 and admission.stats()['rejected'] == 1
+        print("✓ Slow request timed out with 503")
+        
+        print("Admission control tests passed! ✅")
+        return True
+        
+    except Exception as e:
+        print(f"Admission control test failed: {e}")
+        return False
+    
+    finally:
+        server.close()
+        admission.shutdown()
+        thread.join(5)
+
+# Run by main() in this order
+TESTS = (
+    test_crawler,
+    test_async_crawler,
+    test_frontier,
+    test_resumable_crawl,
+    test_pagerank,
+    test_admission_control,
+    test_page_writer,
+    test_query_cache,
+    test_search_engine,
+    test_url_priors,
+    test_maxscore_retrieval,
+    test_spelling_suggestions,
+    test_parallel_preprocessing,
+    test_fast_analyzer,
+    test_document_store,
+    test_snippets,
+    test_bm25_ranking,
+    test_search_batch,
+    test_cursor_pagination,
+    test_search_budget,
+    test_autocomplete,
+    test_index_cache,
+    test_admin_reindex,
+    test_search_batch_api,
+    test_search_pagination_api,
+    test_inverted_index,
+    test_incremental_indexing,
+)
 
 def main():
     """Run all tests"""
@@ -125,18 +1461,11 @@ def main():
     print("=" * 40)
     
     all_passed = True
+    for test in TESTS:
+        if not test():
+            all_passed = False
+        print()
     
-    # Test crawler
-    if not test_crawler():
-        all_passed = False
-    
-    print()
-    
-    # Test search engine
-    if not test_search_engine():
-        all_passed = False
-    
-    print()
     print("=" * 40)
     
     if all_passed:
@@ -1,14 +1,85 @@
 from flask import Flask, render_template, request, jsonify
-from search_engine import SearchEngine
+from search_engine import RANKINGS, SearchEngine
+from index_manager import IndexManager
+from index_store import default_index_path
+from query_cache import QueryCache
+import hmac
 import os
 
 app = Flask(__name__)
-search_engine = None
+
+DB_PATH = os.path.join(os.path.dirname(__file__), 'database.db')
+
+# With several worker processes, PYSEARCH_SHARED_INDEX=1 makes them all
+# memory-map one saved index instead of each loading its own copy
+SHARED_INDEX = os.environ.get('PYSEARCH_SHARED_INDEX') == '1'
+
+# /admin endpoints are disabled unless this is set; requests must pass it
+# in the X-Admin-Token header
+ADMIN_TOKEN = os.environ.get('PYSEARCH_ADMIN_TOKEN')
+
+# Processes preprocessing documents when the server builds the index; 0 uses
+# every core. One by default, so a rebuild leaves cores for serving.
+INDEX_WORKERS = int(os.environ.get('PYSEARCH_INDEX_WORKERS', '1')) or None
+
+def make_search_engine():
+    return SearchEngine(DB_PATH, workers=INDEX_WORKERS, shared=SHARED_INDEX)
+
+def rebuild_search_engine():
+    """Build (or reuse, if the corpus is unchanged) and save the index, then serve it"""
+    engine = SearchEngine(DB_PATH, workers=INDEX_WORKERS)
+    # Shared workers serve the saved index through mmap, not this private copy
+    return SearchEngine(DB_PATH, shared=True) if SHARED_INDEX else engine
+
+# Serving engine; rebuilt generations are swapped in without a restart.
+# Shared-index workers also pick up an index saved by any other process.
+index_manager = IndexManager(make_search_engine, rebuild_search_engine,
+                             index_path=default_index_path(DB_PATH) if SHARED_INDEX else None)
+
+# Ranked results of recent queries, so paging and popular queries skip scoring
+result_cache = QueryCache(max_entries=1024, ttl=300)
+
+# Largest number of queries accepted by /api/search/batch
+MAX_BATCH_QUERIES = 1000
+
+# Best hits of a query kept in the result cache; deeper pages rank them all
+MAX_CACHED_HITS = 1000
 
 def initialize_search_engine():
-    global search_engine
-    db_path = os.path.join(os.path.dirname(__file__), 'database.db')
-    search_engine = SearchEngine(db_path)
+    return index_manager.current()
+
+def cached_hits(engine, query, ranking='tfidf'):
+    """engine.rank_hits() of the best MAX_CACHED_HITS hits, through the result cache
+    
+    Queries that preprocess to the same terms share an entry, and pages
+    within it are sliced from it.
+    """
+    # A new generation restarts index_version, so key the cache on both
+    version = (engine.generation, engine.index_version)
+    result_cache.sync(version)
+    key = (engine.preprocess_text(query), ranking)
+    # Requests still on an older generation may sync the cache back and forth,
+    # so every lookup and store is checked against the cache's current version
+    hits = result_cache.get(key, version)
+    if hits is None:
+        hits = engine.rank_hits(query, ranking=ranking, limit=MAX_CACHED_HITS)
+        # Do not cache hits that raced with an index update
+        if (engine.generation, engine.index_version) == version:
+            result_cache.put(key, hits, version)
+    return hits
+
+def search_page(engine, query, page_size, cursor=None, offset=0, ranking='tfidf'):
+    """One page of results without snippets, the next page's cursor and the total hit count
+    
+    Snippets depend on the exact wording, so callers add them with
+    engine.add_snippets.
+    """
+    hits = cached_hits(engine, query, ranking)
+    if not engine.covers_page(hits, page_size, cursor, offset):
+        # Past the cached hits: rank every hit for this page only
+        hits = engine.rank_hits(query, ranking=ranking)
+    results, next_cursor = engine.page_results(hits, page_size, cursor, offset)
+    return results, next_cursor, hits[3]
 
 @app.route('/')
 def home():
@@ -17,24 +88,25 @@ def home():
 @app.route('/search')
 def search():
     query = request.args.get('q', '').strip()
-    page = int(request.args.get('page', 1))
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    ranking = request.args.get('ranking', 'tfidf')
+    if ranking not in RANKINGS:
+        ranking = 'tfidf'
     results_per_page = 10
     
     if not query:
         return render_template('search.html', query='', results=[], total_results=0)
     
-    # Initialize search engine if not already done
-    if search_engine is None:
-        initialize_search_engine()
-    
-    # Perform search
-    all_results = search_engine.search(query, max_results=100)
-    total_results = len(all_results)
+    # Requests hold on to one generation even if a rebuild swaps it meanwhile
+    engine = index_manager.current()
     
-    # Pagination
-    start_idx = (page - 1) * results_per_page
-    end_idx = start_idx + results_per_page
-    results = all_results[start_idx:end_idx]
+    # Perform search; pages are slices of the same cached ranked hits
+    results, _, total_results = search_page(engine, query, results_per_page,
+                                            offset=(page - 1) * results_per_page, ranking=ranking)
+    results = engine.add_snippets(results, query)
     
     # Calculate pagination info
     total_pages = (total_results + results_per_page - 1) // results_per_page
@@ -44,7 +116,7 @@ def search():
     # Get spelling suggestions if no results
     suggestions = []
     if total_results == 0:
-        suggestions = search_engine.suggest_spelling(query)
+        suggestions = engine.suggest_spelling(query)
     
     return render_template('search.html', 
                          query=query,
@@ -59,23 +131,78 @@ def search():
 @app.route('/api/search')
 def api_search():
     query = request.args.get('q', '').strip()
-    max_results = int(request.args.get('max_results', 10))
+    try:
+        max_results = int(request.args.get('max_results', 10))
+    except ValueError:
+        return jsonify({'error': 'max_results must be an integer'}), 400
+    # next_cursor of the previous page, to continue after it
+    cursor = request.args.get('cursor')
+    # Return highlight offsets instead of marking the snippet text
+    offsets = request.args.get('highlight') == 'offsets'
+    ranking = request.args.get('ranking', 'tfidf')
     
     if not query:
         return jsonify({'error': 'Query parameter is required'}), 400
+    if max_results < 1:
+        return jsonify({'error': 'max_results must be at least 1'}), 400
+    if ranking not in RANKINGS:
+        return jsonify({'error': f"ranking must be one of: {', '.join(RANKINGS)}"}), 400
     
-    # Initialize search engine if not already done
-    if search_engine is None:
-        initialize_search_engine()
+    engine = index_manager.current()
     
-    results = search_engine.search(query, max_results=max_results)
+    try:
+        results, next_cursor, total_hits = search_page(engine, query, max_results, cursor, ranking=ranking)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    results = engine.add_snippets(results, query, offsets)
     
     return jsonify({
         'query': query,
         'total_results': len(results),
+        'total_hits': total_hits,
+        'next_cursor': next_cursor,
         'results': results
     })
 
+@app.route('/api/search/batch', methods=['POST'])
+def api_search_batch():
+    """Run many queries in one request: {"queries": [...], "max_results": 10, ...}"""
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body, dict):
+        return jsonify({'error': 'JSON body must be an object'}), 400
+    queries = body.get('queries')
+    try:
+        max_results = int(body.get('max_results', 10))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_results must be an integer'}), 400
+    ranking = body.get('ranking', 'tfidf')
+    snippets = body.get('snippets', True)
+    offsets = body.get('highlight') == 'offsets'
+    
+    if not isinstance(queries, list) or not all(isinstance(query, str) for query in queries):
+        return jsonify({'error': 'JSON body must contain a list of query strings in "queries"'}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({'error': f'At most {MAX_BATCH_QUERIES} queries per batch'}), 400
+    if max_results < 1:
+        return jsonify({'error': 'max_results must be at least 1'}), 400
+    if not isinstance(snippets, bool):
+        return jsonify({'error': 'snippets must be true or false'}), 400
+    if not isinstance(ranking, str) or ranking not in RANKINGS:
+        return jsonify({'error': f"ranking must be one of: {', '.join(RANKINGS)}"}), 400
+    
+    engine = index_manager.current()
+    
+    # Bulk traffic goes straight to the engine instead of filling the result cache
+    batch = engine.search_batch([query.strip() for query in queries], max_results,
+                                snippets=snippets, highlight_offsets=offsets, ranking=ranking)
+    
+    return jsonify({
+        'results': [
+            {'query': query, 'total_results': len(results), 'results': results}
+            for query, results in zip(queries, batch)
+        ]
+    })
+
 @app.route('/api/suggest')
 def api_suggest():
     query = request.args.get('q', '').strip()
@@ -83,13 +210,50 @@ def api_suggest():
     if not query:
         return jsonify({'suggestions': []})
     
-    if search_engine is None:
-        initialize_search_engine()
+    engine = index_manager.current()
     
-    suggestions = search_engine.suggest_spelling(query)
+    suggestions = engine.suggest_spelling(query)
     
     return jsonify({'suggestions': suggestions})
 
+@app.route('/api/complete')
+def api_complete():
+    query = request.args.get('q', '')
+    try:
+        limit = int(request.args.get('limit', 10))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    if limit < 1:
+        return jsonify({'error': 'limit must be at least 1'}), 400
+    limit = min(limit, 10)
+    
+    if not query.strip():
+        return jsonify({'completions': []})
+    
+    engine = index_manager.current()
+    
+    return jsonify({'completions': engine.complete(query, limit)})
+
+@app.route('/api/cache')
+def api_cache():
+    return jsonify(result_cache.stats())
+
+@app.route('/admin/reindex', methods=['GET', 'POST'])
+def admin_reindex():
+    """POST starts a background index rebuild; GET reports its status"""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Admin endpoints are disabled; set PYSEARCH_ADMIN_TOKEN to enable them'}), 403
+    token = request.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return jsonify({'error': 'Invalid admin token'}), 403
+    
+    if request.method == 'GET':
+        return jsonify(index_manager.status())
+    
+    if not index_manager.rebuild():
+        return jsonify(dict(index_manager.status(), error='A rebuild is already running')), 409
+    return jsonify(index_manager.status()), 202
+
 if __name__ == '__main__':
     # Create templates directory if it doesn't exist
     templates_dir = os.path.join(os.path.dirname(__file__), 'templates')